@@ -0,0 +1,63 @@
+"""
+Конкурентные проверки blacklist: одиночные EXISTS vs склеенный pipeline.
+
+    python -m benchmarks.bench_blacklist_batching --concurrency 500 --rounds 20
+"""
+import asyncio
+import time
+import uuid
+from unittest.mock import patch
+
+from benchmarks.utils import base_parser, make_redis, percentiles, print_table
+from common import redis_config
+from common.redis_batcher import CommandBatcher
+from common.revocation_filter import RevocationFilter
+
+
+async def run(batcher: CommandBatcher, concurrency: int, rounds: int):
+    samples = []
+
+    async def one():
+        jti = str(uuid.uuid4())
+        started = time.perf_counter()
+        await redis_config.is_token_blacklisted(jti)
+        samples.append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    with patch.object(redis_config, "lookup_batcher", batcher):
+        for _ in range(rounds):
+            await asyncio.gather(*(one() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+    return samples, elapsed
+
+
+async def main(args):
+    client = make_redis(args.fake)
+    modes = [
+        ("single EXISTS", CommandBatcher(lambda: client, window_ms=0, max_batch=1)),
+        ("batched, next tick", CommandBatcher(lambda: client, window_ms=0, max_batch=args.max_batch)),
+        (f"batched, {args.window_ms} ms", CommandBatcher(lambda: client, window_ms=args.window_ms, max_batch=args.max_batch)),
+    ]
+
+    rows = []
+    # Фильтр выключен, чтобы каждая проверка действительно шла в Redis
+    with patch.object(redis_config, "revocation_filter", RevocationFilter(enabled=False)):
+        for name, batcher in modes:
+            samples, elapsed = await run(batcher, args.concurrency, args.rounds)
+            rows.append({
+                "mode": name,
+                "lookups/s": int(len(samples) / elapsed),
+                **percentiles(samples),
+            })
+
+    print_table(rows)
+    await client.aclose()
+
+
+if __name__ == "__main__":
+    parser = base_parser(__doc__)
+    parser.add_argument("--concurrency", type=int, default=500)
+    parser.add_argument("--rounds", type=int, default=20)
+    parser.add_argument("--window-ms", type=float, default=0.5)
+    parser.add_argument("--max-batch", type=int, default=128)
+    asyncio.run(main(parser.parse_args()))
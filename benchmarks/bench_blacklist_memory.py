@@ -0,0 +1,77 @@
+"""
+Память Redis на отозванный токен: blacklist:{jti} vs бакеты по времени истечения.
+
+    python -m benchmarks.bench_blacklist_memory --revocations 1000000 --db 15
+
+ВНИМАНИЕ: перед каждым режимом выполняется FLUSHDB в базе --db.
+"""
+import asyncio
+import os
+import time
+import uuid
+from unittest.mock import patch
+
+from benchmarks.utils import base_parser, make_redis, print_table
+from common import blacklist_storage as storage
+
+
+async def used_memory(client) -> int:
+    try:
+        return int((await client.info("memory"))["used_memory"])
+    except Exception:
+        return 0
+
+
+async def fill(client, mode: str, revocations: int, batch: int):
+    now = time.time()
+    with patch.object(storage, "BLACKLIST_STORAGE", mode):
+        for start in range(0, revocations, batch):
+            async with client.pipeline(transaction=False) as pipe:
+                for i in range(start, min(start + batch, revocations)):
+                    jti = str(uuid.uuid4())
+                    # Смесь access (до 30 мин) и refresh (до 7 дней) токенов
+                    ttl = 60 + (i * 7919) % (1800 if i % 4 else 7 * 86400)
+                    exp = now + ttl
+                    if mode == "buckets":
+                        key = storage.bucket_key(exp)
+                        pipe.hset(key, storage.encode_jti(jti), "1")
+                        pipe.expireat(key, storage.bucket_expire_at(exp))
+                    else:
+                        pipe.set(storage.legacy_key(jti), "true", ex=ttl)
+                await pipe.execute()
+
+
+async def main(args):
+    # Отдельная база: бенчмарк очищает ее через FLUSHDB
+    os.environ["REDIS_DB"] = str(args.db)
+    client = make_redis(args.fake)
+
+    rows = []
+    for mode in ("keys", "buckets"):
+        await client.flushdb()
+        before = await used_memory(client)
+        started = time.perf_counter()
+        await fill(client, mode, args.revocations, args.batch)
+        elapsed = time.perf_counter() - started
+        after = await used_memory(client)
+        delta = after - before
+        rows.append({
+            "mode": mode,
+            "revocations": args.revocations,
+            "keys": await client.dbsize(),
+            "used_memory_mb": round(delta / 2**20, 1) if delta else "n/a",
+            "bytes/revocation": round(delta / args.revocations, 1) if delta else "n/a",
+            "write_s": round(elapsed, 1),
+        })
+    await client.flushdb()
+
+    print_table(rows)
+    await client.aclose()
+
+
+if __name__ == "__main__":
+    parser = base_parser(__doc__)
+    parser.add_argument("--revocations", type=int, default=1_000_000)
+    parser.add_argument("--batch", type=int, default=10_000)
+    parser.add_argument("--db", type=int, default=15)
+    asyncio.run(main(parser.parse_args()))
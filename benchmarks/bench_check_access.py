@@ -0,0 +1,96 @@
+"""
+Решений в секунду у CheckAccess: прежний разбор g_perms/access с if/elif
+на каждый вызов vs скомпилированное правило vs кэш решений по JTI.
+
+    python -m benchmarks.bench_check_access
+
+Redis и токены не нужны: CheckAccess вызывается напрямую с готовым payload
+(как после get_token_payload).
+"""
+import argparse
+import asyncio
+import os
+import time
+
+os.environ.setdefault("SECRET_KEY", "benchmark-only-secret")
+os.environ.setdefault("ALGORITHM", "HS256")
+
+from fastapi import HTTPException
+
+from benchmarks.utils import print_table
+from common.access_rules import DecisionCache
+from common.permissions import resolve_permissions
+from common.security import AllOf, CheckAccess
+
+
+class LegacyCheckAccess:
+    """CheckAccess до компиляции правил (для сравнения)."""
+
+    def __init__(self, resource: str, action: str):
+        self.resource = resource
+        self.action = action
+
+    async def __call__(self, payload: dict) -> dict:
+        permissions = await resolve_permissions(payload)
+        g_perms = permissions["g_perms"]
+        access_list = permissions["access"]
+        if self.action == "read" and g_perms.get("r_all") is True:
+            return payload
+        if self.action in ["write", "delete"] and g_perms.get("w_all") is True:
+            return payload
+        resource_access = access_list.get(self.resource)
+        if not resource_access:
+            raise HTTPException(status_code=403, detail=f"Access to resource '{self.resource}' denied")
+        has_permission = False
+        if self.action == "read":
+            has_permission = bool(resource_access.get("r"))
+        elif self.action == "write":
+            has_permission = bool(resource_access.get("w"))
+        elif self.action == "delete":
+            has_permission = bool(resource_access.get("d"))
+        if not has_permission:
+            raise HTTPException(status_code=403, detail=f"Not enough permissions to {self.action} {self.resource}")
+        return payload
+
+
+async def rate(checker, payload: dict, decisions: int) -> int:
+    started = time.perf_counter()
+    for _ in range(decisions):
+        try:
+            await checker(payload)
+        except HTTPException:
+            pass
+    return int(decisions / (time.perf_counter() - started))
+
+
+async def main(args):
+    access = {f"resource_{i}": {"r": 1, "w": int(i % 2 == 0), "d": 0} for i in range(args.resources)}
+    payload = {"sub": "u1", "jti": "bench-jti", "g_perms": {"r_all": False, "w_all": False}, "access": access}
+    no_jti = {key: value for key, value in payload.items() if key != "jti"}
+
+    rows = []
+    for label, resource, action in (("allow", "resource_0", "write"), ("deny", "resource_1", "write")):
+        row = {"decision": label}
+        row["legacy/s"] = await rate(LegacyCheckAccess(resource, action), payload, args.decisions)
+        row["compiled/s"] = await rate(CheckAccess(resource, action), no_jti, args.decisions)
+        row["cached by jti/s"] = await rate(CheckAccess(resource, action), payload, args.decisions)
+        rows.append(row)
+
+    rule = AllOf(("resource_0", "read"), ("resource_2", "write"), ("resource_4", "read"))
+    rows.append({
+        "decision": "AllOf x3",
+        "legacy/s": "-",
+        "compiled/s": await rate(CheckAccess(rule), no_jti, args.decisions),
+        "cached by jti/s": await rate(CheckAccess(rule), payload, args.decisions),
+    })
+    print_table(rows)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--resources", type=int, default=50)
+    parser.add_argument("--decisions", type=int, default=200_000)
+    # Свежий кэш решений на каждый прогон
+    import common.security
+    common.security.decision_cache = DecisionCache()
+    asyncio.run(main(parser.parse_args()))
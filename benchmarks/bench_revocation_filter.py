@@ -0,0 +1,64 @@
+"""
+p50/p99 проверки отзыва: EXISTS на каждый запрос vs локальный Bloom filter.
+
+    python -m benchmarks.bench_revocation_filter --requests 20000 --revoked 10000
+"""
+import asyncio
+import time
+import uuid
+from unittest.mock import patch
+
+from benchmarks.utils import base_parser, make_redis, percentiles, print_table
+from common import redis_config
+from common.revocation_filter import RevocationFilter
+
+
+async def measure(jtis, concurrency: int):
+    samples = []
+    queue = list(jtis)
+
+    async def worker():
+        while queue:
+            jti = queue.pop()
+            started = time.perf_counter()
+            await redis_config.is_token_blacklisted(jti)
+            samples.append(time.perf_counter() - started)
+
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return samples
+
+
+async def main(args):
+    client = make_redis(args.fake)
+    revoked = [str(uuid.uuid4()) for _ in range(args.revoked)]
+    async with client.pipeline(transaction=False) as pipe:
+        for jti in revoked:
+            pipe.set(f"blacklist:{jti}", "true", ex=3600)
+        await pipe.execute()
+
+    # Типичный трафик: почти все токены не отозваны
+    lookups = [str(uuid.uuid4()) for _ in range(args.requests)]
+    lookups[: args.requests // 100] = revoked[: args.requests // 100]
+
+    rows = []
+    with patch.object(redis_config, "redis_client", client):
+        disabled = RevocationFilter(enabled=False)
+        with patch.object(redis_config, "revocation_filter", disabled):
+            rows.append({"mode": "EXISTS per request", **percentiles(await measure(lookups, args.concurrency))})
+
+        enabled = RevocationFilter(capacity=max(args.revoked * 2, 1000))
+        await enabled.resync(client)
+        with patch.object(redis_config, "revocation_filter", enabled):
+            rows.append({"mode": "bloom filter", **percentiles(await measure(lookups, args.concurrency))})
+
+    print_table(rows)
+    await client.delete(*[f"blacklist:{jti}" for jti in revoked])
+    await client.aclose()
+
+
+if __name__ == "__main__":
+    parser = base_parser(__doc__)
+    parser.add_argument("--requests", type=int, default=20000)
+    parser.add_argument("--revoked", type=int, default=10000)
+    parser.add_argument("--concurrency", type=int, default=50)
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,87 @@
+"""
+Размер access token и время его разбора для embedded (g_perms/access + UUID jti)
+и compact (маски по словарю ресурсов + короткий jti) форматов.
+
+    python -m benchmarks.bench_token_format
+
+Время разбора — jwt.decode + resolve_permissions_local (права в виде,
+который получает CheckAccess); кэш раскодированных прав compact-формата
+отключен для "cold" и включен для "warm". Redis не нужен: словарь ресурсов
+заполняется локально.
+"""
+import argparse
+import base64
+import os
+import secrets
+import time
+import uuid
+from unittest.mock import patch
+
+os.environ.setdefault("SECRET_KEY", "benchmark-only-secret")
+os.environ.setdefault("ALGORITHM", "HS256")
+
+import jwt
+
+from benchmarks.utils import percentiles, print_table
+from common import redis_config
+from common.compact_permissions import ResourceDictionary
+from common.permissions import resolve_permissions_local
+from common.security import ALGORITHM, SECRET_KEY
+
+
+def make_fragment(resources: int) -> dict:
+    return {
+        "role": "bench",
+        "g_perms": {"r_all": False, "w_all": False},
+        "access": {
+            f"resource_{i}": {"r": 1, "w": int(i % 2 == 0), "d": int(i % 5 == 0)}
+            for i in range(resources)
+        },
+    }
+
+
+def sign(claims: dict, jti: str) -> str:
+    payload = {"sub": str(uuid.uuid4()), "email": "bench@example.com", **claims}
+    payload.update({"exp": int(time.time()) + 1800, "jti": jti, "type": "access", "gen": 0})
+    return jwt.encode(payload, SECRET_KEY, algorithm=ALGORITHM)
+
+
+def measure(token: str, iterations: int) -> dict:
+    samples = []
+    for _ in range(iterations):
+        started = time.perf_counter()
+        resolve_permissions_local(jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM]))
+        samples.append(time.perf_counter() - started)
+    return {"token_bytes": len(token), **percentiles(samples)}
+
+
+def main(args):
+    short_jti = base64.urlsafe_b64encode(secrets.token_bytes(16)).rstrip(b"=").decode("ascii")
+    rows = []
+    for resources in args.resources:
+        fragment = make_fragment(resources)
+        dictionary = ResourceDictionary()
+        dictionary.load("bench", {name: i for i, name in enumerate(fragment["access"])})
+        compact = sign(dictionary.encode(fragment), short_jti)
+        with patch("common.compact_permissions.COMPACT_PERMS_COMPRESS_MIN_BYTES", 10**9):
+            uncompressed = sign(dictionary.encode(fragment), short_jti)
+
+        cold = ResourceDictionary(decode_cache_size=0)
+        cold.load("bench", {name: i for i, name in enumerate(fragment["access"])})
+        cases = [
+            ("embedded", sign(fragment, str(uuid.uuid4())), dictionary),
+            ("compact, no zlib (cold)", uncompressed, cold),
+            ("compact (cold)", compact, cold),
+            ("compact (warm)", compact, dictionary),
+        ]
+        for name, token, used in cases:
+            with patch.object(redis_config, "resource_dictionary", used):
+                rows.append({"resources": resources, "format": name, **measure(token, args.iterations)})
+    print_table(rows)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--resources", type=int, nargs="+", default=[10, 100, 1000])
+    parser.add_argument("--iterations", type=int, default=2_000)
+    main(parser.parse_args())
@@ -0,0 +1,86 @@
+"""
+Нагрузочный тест одного эндпоинта GET /auth/verify (Traefik forwardAuth).
+
+    # в процессе (ASGI, без сети и без БД; Redis — из переменных окружения или --fake)
+    python -m benchmarks.bench_verify --fake --concurrency 50 --requests 20000
+    # против развернутого сервиса (токен — из POST /auth/token)
+    python -m benchmarks.bench_verify --url http://localhost/api/user-service --token <access_token>
+
+Половина пользователей предъявляет один и тот же токен повторно (кэш
+проверенных токенов и заголовков), остальные — каждый раз новый.
+"""
+import asyncio
+import os
+import time
+from unittest.mock import patch
+
+os.environ.setdefault("SECRET_KEY", "benchmark-only-secret")
+os.environ.setdefault("ALGORITHM", "HS256")
+
+import httpx
+
+from benchmarks.utils import base_parser, make_redis, percentiles, print_table
+
+
+def make_tokens(count: int):
+    from user_service.security import create_access_token
+
+    fragment = {
+        "role": "bench",
+        "g_perms": {"r_all": False, "w_all": False},
+        "access": {f"resource_{i}": {"r": 1, "w": 0, "d": 0} for i in range(20)},
+    }
+    return [create_access_token({"sub": f"user-{i}", "email": f"u{i}@bench.io", **fragment}) for i in range(count)]
+
+
+async def run(client: httpx.AsyncClient, tokens, total: int, concurrency: int):
+    samples, statuses = [], {}
+    queue = asyncio.Queue()
+    for i in range(total):
+        queue.put_nowait(tokens[i % len(tokens)])
+
+    async def worker():
+        while not queue.empty():
+            token = queue.get_nowait()
+            started = time.perf_counter()
+            response = await client.get("/auth/verify", headers={"Authorization": f"Bearer {token}"})
+            samples.append(time.perf_counter() - started)
+            statuses[response.status_code] = statuses.get(response.status_code, 0) + 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+    return {"rps": int(total / elapsed), **percentiles(samples), "statuses": statuses}
+
+
+async def main(args):
+    if args.url:
+        tokens = [args.token]
+        async with httpx.AsyncClient(base_url=args.url, timeout=10) as client:
+            rows = [{"tokens": "given", **await run(client, tokens, args.requests, args.concurrency)}]
+        print_table(rows)
+        return
+
+    from user_service.main import app
+
+    redis_client = make_redis(args.fake)
+    with patch("common.redis_config.redis_client", redis_client):
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+            rows = [
+                {"tokens": "1 (repeated)", **await run(client, make_tokens(1), args.requests, args.concurrency)},
+                {"tokens": f"{args.requests} (unique)", **await run(client, make_tokens(args.requests), args.requests, args.concurrency)},
+            ]
+    print_table(rows)
+
+
+if __name__ == "__main__":
+    parser = base_parser(__doc__)
+    parser.add_argument("--url", default=None, help="base URL of a running user service")
+    parser.add_argument("--token", default=None, help="access token for --url mode")
+    parser.add_argument("--requests", type=int, default=20_000)
+    parser.add_argument("--concurrency", type=int, default=50)
+    args = parser.parse_args()
+    if args.url and not args.token:
+        parser.error("--url requires --token")
+    asyncio.run(main(args))
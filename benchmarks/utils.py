@@ -0,0 +1,60 @@
+"""
+Общие хелперы для бенчмарков.
+
+Бенчмарки рассчитаны на реальный Redis/Postgres из docker-compose
+(параметры берутся из тех же переменных окружения, что и у сервиса).
+Флаг --fake подменяет Redis на fakeredis: цифры тогда бессмысленны,
+но так удобно проверить, что сценарий вообще работает.
+"""
+import argparse
+import os
+import statistics
+from typing import Dict, List
+
+import redis.asyncio as redis
+
+
+def base_parser(description: str) -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description=description)
+    parser.add_argument("--fake", action="store_true", help="use fakeredis instead of a real server")
+    return parser
+
+
+def make_redis(fake: bool) -> redis.Redis:
+    if fake:
+        import fakeredis.aioredis
+
+        return fakeredis.aioredis.FakeRedis(decode_responses=True)
+    return redis.Redis(
+        host=os.getenv("REDIS_HOST", "localhost"),
+        port=int(os.getenv("REDIS_PORT", 6379)),
+        db=int(os.getenv("REDIS_DB", 0)),
+        password=os.getenv("REDIS_PASSWORD"),
+        decode_responses=True,
+    )
+
+
+def percentiles(samples: List[float]) -> Dict[str, float]:
+    """p50/p99/mean в микросекундах (samples — в секундах)."""
+    ordered = sorted(samples)
+    if not ordered:
+        return {"p50_us": 0.0, "p99_us": 0.0, "mean_us": 0.0}
+
+    def pick(q: float) -> float:
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))] * 1e6
+
+    return {
+        "p50_us": round(pick(0.50), 1),
+        "p99_us": round(pick(0.99), 1),
+        "mean_us": round(statistics.fmean(ordered) * 1e6, 1),
+    }
+
+
+def print_table(rows: List[Dict[str, object]]):
+    if not rows:
+        return
+    headers = list(rows[0].keys())
+    widths = [max(len(str(h)), *(len(str(r[h])) for r in rows)) for h in headers]
+    print("  ".join(str(h).ljust(w) for h, w in zip(headers, widths)))
+    for row in rows:
+        print("  ".join(str(row[h]).ljust(w) for h, w in zip(headers, widths)))
@@ -0,0 +1,162 @@
+import os
+from abc import ABC, abstractmethod
+from functools import lru_cache
+from typing import Dict, Hashable, Iterable, List, Optional, Tuple, Union
+
+from .metrics import metrics
+from .resource_patterns import SEPARATOR, match_resource, split_resource
+
+# Решения CheckAccess по (jti, правило) для токенов с правами внутри
+# (embedded/compact): права такого токена не меняются до его exp.
+ACCESS_DECISION_CACHE_SIZE = int(os.getenv("ACCESS_DECISION_CACHE_SIZE", 100_000))
+
+# action -> (глобальный флаг в g_perms, флаг в правах ресурса)
+ACTIONS = {
+    "read": ("r_all", "r"),
+    "write": ("w_all", "w"),
+    "delete": ("w_all", "d"),
+}
+
+
+class Rule(ABC):
+    """
+    Скомпилированное правило доступа (правило без denial не создается).
+    denial(g_perms, access) -> None (доступ разрешен) или готовый текст отказа.
+    key — хешируемый идентификатор правила для кэша решений.
+    """
+
+    key: Hashable
+
+    @abstractmethod
+    def denial(self, g_perms: dict, access: dict) -> Optional[str]:
+        ...
+
+
+class Permission(Rule):
+    """
+    Действие над ресурсом; все строки и флаги вычисляются при создании.
+    Ресурс может быть иерархическим ("farms.sensors"): кроме точного правила
+    подходят шаблонные правила роли (см. resource_patterns.py).
+    """
+
+    def __init__(self, resource: str, action: str):
+        if action not in ACTIONS:
+            raise ValueError(f"Unknown action {action!r}, expected one of {sorted(ACTIONS)}")
+        self._segments = tuple(split_resource(resource))
+        resource = SEPARATOR.join(self._segments)
+        self.resource = resource
+        self.action = action
+        self.key = (resource, action)
+        self._global_flag, self._flag = ACTIONS[action]
+        self._no_resource = f"Access to resource '{resource}' denied"
+        self._not_enough = f"Not enough permissions to {action} {resource}"
+
+    def denial(self, g_perms: dict, access: dict) -> Optional[str]:
+        if g_perms.get(self._global_flag) is True:
+            return None
+        rules = match_resource(access, self.resource, self._segments)
+        if not rules:
+            return self._no_resource
+        return None if rules.get(self._flag) else self._not_enough
+
+
+RuleLike = Union[Rule, Tuple[str, str]]
+
+
+def compile_rule(rule: RuleLike) -> Rule:
+    if isinstance(rule, Rule):
+        return rule
+    resource, action = rule
+    return Permission(resource, action)
+
+
+class AllOf(Rule):
+    """Разрешено, если разрешены все правила; отказ — по первому неразрешенному."""
+
+    def __init__(self, *rules: RuleLike):
+        if not rules:
+            raise ValueError("AllOf needs at least one rule")
+        self.rules = tuple(compile_rule(rule) for rule in rules)
+        self.key = ("all",) + tuple(rule.key for rule in self.rules)
+
+    def denial(self, g_perms: dict, access: dict) -> Optional[str]:
+        for rule in self.rules:
+            reason = rule.denial(g_perms, access)
+            if reason is not None:
+                return reason
+        return None
+
+
+class AnyOf(Rule):
+    """Разрешено, если разрешено хотя бы одно правило; отказ — по первому правилу."""
+
+    def __init__(self, *rules: RuleLike):
+        if not rules:
+            raise ValueError("AnyOf needs at least one rule")
+        self.rules = tuple(compile_rule(rule) for rule in rules)
+        self.key = ("any",) + tuple(rule.key for rule in self.rules)
+
+    def denial(self, g_perms: dict, access: dict) -> Optional[str]:
+        first = None
+        for rule in self.rules:
+            reason = rule.denial(g_perms, access)
+            if reason is None:
+                return None
+            if first is None:
+                first = reason
+        return first
+
+
+@lru_cache(maxsize=4096)
+def permission(resource: str, action: str) -> Permission:
+    """Скомпилированное правило (resource, action), общее для всех вызовов."""
+    return Permission(resource, action)
+
+
+def decide_many(g_perms: dict, access: dict, checks: Iterable[Tuple[str, str]]) -> List[bool]:
+    """
+    Вектор решений для списка (resource, action) по уже полученным правам.
+    Одинаковые пары вычисляются один раз; ValueError — неизвестное действие.
+    """
+    decided: Dict[Tuple[str, str], bool] = {}
+    decisions = []
+    for check in checks:
+        allowed = decided.get(check)
+        if allowed is None:
+            allowed = decided[check] = permission(*check).denial(g_perms, access) is None
+        decisions.append(allowed)
+    return decisions
+
+
+# Отсутствие записи в кэше решений (None — это "разрешено")
+MISSING = object()
+
+
+class DecisionCache:
+    """
+    (jti, rule.key) -> результат Rule.denial; при переполнении вытесняются
+    самые старые записи (FIFO: дешевле LRU на горячем пути, а токен живет недолго).
+    Решение не заменяет проверку отзыва: get_token_payload выполняет ее
+    до CheckAccess на каждом запросе.
+    """
+
+    def __init__(self, max_entries: int = ACCESS_DECISION_CACHE_SIZE):
+        self.max_entries = max_entries
+        self._entries: Dict[tuple, Optional[str]] = {}
+
+    def get(self, key: tuple):
+        return self._entries.get(key, MISSING)
+
+    def put(self, key: tuple, decision: Optional[str]):
+        if self.max_entries <= 0:
+            return
+        self._entries[key] = decision
+        if len(self._entries) > self.max_entries:
+            del self._entries[next(iter(self._entries))]
+        metrics.set_gauge("access_decision_cache_entries", len(self._entries))
+
+    def clear(self):
+        self._entries.clear()
+
+
+decision_cache = DecisionCache()
@@ -0,0 +1,68 @@
+import base64
+import binascii
+import math
+import os
+import time
+import uuid
+from typing import Optional
+
+# Формат хранения отозванных JTI в Redis:
+#   keys    — blacklist:{jti} = "true" EX ttl (по ключу на токен, исходный формат);
+#   buckets — blacklist:b:{bucket} HASH {jti_bytes: "1"}, где bucket — окно
+#             истечения токенов; весь hash истекает вместе с последним токеном окна.
+BLACKLIST_STORAGE = os.getenv("BLACKLIST_STORAGE", "keys")
+BLACKLIST_BUCKET_SECONDS = int(os.getenv("BLACKLIST_BUCKET_SECONDS", 3600))
+# В режиме buckets дополнительно проверять старые blacklist:{jti} ключи
+# (нужно, пока живы токены, отозванные до переключения формата).
+BLACKLIST_LEGACY_READ = os.getenv("BLACKLIST_LEGACY_READ", "true").lower() == "true"
+
+KEY_PREFIX = "blacklist:"
+BUCKET_PREFIX = "blacklist:b:"
+# Запас после истечения последнего токена окна (рассинхрон часов)
+BUCKET_EXPIRY_SLACK = 60
+
+
+def use_buckets() -> bool:
+    return BLACKLIST_STORAGE == "buckets"
+
+
+def encode_jti(jti: str) -> bytes:
+    """
+    Компактное бинарное представление JTI: UUID и короткий jti
+    (16 байт в base64url, TOKEN_JTI_FORMAT=short) -> 16 байт, иначе UTF-8.
+    JTI выпускает и подписывает сервер, поэтому подобрать строку,
+    совпадающую с байтами чужого UUID, клиент не может.
+    """
+    try:
+        return uuid.UUID(jti).bytes
+    except (ValueError, AttributeError, TypeError):
+        pass
+    if isinstance(jti, str) and len(jti) == 22:
+        try:
+            raw = base64.urlsafe_b64decode(jti + "==")
+        except (binascii.Error, ValueError):
+            raw = b""
+        if len(raw) == 16:
+            return raw
+    return str(jti).encode("utf-8")
+
+
+def legacy_key(jti: str) -> str:
+    return f"{KEY_PREFIX}{jti}"
+
+
+def bucket_of(exp: float) -> int:
+    """Номер окна: все токены окна истекают не позже bucket * BLACKLIST_BUCKET_SECONDS."""
+    return math.ceil(exp / BLACKLIST_BUCKET_SECONDS)
+
+
+def bucket_key(exp: float) -> str:
+    return f"{BUCKET_PREFIX}{bucket_of(exp)}"
+
+
+def bucket_expire_at(exp: float) -> int:
+    return bucket_of(exp) * BLACKLIST_BUCKET_SECONDS + BUCKET_EXPIRY_SLACK
+
+
+def resolve_exp(expire_seconds: int, exp: Optional[float]) -> float:
+    return exp if exp is not None else time.time() + expire_seconds
@@ -0,0 +1,142 @@
+import asyncio
+import logging
+import os
+import time
+from typing import Awaitable, Callable, Optional, TypeVar
+
+import redis.asyncio as redis
+
+from .metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+# Сколько подряд сетевых ошибок Redis открывают breaker
+REDIS_BREAKER_FAILURE_THRESHOLD = int(os.getenv("REDIS_BREAKER_FAILURE_THRESHOLD", 5))
+# Интервал фоновых PING-проб, пока breaker открыт
+REDIS_BREAKER_PROBE_SECONDS = float(os.getenv("REDIS_BREAKER_PROBE_SECONDS", 2))
+
+T = TypeVar("T")
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+_STATE_GAUGE = {CLOSED: 0, OPEN: 1, HALF_OPEN: 2}
+
+# Ошибки, говорящие о недоступности сервера (а не о неверной команде)
+FAILURE_ERRORS = (redis.ConnectionError, redis.TimeoutError, OSError, asyncio.TimeoutError)
+# Ошибки redis-py, при которых можно переходить в degraded-режим
+UNAVAILABLE_ERRORS = (redis.ConnectionError, redis.TimeoutError)
+
+
+class CircuitOpenError(redis.ConnectionError):
+    """
+    Breaker открыт — вызов отклонен без обращения к Redis.
+    Наследник redis.ConnectionError: существующие обработчики RedisError
+    (например, 503 в get_token_payload) работают без изменений.
+    """
+
+
+class CircuitBreaker:
+    """
+    Circuit breaker вокруг Redis:
+    - closed    — вызовы идут в Redis, считаем подряд идущие сетевые ошибки;
+    - open      — после failure_threshold ошибок вызовы сразу падают с
+                  CircuitOpenError, фоновая задача пингует сервер;
+    - half_open — проба прошла: пропускаем вызовы, первая же ошибка снова
+                  открывает breaker, первый успех закрывает его.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        probe: Callable[[], Awaitable[object]],
+        failure_threshold: int = REDIS_BREAKER_FAILURE_THRESHOLD,
+        probe_interval: float = REDIS_BREAKER_PROBE_SECONDS,
+    ):
+        self.name = name
+        self._probe = probe
+        self.failure_threshold = max(failure_threshold, 1)
+        self.probe_interval = probe_interval
+        self.state = CLOSED
+        self.failures = 0
+        self.opened_at: Optional[float] = None
+        self._probe_task: Optional[asyncio.Task] = None
+
+    @property
+    def is_open(self) -> bool:
+        return self.state == OPEN
+
+    async def call(self, func: Callable[..., Awaitable[T]], *args, **kwargs) -> T:
+        if self.state == OPEN:
+            # Проба могла умереть вместе со своим event loop — перезапускаем
+            self._ensure_probe()
+            metrics.inc("redis_breaker_rejected_total", labels={"breaker": self.name})
+            raise CircuitOpenError(f"Circuit '{self.name}' is open")
+        try:
+            result = await func(*args, **kwargs)
+        except FAILURE_ERRORS as exc:
+            if not isinstance(exc, CircuitOpenError):
+                self.record_failure()
+            raise
+        self.record_success()
+        return result
+
+    def record_success(self):
+        self.failures = 0
+        if self.state != CLOSED:
+            logger.info("Circuit '%s' closed", self.name)
+            self._set_state(CLOSED)
+            self.opened_at = None
+
+    def record_failure(self):
+        self.failures += 1
+        if self.state == HALF_OPEN or self.failures >= self.failure_threshold:
+            self._open()
+
+    def _open(self):
+        if self.state != OPEN:
+            logger.warning("Circuit '%s' opened after %d failures", self.name, self.failures)
+            metrics.inc("redis_breaker_opened_total", labels={"breaker": self.name})
+        self._set_state(OPEN)
+        self.opened_at = time.monotonic()
+        self._ensure_probe()
+
+    def _set_state(self, state: str):
+        self.state = state
+        metrics.set_gauge("redis_breaker_state", _STATE_GAUGE[state], labels={"breaker": self.name})
+
+    def _ensure_probe(self):
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            return
+        task = self._probe_task
+        if task is not None and not task.done() and task.get_loop() is loop:
+            return
+        self._probe_task = loop.create_task(self._probe_loop())
+
+    async def _probe_loop(self):
+        while self.state == OPEN:
+            await asyncio.sleep(self.probe_interval)
+            try:
+                await self._probe()
+            except Exception as exc:
+                logger.debug("Circuit '%s' probe failed: %s", self.name, exc)
+                continue
+            # Сервер ответил: пускаем реальные вызовы, они решат — закрыть или открыть
+            self._set_state(HALF_OPEN)
+
+    async def stop(self):
+        if self._probe_task is not None:
+            self._probe_task.cancel()
+            try:
+                await self._probe_task
+            except (asyncio.CancelledError, Exception):
+                pass
+            self._probe_task = None
+
+    def reset(self):
+        self.failures = 0
+        self.opened_at = None
+        self._set_state(CLOSED)
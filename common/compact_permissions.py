@@ -0,0 +1,228 @@
+import base64
+import os
+import secrets
+import zlib
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import redis.asyncio as redis
+
+from . import role_table
+from .metrics import metrics
+
+# Компактный формат прав в access token (TOKEN_PERMISSION_MODE=compact):
+#   "gp" — биты глобальных прав (1 = r_all, 2 = w_all);
+#   "pm" — base64url(флаг + тело), тело — пары (varint индекс ресурса, байт маски
+#          r=1, w=2, d=4); флаг 0 — как есть, 1 — zlib;
+#   "pd" — эпоха словаря ресурсов, по которому выданы индексы.
+# Словарь ресурсов общий для всех сервисов и только дополняется: индекс,
+# однажды выданный ресурсу, не меняется, пока жива эпоха.
+COMPACT_PERMS_COMPRESS_MIN_BYTES = int(os.getenv("COMPACT_PERMS_COMPRESS_MIN_BYTES", 256))
+# Сколько различных "pm" держать раскодированными (у токенов одной роли "pm" одинаковый)
+COMPACT_PERMS_DECODE_CACHE_SIZE = int(os.getenv("COMPACT_PERMS_DECODE_CACHE_SIZE", 1024))
+
+# HASH resource -> index; счетчик индексов; эпоха словаря
+RESOURCE_DICT_KEY = "resource_dict"
+RESOURCE_DICT_SEQ_KEY = "resource_dict:seq"
+RESOURCE_DICT_EPOCH_KEY = "resource_dict:epoch"
+
+ACTION_BITS = {"r": 1, "w": 2, "d": 4}
+GLOBAL_BITS = {"r_all": 1, "w_all": 2}
+
+_RAW = 0
+_ZLIB = 1
+
+
+def use_compact_permissions() -> bool:
+    return role_table.TOKEN_PERMISSION_MODE == "compact"
+
+
+def _b64encode(data: bytes) -> str:
+    return base64.urlsafe_b64encode(data).rstrip(b"=").decode("ascii")
+
+
+def _b64decode(data: str) -> bytes:
+    return base64.urlsafe_b64decode(data + "=" * (-len(data) % 4))
+
+
+def pack_access(indexed: Iterable[Tuple[int, int]]) -> str:
+    """(индекс ресурса, маска) -> значение claim "pm"."""
+    body = bytearray()
+    for index, mask in sorted(indexed):
+        while index >= 0x80:
+            body.append((index & 0x7F) | 0x80)
+            index >>= 7
+        body.append(index)
+        body.append(mask)
+    flag = _RAW
+    if len(body) >= COMPACT_PERMS_COMPRESS_MIN_BYTES:
+        compressed = zlib.compress(bytes(body), 9)
+        if len(compressed) < len(body):
+            body, flag = bytearray(compressed), _ZLIB
+    return _b64encode(bytes([flag]) + bytes(body))
+
+
+def unpack_access(value: str) -> List[Tuple[int, int]]:
+    """Обратное к pack_access. ValueError — claim поврежден."""
+    try:
+        data = _b64decode(value)
+        flag, body = data[0], data[1:]
+        if flag == _ZLIB:
+            body = zlib.decompress(body)
+        elif flag != _RAW:
+            raise ValueError(f"unknown pm flag {flag}")
+    except (IndexError, zlib.error, ValueError) as exc:
+        raise ValueError(f"malformed pm claim: {exc}") from exc
+
+    pairs = []
+    position, size = 0, len(body)
+    while position < size:
+        index, shift = 0, 0
+        while True:
+            if position >= size:
+                raise ValueError("malformed pm claim: truncated index")
+            byte = body[position]
+            position += 1
+            index |= (byte & 0x7F) << shift
+            shift += 7
+            if not byte & 0x80:
+                break
+        if position >= size:
+            raise ValueError("malformed pm claim: missing mask")
+        pairs.append((index, body[position]))
+        position += 1
+    return pairs
+
+
+def mask_of(rules: dict) -> int:
+    return sum(bit for action, bit in ACTION_BITS.items() if rules.get(action))
+
+
+def rules_of(mask: int) -> Dict[str, int]:
+    return {action: int(bool(mask & bit)) for action, bit in ACTION_BITS.items()}
+
+
+class ResourceDictionary:
+    """
+    Общий словарь resource -> index для компактных токенов.
+    - Redis: HASH resource_dict, индексы раздает INCR resource_dict:seq,
+      гонку двух выдач решает HSETNX (проигравший индекс просто не используется).
+    - Локально: копия словаря; перечитывается целиком (HGETALL) только когда
+      токен ссылается на неизвестный индекс или другую эпоху.
+    - Раскодированные права кэшируются по (эпоха, gp, pm).
+    - Если sync подтвердил, что эпохи токена или его индекса нет и в Redis,
+      это запоминается (эпоха целиком или (эпоха, pm)): такой токен до exp
+      больше не вызывает sync. Ответ окончательный — индексы выдаются до
+      подписи токена, а эпоха случайна и не возвращается.
+    """
+
+    def __init__(self, decode_cache_size: int = COMPACT_PERMS_DECODE_CACHE_SIZE):
+        self.decode_cache_size = decode_cache_size
+        self.epoch: Optional[str] = None
+        self._index: Dict[str, int] = {}
+        self._names: Dict[int, str] = {}
+        self._decoded: Dict[Tuple[str, int, str], dict] = {}
+        self._unknown: Dict[Tuple[Optional[str], Optional[str]], None] = {}
+
+    def load(self, epoch: Optional[str], mapping: Dict[str, int]):
+        if epoch != self.epoch:
+            self._decoded.clear()
+            self._unknown.clear()
+        self.epoch = epoch
+        self._index = dict(mapping)
+        self._names = {index: name for name, index in mapping.items()}
+        metrics.set_gauge("resource_dict_entries", len(self._index))
+
+    async def sync(self, client: redis.Redis):
+        async with client.pipeline(transaction=False) as pipe:
+            pipe.get(RESOURCE_DICT_EPOCH_KEY)
+            pipe.hgetall(RESOURCE_DICT_KEY)
+            epoch, mapping = await pipe.execute()
+        self.load(epoch, {name: int(index) for name, index in mapping.items()})
+        metrics.inc("resource_dict_syncs_total")
+
+    async def ensure(self, client: redis.Redis, names: Iterable[str]):
+        """Выдает индексы ресурсам, которых еще нет в словаре."""
+        missing = [name for name in names if name not in self._index]
+        if not missing and self.epoch is not None:
+            return
+        if self.epoch is None:
+            await client.set(RESOURCE_DICT_EPOCH_KEY, _b64encode(secrets.token_bytes(6)), nx=True)
+        if missing:
+            first = await client.incrby(RESOURCE_DICT_SEQ_KEY, len(missing)) - len(missing)
+            async with client.pipeline(transaction=False) as pipe:
+                for offset, name in enumerate(missing):
+                    pipe.hsetnx(RESOURCE_DICT_KEY, name, first + offset)
+                await pipe.execute()
+        await self.sync(client)
+
+    def encode(self, fragment: dict) -> Optional[dict]:
+        """
+        Фрагмент прав роли -> компактные claims {"role", "gp", "pm", "pd"}.
+        None — в словаре нет какого-то ресурса или он еще не загружен (сначала ensure).
+        """
+        if self.epoch is None:
+            return None
+        indexed = []
+        for resource, rules in fragment["access"].items():
+            index = self._index.get(resource)
+            if index is None:
+                return None
+            indexed.append((index, mask_of(rules)))
+        g_perms = fragment["g_perms"]
+        return {
+            "role": fragment["role"],
+            "gp": sum(bit for flag, bit in GLOBAL_BITS.items() if g_perms.get(flag)),
+            "pm": pack_access(indexed),
+            "pd": self.epoch,
+        }
+
+    def decode(self, payload: dict) -> Optional[dict]:
+        """
+        Компактные claims -> {"role", "g_perms", "access"} в том же виде,
+        что и у embedded-токена. None — нужен sync (словарь отстал или другая эпоха).
+        ValueError — claim "pm" поврежден.
+        """
+        gp, pm = int(payload.get("gp", 0)), payload.get("pm", "")
+        key = (payload.get("pd"), gp, pm)
+        cached = self._decoded.get(key)
+        if cached is not None:
+            return {**cached, "role": payload.get("role", "guest")}
+        if key[0] != self.epoch:
+            return None
+
+        access = {}
+        for index, mask in unpack_access(pm):
+            name = self._names.get(index)
+            if name is None:
+                return None
+            access[name] = rules_of(mask)
+        permissions = {
+            "g_perms": {flag: bool(gp & bit) for flag, bit in GLOBAL_BITS.items()},
+            "access": access,
+        }
+        if self.decode_cache_size > 0:
+            if len(self._decoded) >= self.decode_cache_size:
+                self._decoded.pop(next(iter(self._decoded)))
+            self._decoded[key] = permissions
+        return {**permissions, "role": payload.get("role", "guest")}
+
+    def is_unknown(self, payload: dict) -> bool:
+        """Sync уже подтвердил, что права токена в словаре не найти."""
+        epoch = payload.get("pd")
+        return (epoch, None) in self._unknown or (epoch, payload.get("pm", "")) in self._unknown
+
+    def mark_unknown(self, payload: dict):
+        """Вызывается после sync, если decode(payload) все еще None."""
+        epoch = payload.get("pd")
+        # Чужая эпоха — неизвестны все ее токены, иначе — только этот "pm"
+        key = (epoch, None) if epoch != self.epoch else (epoch, payload.get("pm", ""))
+        if len(self._unknown) >= max(self.decode_cache_size, 1):
+            self._unknown.pop(next(iter(self._unknown)))
+        self._unknown[key] = None
+
+    def clear(self):
+        self.epoch = None
+        self._index.clear()
+        self._names.clear()
+        self._decoded.clear()
+        self._unknown.clear()
@@ -0,0 +1,154 @@
+import base64
+import hashlib
+import hmac
+import json
+import os
+import time
+from typing import Dict, Optional
+from urllib.parse import quote, unquote
+
+from fastapi import HTTPException, Request, status
+
+# Заголовки, которые /auth/verify отдает Traefik (forwardAuth.authResponseHeaders),
+# а Traefik добавляет к запросу в бэкенд, перезаписывая присланные клиентом.
+USER_ID_HEADER = "X-User-Id"
+ROLE_HEADER = "X-Role"
+PERMS_HEADER = "X-Perms"
+TOKEN_ID_HEADER = "X-Token-Id"
+EXPIRES_HEADER = "X-Auth-Expires"
+SIGNATURE_HEADER = "X-Auth-Signature"
+IDENTITY_HEADERS = (
+    USER_ID_HEADER, ROLE_HEADER, PERMS_HEADER, TOKEN_ID_HEADER, EXPIRES_HEADER, SIGNATURE_HEADER,
+)
+
+# Подпись заголовков: без нее бэкенд, доступный в обход шлюза, принял бы
+# любой присланный клиентом X-User-Id. Подписан и срок действия токена
+# (X-Auth-Expires): перехваченные заголовки не действуют дольше самого токена.
+GATEWAY_AUTH_SECRET = os.getenv("GATEWAY_AUTH_SECRET") or os.getenv("SECRET_KEY", "CHANGE_ME_IN_PROD_SECRET_KEY")
+# Сколько различных X-Perms держать раскодированными (у пользователей одной роли он одинаковый)
+GATEWAY_PERMS_CACHE_SIZE = int(os.getenv("GATEWAY_PERMS_CACHE_SIZE", 1024))
+
+# Готовые заголовки /auth/verify по JTI (токены с правами внутри)
+GATEWAY_HEADERS_CACHE_SIZE = int(os.getenv("GATEWAY_HEADERS_CACHE_SIZE", 10000))
+
+_decoded_perms: Dict[str, dict] = {}
+_headers_by_jti: Dict[str, Dict[str, str]] = {}
+
+
+def encode_permissions(permissions: dict) -> str:
+    data = json.dumps(
+        {"g_perms": permissions["g_perms"], "access": permissions["access"]},
+        separators=(",", ":"),
+        sort_keys=True,
+    )
+    return base64.urlsafe_b64encode(data.encode("utf-8")).rstrip(b"=").decode("ascii")
+
+
+def decode_permissions(value: str) -> dict:
+    """X-Perms -> {"g_perms", "access"}; результат общий для запросов — не мутируйте."""
+    permissions = _decoded_perms.get(value)
+    if permissions is None:
+        raw = base64.urlsafe_b64decode(value + "=" * (-len(value) % 4))
+        permissions = json.loads(raw)
+        if not isinstance(permissions, dict) or not {"g_perms", "access"} <= permissions.keys():
+            raise ValueError("malformed permissions header")
+        if len(_decoded_perms) >= GATEWAY_PERMS_CACHE_SIZE:
+            _decoded_perms.pop(next(iter(_decoded_perms)))
+        _decoded_perms[value] = permissions
+    return permissions
+
+
+def encode_role(role: str) -> str:
+    """
+    X-Role: имя роли в percent-encoding (UTF-8). Значения заголовков
+    передаются в latin-1, а имя роли может быть любым ("менеджер").
+    ASCII-имена без спецсимволов не меняются.
+    """
+    return quote(role, safe="")
+
+
+def decode_role(value: str) -> str:
+    return unquote(value, errors="strict")
+
+
+def sign(*fields: str, secret: Optional[str] = None) -> str:
+    message = "\n".join(fields).encode("utf-8")
+    digest = hmac.new((secret or GATEWAY_AUTH_SECRET).encode("utf-8"), message, hashlib.sha256).digest()
+    return base64.urlsafe_b64encode(digest).rstrip(b"=").decode("ascii")
+
+
+def identity_headers(payload: dict, permissions: dict) -> Dict[str, str]:
+    """
+    Заголовки ответа /auth/verify для проверенного токена.
+    X-Token-Id передается только для токенов с правами внутри: бэкенд кэширует
+    решения по нему, а права role_ref токена могут измениться в любой момент.
+    Для таких токенов заголовки вычисляются один раз на JTI.
+    """
+    token_id = str(payload.get("jti") or "") if "rid" not in payload else ""
+    if token_id:
+        cached = _headers_by_jti.get(token_id)
+        if cached is not None:
+            return cached
+
+    user_id = str(payload.get("sub") or "")
+    role = encode_role(permissions.get("role") or payload.get("role") or "guest")
+    perms = encode_permissions(permissions)
+    expires = str(int(payload.get("exp") or 0))
+    headers = {
+        USER_ID_HEADER: user_id,
+        ROLE_HEADER: role,
+        PERMS_HEADER: perms,
+        TOKEN_ID_HEADER: token_id,
+        EXPIRES_HEADER: expires,
+        SIGNATURE_HEADER: sign(user_id, role, perms, token_id, expires),
+    }
+    if token_id:
+        if len(_headers_by_jti) >= GATEWAY_HEADERS_CACHE_SIZE:
+            _headers_by_jti.pop(next(iter(_headers_by_jti)))
+        _headers_by_jti[token_id] = headers
+    return headers
+
+
+async def get_gateway_payload(request: Request) -> dict:
+    """
+    Замена get_token_payload для сервисов за шлюзом: identity из заголовков,
+    которые проставил Traefik по ответу /auth/verify. Ни JWT, ни Redis.
+    Подключение для всего сервиса (CheckAccess, get_current_user_identity):
+        app.dependency_overrides[get_token_payload] = get_gateway_payload
+    """
+    headers = request.headers
+    user_id = headers.get(USER_ID_HEADER)
+    role = headers.get(ROLE_HEADER, "")
+    perms = headers.get(PERMS_HEADER, "")
+    token_id = headers.get(TOKEN_ID_HEADER, "")
+    expires = headers.get(EXPIRES_HEADER, "")
+    signature = headers.get(SIGNATURE_HEADER, "")
+    expected = sign(user_id or "", role, perms, token_id, expires).encode("ascii")
+    if (
+        not user_id
+        or not hmac.compare_digest(signature.encode("latin-1"), expected)
+        # 0 — токен без exp
+        or not expires.isdigit()
+        or 0 < int(expires) <= time.time()
+    ):
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Missing or invalid gateway identity",
+        )
+    try:
+        permissions = decode_permissions(perms)
+        role = decode_role(role)
+    except ValueError:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Missing or invalid gateway identity",
+        )
+    payload = {"sub": user_id, "role": role, **permissions}
+    if token_id:
+        payload["jti"] = token_id
+    return payload
+
+
+def clear_caches():
+    _decoded_perms.clear()
+    _headers_by_jti.clear()
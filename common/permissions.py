@@ -0,0 +1,93 @@
+import logging
+from typing import Optional
+
+import redis.asyncio as redis
+
+from . import redis_config
+from .metrics import metrics
+from .role_table import GUEST_PERMISSIONS
+
+logger = logging.getLogger(__name__)
+
+
+def _embedded(payload: dict) -> dict:
+    return {
+        "role": payload.get("role", "guest"),
+        "g_perms": payload.get("g_perms", {}),
+        "access": payload.get("access", {}),
+    }
+
+
+def _compact(payload: dict) -> Optional[dict]:
+    dictionary = redis_config.resource_dictionary
+    try:
+        permissions = dictionary.decode(payload)
+    except ValueError as exc:
+        # Подпись верна, но claim не разбирается — прав нет
+        logger.warning("Compact token permissions rejected: %s", exc)
+        metrics.inc("compact_permissions_invalid_total")
+        return {**GUEST_PERMISSIONS, "role": payload.get("role", "guest")}
+    if permissions is None and dictionary.is_unknown(payload):
+        # Прошлый sync уже не нашел эпоху/индекс токена — не ходим в Redis снова
+        metrics.inc("compact_permissions_unknown_total")
+        return {**GUEST_PERMISSIONS, "role": payload.get("role", "guest")}
+    return permissions
+
+
+def resolve_permissions_local(payload: dict) -> Optional[dict]:
+    """
+    Права из токена без сетевых обращений: {"role", "g_perms", "access"}.
+    None — токен в режиме role_ref, а локальная таблица ролей не знает
+    нужную версию роли, или компактный токен ссылается на ресурсы,
+    которых еще нет в локальном словаре (см. resolve_permissions).
+    """
+    if "pm" in payload:
+        return _compact(payload)
+    if "rid" not in payload:
+        return _embedded(payload)
+    role_id = payload["rid"]
+    if role_id is None:
+        return GUEST_PERMISSIONS
+    return redis_config.role_table.get(role_id, min_version=payload.get("rv", 0))
+
+
+async def resolve_permissions(payload: dict) -> dict:
+    """
+    Права пользователя для проверки доступа.
+    - embedded-токен: g_perms/access из самого токена;
+    - role_ref-токен (rid/rv): актуальные права роли из локальной RoleTable.
+      Если таблица отстала от версии в токене, роль читается из Redis
+      (при недоступном Redis — последняя известная версия, иначе RedisError).
+    - компактный токен (gp/pm): маски по индексам словаря ресурсов; если
+      словарь отстал, он перечитывается из Redis (RedisError — наверх).
+      Эпоха/индекс, которых нет и после перечитывания, запоминаются — GUEST без sync.
+    """
+    permissions = resolve_permissions_local(payload)
+    if permissions is not None:
+        return permissions
+
+    if "pm" in payload:
+        await redis_config.redis_breaker.call(
+            redis_config.resource_dictionary.sync, redis_config.redis_client
+        )
+        permissions = _compact(payload)
+        if permissions is None:
+            # Индекса нет даже в Redis (другая эпоха словаря) — прав нет;
+            # запоминаем, чтобы следующие запросы с этим токеном не делали sync
+            redis_config.resource_dictionary.mark_unknown(payload)
+            metrics.inc("compact_permissions_unknown_total")
+            return {**GUEST_PERMISSIONS, "role": payload.get("role", "guest")}
+        return permissions
+
+    table = redis_config.role_table
+    role_id = payload["rid"]
+    try:
+        permissions = await redis_config.redis_breaker.call(
+            table.fetch, redis_config.redis_client, role_id
+        )
+    except redis.RedisError:
+        permissions = table.get(role_id)
+        if permissions is None:
+            raise
+    # Роли нет даже в Redis — прав нет
+    return permissions if permissions is not None else GUEST_PERMISSIONS
@@ -0,0 +1,89 @@
+import asyncio
+import os
+from typing import Any, Callable, List, Optional, Set, Tuple
+
+import redis.asyncio as redis
+
+from .metrics import metrics
+
+# 0 -> отправляем на следующей итерации event loop (склеиваются только
+# запросы, пришедшие в одном "тике"), >0 -> ждем окно в миллисекундах.
+REDIS_BATCH_WINDOW_MS = float(os.getenv("REDIS_BATCH_WINDOW_MS", 0))
+REDIS_BATCH_MAX_KEYS = int(os.getenv("REDIS_BATCH_MAX_KEYS", 128))
+
+
+class CommandBatcher:
+    """
+    Склеивает одиночные read-команды Redis (EXISTS, GET, HEXISTS, ...)
+    от конкурентных запросов в один pipeline.
+    Батч уходит, когда истекло окно window_ms или набралось max_batch команд;
+    каждый вызывающий получает результат своей команды (или свою ошибку).
+    """
+
+    def __init__(
+        self,
+        client_getter: Callable[[], redis.Redis],
+        window_ms: float = REDIS_BATCH_WINDOW_MS,
+        max_batch: int = REDIS_BATCH_MAX_KEYS,
+    ):
+        self._client_getter = client_getter
+        self.window_ms = window_ms
+        self.max_batch = max(max_batch, 1)
+        self._pending: List[Tuple[str, tuple, asyncio.Future]] = []
+        self._flush_handle: Optional[asyncio.Handle] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        # Ссылки на отправляемые батчи, чтобы задачи не собрал GC
+        self._inflight: Set[asyncio.Task] = set()
+
+    async def submit(self, command: str, *args) -> Any:
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            # Новый event loop (тесты, перезапуск) — старое состояние не валидно
+            self._pending = []
+            self._flush_handle = None
+            self._loop = loop
+
+        future = loop.create_future()
+        self._pending.append((command, args, future))
+
+        if len(self._pending) >= self.max_batch:
+            self._flush()
+        elif self._flush_handle is None:
+            if self.window_ms > 0:
+                self._flush_handle = loop.call_later(self.window_ms / 1000, self._flush)
+            else:
+                self._flush_handle = loop.call_soon(self._flush)
+
+        return await future
+
+    def _flush(self):
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+        batch, self._pending = self._pending, []
+        if batch:
+            task = asyncio.ensure_future(self._execute(batch))
+            self._inflight.add(task)
+            task.add_done_callback(self._inflight.discard)
+
+    async def _execute(self, batch: List[Tuple[str, tuple, asyncio.Future]]):
+        metrics.inc("redis_batches_total")
+        metrics.observe("redis_batch_size", len(batch))
+        try:
+            async with self._client_getter().pipeline(transaction=False) as pipe:
+                for command, args, _ in batch:
+                    getattr(pipe, command)(*args)
+                results = await pipe.execute(raise_on_error=False)
+        except Exception as exc:
+            for _, _, future in batch:
+                if not future.done():
+                    future.set_exception(exc)
+            return
+
+        for (_, _, future), result in zip(batch, results):
+            if future.done():
+                continue
+            if isinstance(result, Exception):
+                future.set_exception(result)
+            else:
+                future.set_result(result)
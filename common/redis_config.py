@@ -1,5 +1,27 @@
+import asyncio
+import logging
 import redis.asyncio as redis
 import os
+from typing import Dict, List, Optional, Sequence, Tuple
+from . import blacklist_storage as storage
+from .metrics import metrics
+from .revocation_filter import RevocationFilter, REVOCATION_CHANNEL, USER_GENERATION_CHANNEL
+from .redis_batcher import CommandBatcher
+from .circuit_breaker import CircuitBreaker, UNAVAILABLE_ERRORS
+from .role_table import RoleTable
+from .compact_permissions import ResourceDictionary
+
+# Таймауты: при недоступном Redis запрос не должен висеть секундами
+REDIS_SOCKET_TIMEOUT = float(os.getenv("REDIS_SOCKET_TIMEOUT", 1.0))
+REDIS_CONNECT_TIMEOUT = float(os.getenv("REDIS_CONNECT_TIMEOUT", 0.5))
+
+# Что делать с проверкой отзыва, когда Redis недоступен (breaker открыт):
+#   fail_closed — 503, как раньше;
+#   snapshot    — отвечаем по последнему снимку фильтра отзывов и кэшу поколений,
+#                 пока он не старше REDIS_DEGRADED_MAX_STALENESS, иначе 503;
+#   fail_open   — считаем токен неотозванным (только для некритичных окружений!).
+REDIS_DEGRADED_POLICY = os.getenv("REDIS_DEGRADED_POLICY", "fail_closed")
+REDIS_DEGRADED_MAX_STALENESS = float(os.getenv("REDIS_DEGRADED_MAX_STALENESS", 300))
 
 # Create an async redis client
 # Note: decode_responses=True converts bytes to strings automatically
@@ -8,15 +30,262 @@ redis_client = redis.Redis(
     port=int(os.getenv("REDIS_PORT", 6379)),
     db=int(os.getenv("REDIS_DB", 0)),
     password=os.getenv("REDIS_PASSWORD"),
+    socket_timeout=REDIS_SOCKET_TIMEOUT,
+    socket_connect_timeout=REDIS_CONNECT_TIMEOUT,
     decode_responses=True
 )
 
-async def add_token_to_blacklist(jti: str, expire_seconds: int):
-    async with redis_client.client() as conn:
-        # Use await because this is now an async call
-        await conn.setex(f"blacklist:{jti}", expire_seconds, "true")
+logger = logging.getLogger(__name__)
+
+# Все обращения к redis_client идут через breaker: после серии сетевых
+# ошибок запросы сразу получают CircuitOpenError, а не ждут таймаута.
+redis_breaker = CircuitBreaker("redis", probe=lambda: redis_client.ping())
+
+# Локальный фильтр отозванных токенов (см. revocation_filter.py)
+revocation_filter = RevocationFilter()
+
+# Локальная таблица ролей для токенов в режиме role_ref (см. role_table.py)
+role_table = RoleTable()
+
+# Словарь ресурсов для компактных токенов (см. compact_permissions.py)
+resource_dictionary = ResourceDictionary()
+
+# Склеивание одиночных проверок от конкурентных запросов в один pipeline
+# (lambda, чтобы всегда брать актуальный redis_client модуля)
+lookup_batcher = CommandBatcher(lambda: redis_client)
+
+
+async def start_revocation_filter():
+    """Запускает синхронизацию фильтра (вызывать в lifespan сервиса)."""
+    # lambda, чтобы всегда брать актуальный redis_client модуля
+    await revocation_filter.start(lambda: redis_client)
+
+
+async def stop_revocation_filter():
+    await revocation_filter.stop()
+    await redis_breaker.stop()
+
+
+async def start_role_table():
+    """Загрузка и синхронизация таблицы ролей (нужна только при role_ref токенах)."""
+    await role_table.start(lambda: redis_client)
+
+
+async def stop_role_table():
+    await role_table.stop()
+
+
+def _degraded(kind: str, exc: redis.RedisError):
+    """
+    Решает, можно ли ответить без Redis по текущей политике:
+    если нельзя (fail_closed, нет снимка или он слишком старый) — пробрасывает exc.
+    """
+    policy = REDIS_DEGRADED_POLICY
+    if policy == "snapshot":
+        age = revocation_filter.snapshot_age()
+        if age is None or age > REDIS_DEGRADED_MAX_STALENESS:
+            raise exc
+    elif policy != "fail_open":
+        raise exc
+    metrics.inc("redis_degraded_answers_total", labels={"check": kind, "policy": policy})
+
+
+async def add_token_to_blacklist(jti: str, expire_seconds: int, exp: Optional[float] = None):
+    # Запись и уведомление остальных процессов — один round trip
+    async with redis_client.pipeline(transaction=False) as pipe:
+        if storage.use_buckets():
+            token_exp = storage.resolve_exp(expire_seconds, exp)
+            key = storage.bucket_key(token_exp)
+            pipe.hset(key, storage.encode_jti(jti), "1")
+            pipe.expireat(key, storage.bucket_expire_at(token_exp))
+        else:
+            pipe.set(storage.legacy_key(jti), "true", ex=expire_seconds)
+        pipe.publish(REVOCATION_CHANNEL, jti)
+        # Отзыв без Redis невозможен ни в одной политике — ошибка уходит наверх
+        await redis_breaker.call(pipe.execute)
+    revocation_filter.add(jti)
+
+async def consume_token_once(jti: str, expire_seconds: int, exp: Optional[float] = None) -> bool:
+    """
+    Атомарно проверяет и отзывает JTI одной командой (SET NX EX / HSETNX).
+    True  -> токен не был отозван и теперь израсходован (ротация разрешена);
+    False -> токен уже был отозван/использован.
+    Два конкурентных вызова с одним JTI не могут оба получить True.
+    """
+    async with redis_client.pipeline(transaction=False) as pipe:
+        if storage.use_buckets():
+            token_exp = storage.resolve_exp(expire_seconds, exp)
+            key = storage.bucket_key(token_exp)
+            pipe.hsetnx(key, storage.encode_jti(jti), "1")
+            pipe.expireat(key, storage.bucket_expire_at(token_exp))
+            if storage.BLACKLIST_LEGACY_READ:
+                pipe.exists(storage.legacy_key(jti))
+        else:
+            pipe.set(storage.legacy_key(jti), "true", ex=max(expire_seconds, 1), nx=True)
+        pipe.publish(REVOCATION_CHANNEL, jti)
+        results = await redis_breaker.call(pipe.execute)
+    revocation_filter.add(jti)
+
+    created = bool(results[0])
+    if storage.use_buckets() and storage.BLACKLIST_LEGACY_READ:
+        created = created and not results[2]
+    return created
+
+async def is_token_blacklisted(jti: str, exp: Optional[float] = None) -> bool:
+    """
+    exp — срок действия токена: нужен, чтобы найти окно в режиме buckets.
+    Без exp проверяется только исходный формат blacklist:{jti}.
+    """
+    # Фильтр без ложноотрицательных ответов: "нет" можно не проверять в Redis
+    if not revocation_filter.might_contain(jti):
+        metrics.inc("revocation_filter_negative_total")
+        return False
+
+    # Команды уходят в общем pipeline вместе с проверками соседних запросов
+    checks = []
+    if storage.use_buckets() and exp is not None:
+        checks.append(redis_breaker.call(
+            lookup_batcher.submit, "hexists", storage.bucket_key(exp), storage.encode_jti(jti)
+        ))
+    if not storage.use_buckets() or storage.BLACKLIST_LEGACY_READ or exp is None:
+        checks.append(redis_breaker.call(
+            lookup_batcher.submit, "exists", storage.legacy_key(jti)
+        ))
+    try:
+        results = await asyncio.gather(*checks)
+    except UNAVAILABLE_ERRORS as exc:
+        _degraded("blacklist", exc)
+        # Bloom filter: "возможно отозван" в degraded-режиме считаем отозванным
+        return REDIS_DEGRADED_POLICY == "snapshot" and revocation_filter.snapshot_contains(jti)
+    return any(bool(r) for r in results)
+
+
+async def get_user_generation(user_id: str) -> int:
+    """
+    Текущее поколение токенов пользователя. Токены с меньшим "gen" отозваны.
+    Читается из локального кэша; Redis — только при промахе.
+    """
+    generations = revocation_filter.generations
+    cached = generations.get(user_id, synced=revocation_filter.ready)
+    if cached is not None:
+        return cached
+
+    # Снимаем версию до GET: инвалидация во время запроса отменит запись в кэш
+    version = generations.version
+    try:
+        value = await redis_breaker.call(lookup_batcher.submit, "get", f"user_gen:{user_id}")
+    except UNAVAILABLE_ERRORS as exc:
+        _degraded("generation", exc)
+        last_known = generations.last_known(user_id)
+        if last_known is None and REDIS_DEGRADED_POLICY == "snapshot":
+            # Поколение пользователя не встречалось — отвечать не по чему
+            raise exc
+        return last_known or 0
+    generation = int(value or 0)
+    generations.set(user_id, generation, version)
+    return generation
+
+async def are_tokens_revoked(
+    tokens: Sequence[Tuple[Optional[str], Optional[float], Optional[str], Optional[int]]],
+) -> List[bool]:
+    """
+    Пакетный аналог is_token_blacklisted + проверки поколения для списка
+    (jti, exp, sub, gen). Все проверки, которые не отсек фильтр отзывов и
+    кэш поколений, уходят в Redis одним pipeline (не более одного round trip).
+    """
+    generations = revocation_filter.generations
+    synced = revocation_filter.ready
+    # Позиции ответов pipeline: для каждого токена — индексы его проверок отзыва
+    blacklist_slots: List[List[int]] = []
+    # user_id -> индекс GET user_gen:{id} (по одному на пользователя)
+    generation_slots: Dict[str, int] = {}
+    known_generations: Dict[str, int] = {}
+    commands: List[tuple] = []
+
+    for jti, exp, user_id, generation in tokens:
+        slots = []
+        if jti and revocation_filter.might_contain(jti):
+            if storage.use_buckets() and exp is not None:
+                slots.append(len(commands))
+                commands.append(("hexists", storage.bucket_key(exp), storage.encode_jti(jti)))
+            if not storage.use_buckets() or storage.BLACKLIST_LEGACY_READ or exp is None:
+                slots.append(len(commands))
+                commands.append(("exists", storage.legacy_key(jti)))
+        elif jti:
+            metrics.inc("revocation_filter_negative_total")
+        blacklist_slots.append(slots)
+
+        if generation is not None and user_id not in known_generations and user_id not in generation_slots:
+            cached = generations.get(user_id, synced=synced)
+            if cached is not None:
+                known_generations[user_id] = cached
+            else:
+                generation_slots[user_id] = len(commands)
+                commands.append(("get", f"user_gen:{user_id}"))
+
+    results: Optional[list] = None
+    version = generations.version
+    if commands:
+        try:
+            async with redis_client.pipeline(transaction=False) as pipe:
+                for command, *args in commands:
+                    getattr(pipe, command)(*args)
+                results = await redis_breaker.call(pipe.execute)
+        except UNAVAILABLE_ERRORS as exc:
+            _degraded("blacklist", exc)
+            for user_id in generation_slots:
+                last_known = generations.last_known(user_id)
+                if last_known is None and REDIS_DEGRADED_POLICY == "snapshot":
+                    raise exc
+                known_generations[user_id] = last_known or 0
+        else:
+            for user_id, slot in generation_slots.items():
+                known_generations[user_id] = int(results[slot] or 0)
+                generations.set(user_id, known_generations[user_id], version)
+
+    revoked = []
+    for (jti, _, user_id, generation), slots in zip(tokens, blacklist_slots):
+        if not slots:
+            blacklisted = False
+        elif results is not None:
+            blacklisted = any(bool(results[slot]) for slot in slots)
+        else:
+            # Degraded-режим: как в is_token_blacklisted
+            blacklisted = REDIS_DEGRADED_POLICY == "snapshot" and revocation_filter.snapshot_contains(jti)
+        revoked.append(
+            blacklisted or (generation is not None and generation < known_generations[user_id])
+        )
+    return revoked
+
+
+async def bump_user_generation(user_id: str) -> int:
+    """
+    Отзывает ВСЕ токены пользователя одной записью (INCR),
+    остальные процессы сбрасывают кэш по pub/sub.
+    """
+    async with redis_client.pipeline(transaction=False) as pipe:
+        pipe.incr(f"user_gen:{user_id}")
+        pipe.publish(USER_GENERATION_CHANNEL, user_id)
+        generation, _ = await redis_breaker.call(pipe.execute)
+    revocation_filter.generations.set(user_id, int(generation))
+    return int(generation)
+
 
-async def is_token_blacklisted(jti: str) -> bool:
-    # Use await to check existence
-    exists = await redis_client.exists(f"blacklist:{jti}")
-    return exists > 0
\ No newline at end of file
+async def check_eviction_policy() -> Optional[str]:
+    """
+    Отзывы не должны вытесняться при нехватке памяти: с allkeys-*/volatile-*
+    Redis молча удалит запись blacklist и отозванный токен снова станет валидным.
+    Возвращает текущую политику (None, если CONFIG недоступен).
+    """
+    try:
+        config = await redis_client.config_get("maxmemory-policy")
+    except redis.RedisError:
+        return None
+    policy = config.get("maxmemory-policy")
+    if policy and policy != "noeviction":
+        metrics.set_gauge("redis_eviction_unsafe", 1)
+        logger.warning(
+            "Redis maxmemory-policy is %r: revocations may be evicted. Use 'noeviction'.",
+            policy,
+        )
+    return policy
@@ -0,0 +1,115 @@
+import re
+from typing import Dict, List, Optional, Sequence, Tuple
+
+# Ресурсы иерархические: сегменты через "." (":" принимается как синоним),
+# например "farms.sensors.readings". В правилах роли сегмент может быть:
+#   "*"  — ровно один любой сегмент ("farms.*" -> "farms.north", но не "farms");
+#   "**" — только последним: ноль и более сегментов ("farms.**" -> "farms",
+#          "farms.north", "farms.north.sensors").
+# Если ресурсу подходят несколько правил, действует самое конкретное:
+# точное совпадение, затем литеральный сегмент раньше "*", "*" раньше "**".
+SEPARATOR = "."
+ONE = "*"
+ANY = "**"
+
+_SEGMENT = re.compile(r"^[A-Za-z0-9_-]+$")
+# Сколько скомпилированных карт прав держать (по карте на роль/токен)
+_CACHE_SIZE = 4096
+
+
+def split_resource(resource: str) -> List[str]:
+    return resource.replace(":", SEPARATOR).split(SEPARATOR)
+
+
+def normalize_pattern(pattern: str) -> str:
+    """Каноническая запись правила; ValueError — недопустимый шаблон."""
+    segments = split_resource(pattern.strip())
+    for position, segment in enumerate(segments):
+        if segment == ANY and position != len(segments) - 1:
+            raise ValueError(f"'**' must be the last segment: {pattern!r}")
+        if segment not in (ONE, ANY) and not _SEGMENT.match(segment):
+            raise ValueError(f"Invalid resource segment {segment!r} in {pattern!r}")
+    return SEPARATOR.join(segments)
+
+
+def is_pattern(resource: str) -> bool:
+    return ONE in resource
+
+
+class _Node:
+    __slots__ = ("children", "rules", "rest")
+
+    def __init__(self):
+        self.children: Dict[str, "_Node"] = {}
+        # Права правила, заканчивающегося в этом узле
+        self.rules: Optional[dict] = None
+        # Права правила "<путь до узла>.**"
+        self.rest: Optional[dict] = None
+
+
+class PermissionTrie:
+    """
+    Шаблонные правила роли, собранные в дерево по сегментам: проверка
+    ресурса стоит O(глубина пути), а не O(число правил).
+    Точные (без "*") правила сюда не входят — их находит обычный dict lookup.
+    """
+
+    def __init__(self, access: dict):
+        self._root = _Node()
+        for pattern, rules in access.items():
+            if not is_pattern(pattern):
+                continue
+            node = self._root
+            segments = split_resource(pattern)
+            for segment in segments[:-1]:
+                node = node.children.setdefault(segment, _Node())
+            if segments[-1] == ANY:
+                node.rest = rules
+            else:
+                node = node.children.setdefault(segments[-1], _Node())
+                node.rules = rules
+
+    def match(self, segments: Sequence[str]) -> Optional[dict]:
+        return self._match(self._root, segments, 0)
+
+    def _match(self, node: _Node, segments: Sequence[str], position: int) -> Optional[dict]:
+        if position == len(segments):
+            return node.rules if node.rules is not None else node.rest
+        for key in (segments[position], ONE):
+            child = node.children.get(key)
+            if child is not None:
+                rules = self._match(child, segments, position + 1)
+                if rules is not None:
+                    return rules
+        return node.rest
+
+
+# id(access) -> (access, trie или None); сам access держим, чтобы id не переиспользовался
+_compiled: Dict[int, Tuple[dict, Optional[PermissionTrie]]] = {}
+
+
+def compiled(access: dict) -> Optional[PermissionTrie]:
+    """
+    Дерево шаблонов для карты прав (None — шаблонов нет).
+    Карты прав переиспользуются между запросами (token_cache, кэш
+    компактных прав, таблица ролей), поэтому компиляция — одна на карту.
+    """
+    entry = _compiled.get(id(access))
+    if entry is not None and entry[0] is access:
+        return entry[1]
+    trie = PermissionTrie(access) if any(is_pattern(key) for key in access) else None
+    if len(_compiled) >= _CACHE_SIZE:
+        del _compiled[next(iter(_compiled))]
+    _compiled[id(access)] = (access, trie)
+    return trie
+
+
+def match_resource(access: dict, resource: str, segments: Optional[Sequence[str]] = None) -> Optional[dict]:
+    """Права на ресурс: точное правило или самое конкретное шаблонное."""
+    rules = access.get(resource)
+    if rules is not None:
+        return rules
+    trie = compiled(access)
+    if trie is None:
+        return None
+    return trie.match(segments if segments is not None else split_resource(resource))
@@ -0,0 +1,269 @@
+import asyncio
+import hashlib
+import logging
+import math
+import os
+import time
+from collections import OrderedDict
+from typing import Callable, Iterable, Optional, Tuple, Union
+
+import redis.asyncio as redis
+from redis.client import NEVER_DECODE
+
+from . import blacklist_storage as storage
+from .metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+REVOCATION_FILTER_ENABLED = os.getenv("REVOCATION_FILTER_ENABLED", "true").lower() == "true"
+# Расчетное число отозванных токенов и допустимая доля ложных срабатываний
+REVOCATION_FILTER_CAPACITY = int(os.getenv("REVOCATION_FILTER_CAPACITY", 1_000_000))
+REVOCATION_FILTER_ERROR_RATE = float(os.getenv("REVOCATION_FILTER_ERROR_RATE", 0.001))
+# Bloom filter не умеет удалять: периодически пересобираем его из Redis,
+# чтобы выкинуть истекшие отзывы.
+REVOCATION_FILTER_REBUILD_SECONDS = int(os.getenv("REVOCATION_FILTER_REBUILD_SECONDS", 600))
+
+# Локальный кэш поколений токенов пользователя (user_gen:{id}).
+# Пока pub/sub жив, запись валидна долго; без него — короткий TTL.
+USER_GEN_CACHE_TTL = float(os.getenv("USER_GEN_CACHE_TTL", 60))
+USER_GEN_CACHE_STALE_TTL = float(os.getenv("USER_GEN_CACHE_STALE_TTL", 5))
+USER_GEN_CACHE_MAX_ENTRIES = int(os.getenv("USER_GEN_CACHE_MAX_ENTRIES", 100_000))
+
+REVOCATION_CHANNEL = "blacklist:events"
+USER_GENERATION_CHANNEL = "user_gen:events"
+
+
+class BloomFilter:
+    """Классический Bloom filter на bytearray с double hashing (BLAKE2b)."""
+
+    def __init__(self, capacity: int, error_rate: float):
+        capacity = max(capacity, 1)
+        self.size = max(8, int(-capacity * math.log(error_rate) / (math.log(2) ** 2)))
+        self.hash_count = max(1, round(self.size / capacity * math.log(2)))
+        self._bits = bytearray((self.size + 7) // 8)
+        self.count = 0
+
+    def _positions(self, item: Union[str, bytes]):
+        if isinstance(item, str):
+            item = item.encode("utf-8")
+        digest = hashlib.blake2b(item, digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], "little")
+        h2 = int.from_bytes(digest[8:], "little") | 1
+        for i in range(self.hash_count):
+            yield (h1 + i * h2) % self.size
+
+    def add(self, item: Union[str, bytes]):
+        for pos in self._positions(item):
+            self._bits[pos >> 3] |= 1 << (pos & 7)
+        self.count += 1
+
+    def __contains__(self, item: Union[str, bytes]) -> bool:
+        return all(self._bits[pos >> 3] & (1 << (pos & 7)) for pos in self._positions(item))
+
+
+class GenerationCache:
+    """
+    LRU-кэш user_id -> текущее поколение токенов пользователя.
+    Заполнение после чтения из Redis передает version, снятую до чтения:
+    если за время запроса пришла инвалидация (bump в другом процессе),
+    прочитанное значение могло устареть и в кэш не попадает.
+    """
+
+    def __init__(
+        self,
+        ttl: float = USER_GEN_CACHE_TTL,
+        stale_ttl: float = USER_GEN_CACHE_STALE_TTL,
+        max_entries: int = USER_GEN_CACHE_MAX_ENTRIES,
+    ):
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, Tuple[int, float]]" = OrderedDict()
+        # Растет при каждой инвалидации/очистке
+        self.version = 0
+
+    def get(self, user_id: str, synced: bool) -> Optional[int]:
+        entry = self._entries.get(user_id)
+        if entry is None:
+            return None
+        generation, stored_at = entry
+        max_age = self.ttl if synced else self.stale_ttl
+        if time.monotonic() - stored_at > max_age:
+            # Не удаляем: устаревшее значение еще пригодится в degraded-режиме
+            return None
+        self._entries.move_to_end(user_id)
+        return generation
+
+    def last_known(self, user_id: str) -> Optional[int]:
+        """Последнее известное поколение без учета TTL (для degraded-режима)."""
+        entry = self._entries.get(user_id)
+        return entry[0] if entry is not None else None
+
+    def set(self, user_id: str, generation: int, version: Optional[int] = None):
+        """version — значение self.version до чтения generation из Redis."""
+        if version is not None and version != self.version:
+            return
+        # Поколение только растет: запоздавший ответ не откатывает bump
+        entry = self._entries.get(user_id)
+        if entry is not None and entry[0] > generation:
+            generation = entry[0]
+        self._entries[user_id] = (generation, time.monotonic())
+        self._entries.move_to_end(user_id)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def invalidate(self, user_id: str):
+        self.version += 1
+        self._entries.pop(user_id, None)
+
+    def clear(self):
+        self.version += 1
+        self._entries.clear()
+
+
+class RevocationFilter:
+    """
+    Локальный (per-process) фильтр отозванных JTI перед Redis blacklist.
+    - might_contain(jti) == False  -> токен точно не отозван, Redis не нужен;
+    - might_contain(jti) == True   -> возможно отозван, спрашиваем Redis.
+    Новые отзывы приходят через Redis pub/sub (канал REVOCATION_CHANNEL).
+    После каждого (пере)подключения делается полный resync через SCAN.
+    Пока фильтр не синхронизирован (ready=False), все проверки идут в Redis.
+    Тот же подписчик сбрасывает записи generations по USER_GENERATION_CHANNEL.
+    """
+
+    def __init__(
+        self,
+        capacity: int = REVOCATION_FILTER_CAPACITY,
+        error_rate: float = REVOCATION_FILTER_ERROR_RATE,
+        rebuild_seconds: int = REVOCATION_FILTER_REBUILD_SECONDS,
+        enabled: bool = REVOCATION_FILTER_ENABLED,
+    ):
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self.rebuild_seconds = rebuild_seconds
+        self.enabled = enabled
+        self.ready = False
+        # Момент потери синхронизации (None — снимка еще не было или он актуален)
+        self.stale_since: Optional[float] = None
+        self.loaded = False
+        self._bloom = BloomFilter(capacity, error_rate)
+        self.generations = GenerationCache()
+        self._task: Optional[asyncio.Task] = None
+
+    def might_contain(self, jti: str) -> bool:
+        if not (self.enabled and self.ready):
+            return True
+        return storage.encode_jti(jti) in self._bloom
+
+    def add(self, jti: str):
+        self._bloom.add(storage.encode_jti(jti))
+
+    def snapshot_age(self) -> Optional[float]:
+        """
+        Сколько секунд фильтр не получает события (0 — синхронизирован).
+        None — снимка нет, отвечать по нему нельзя.
+        """
+        if not (self.enabled and self.loaded):
+            return None
+        if self.ready:
+            return 0.0
+        return time.monotonic() - (self.stale_since or time.monotonic())
+
+    def snapshot_contains(self, jti: str) -> bool:
+        """Ответ по последнему известному снимку, даже если он устарел."""
+        return storage.encode_jti(jti) in self._bloom
+
+    def _mark_stale(self):
+        if self.ready or self.stale_since is None:
+            self.stale_since = time.monotonic()
+        self.ready = False
+
+    def load(self, jtis: Iterable[Union[str, bytes]]):
+        """
+        Полностью заменяет содержимое фильтра и помечает его готовым.
+        jtis — строки JTI или уже закодированные storage.encode_jti() байты.
+        """
+        bloom = BloomFilter(self.capacity, self.error_rate)
+        for jti in jtis:
+            bloom.add(jti if isinstance(jti, bytes) else storage.encode_jti(jti))
+        self._bloom = bloom
+        self.ready = True
+        self.loaded = True
+        self.stale_since = None
+        metrics.set_gauge("revocation_filter_entries", bloom.count)
+        metrics.inc("revocation_filter_resyncs_total")
+
+    async def resync(self, client: redis.Redis):
+        # События о поколениях могли быть пропущены — начинаем с чистого кэша
+        self.generations.clear()
+        jtis = []
+        async for key in client.scan_iter(match=f"{storage.KEY_PREFIX}*", count=1000):
+            if key.startswith(storage.BUCKET_PREFIX):
+                # Поля bucket-хэшей бинарные: читаем их без декодирования
+                cursor = 0
+                while True:
+                    cursor, fields = await client.execute_command(
+                        "HSCAN", key, cursor, "COUNT", 1000, **{NEVER_DECODE: True}
+                    )
+                    jtis.extend(fields.keys())
+                    if not int(cursor):
+                        break
+            else:
+                jtis.append(key[len(storage.KEY_PREFIX):])
+        self.load(jtis)
+
+    async def start(self, client_getter: Callable[[], redis.Redis]):
+        if not self.enabled or self._task is not None:
+            return
+        self._task = asyncio.create_task(self._run(client_getter))
+
+    async def stop(self):
+        self._mark_stale()
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self, client_getter: Callable[[], redis.Redis]):
+        backoff = 0.5
+        while True:
+            client = client_getter()
+            pubsub = client.pubsub()
+            try:
+                # Сначала подписка, потом SCAN: события, пришедшие во время
+                # resync, ждут в буфере pubsub и применяются к новому фильтру.
+                await pubsub.subscribe(REVOCATION_CHANNEL, USER_GENERATION_CHANNEL)
+                await self.resync(client)
+                backoff = 0.5
+                rebuild_at = time.monotonic() + self.rebuild_seconds
+
+                while True:
+                    message = await pubsub.get_message(
+                        ignore_subscribe_messages=True, timeout=1.0
+                    )
+                    if message is not None and message["type"] == "message":
+                        if message["channel"] == USER_GENERATION_CHANNEL:
+                            self.generations.invalidate(message["data"])
+                        else:
+                            self.add(message["data"])
+                    if time.monotonic() >= rebuild_at:
+                        await self.resync(client)
+                        rebuild_at = time.monotonic() + self.rebuild_seconds
+            except asyncio.CancelledError:
+                raise
+            except (redis.RedisError, OSError) as exc:
+                # Потеряли соединение: до resync проверяем все через Redis
+                self._mark_stale()
+                metrics.inc("revocation_filter_disconnects_total")
+                logger.warning("Revocation filter lost Redis connection: %s", exc)
+                await asyncio.sleep(backoff)
+                backoff = min(backoff * 2, 30)
+            finally:
+                try:
+                    await pubsub.aclose()
+                except Exception:
+                    pass
@@ -0,0 +1,164 @@
+import asyncio
+import json
+import logging
+import os
+import time
+from typing import Callable, Dict, Optional, Tuple
+
+import redis.asyncio as redis
+
+from .metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+# Формат прав в access token:
+#   embedded — g_perms/access целиком в токене (исходный формат);
+#   role_ref — только rid (id роли) и rv (версия роли), права берутся
+#              из локальной таблицы ролей (RoleTable) в каждом сервисе;
+#   compact  — права в токене, но индексами словаря ресурсов и битовыми
+#              масками (см. compact_permissions.py).
+TOKEN_PERMISSION_MODE = os.getenv("TOKEN_PERMISSION_MODE", "embedded")
+# Полная пересинхронизация таблицы (страховка от пропущенных событий)
+ROLE_TABLE_RESYNC_SECONDS = int(os.getenv("ROLE_TABLE_RESYNC_SECONDS", 300))
+
+# HASH role_id -> JSON {"v": version, "fragment": {"role", "g_perms", "access"}}
+ROLE_TABLE_KEY = "role_table"
+ROLE_TABLE_CHANNEL = "role_table:events"
+
+# Права пользователя без роли / с удаленной ролью
+GUEST_PERMISSIONS = {
+    "role": "guest",
+    "g_perms": {"r_all": False, "w_all": False},
+    "access": {},
+}
+
+
+def use_role_refs() -> bool:
+    return TOKEN_PERMISSION_MODE == "role_ref"
+
+
+async def store_role(client: redis.Redis, role_id: str, version: int, fragment: Optional[dict]) -> bool:
+    """
+    Записывает роль в общую таблицу и оповещает процессы.
+    fragment=None — роль удалена. Запись с версией не новее текущей
+    игнорируется (WATCH/MULTI), поэтому конкурентные правки не откатят друг друга.
+    """
+    async with client.pipeline(transaction=True) as pipe:
+        while True:
+            try:
+                await pipe.watch(ROLE_TABLE_KEY)
+                current = await pipe.hget(ROLE_TABLE_KEY, role_id)
+                if current is not None and json.loads(current)["v"] >= version:
+                    await pipe.reset()
+                    return False
+                pipe.multi()
+                pipe.hset(ROLE_TABLE_KEY, role_id, json.dumps({"v": version, "fragment": fragment}))
+                pipe.publish(ROLE_TABLE_CHANNEL, role_id)
+                await pipe.execute()
+                return True
+            except redis.WatchError:
+                continue
+
+
+class RoleTable:
+    """
+    Локальная (per-process) копия таблицы ролей для токенов в режиме role_ref:
+    role_id -> (version, fragment). Загружается целиком (HGETALL) при старте
+    и после переподключения, далее обновляется по событиям ROLE_TABLE_CHANNEL.
+    Проверка прав по ней — без сетевых обращений.
+    """
+
+    def __init__(self, resync_seconds: int = ROLE_TABLE_RESYNC_SECONDS):
+        self.resync_seconds = resync_seconds
+        self.ready = False
+        self._roles: Dict[str, Tuple[int, Optional[dict]]] = {}
+        self._task: Optional[asyncio.Task] = None
+
+    def get(self, role_id: str, min_version: int = 0) -> Optional[dict]:
+        """
+        Фрагмент прав роли; None — в таблице нет записи версии >= min_version
+        (таблица отстала от токена), нужно спросить Redis.
+        Удаленная роль отдается как GUEST_PERMISSIONS.
+        """
+        entry = self._roles.get(role_id)
+        if entry is None or entry[0] < min_version:
+            return None
+        return entry[1] if entry[1] is not None else GUEST_PERMISSIONS
+
+    def set(self, role_id: str, version: int, fragment: Optional[dict]):
+        current = self._roles.get(role_id)
+        if current is None or version >= current[0]:
+            self._roles[role_id] = (version, fragment)
+
+    def apply(self, role_id: str, raw: Optional[str]):
+        if raw is not None:
+            stored = json.loads(raw)
+            self.set(role_id, stored["v"], stored["fragment"])
+
+    async def fetch(self, client: redis.Redis, role_id: str) -> Optional[dict]:
+        """Чтение одной роли из Redis (таблица не готова или отстала)."""
+        metrics.inc("role_table_fetches_total")
+        self.apply(role_id, await client.hget(ROLE_TABLE_KEY, role_id))
+        return self.get(role_id)
+
+    async def resync(self, client: redis.Redis):
+        roles = await client.hgetall(ROLE_TABLE_KEY)
+        self._roles = {}
+        for role_id, raw in roles.items():
+            self.apply(role_id, raw)
+        self.ready = True
+        metrics.set_gauge("role_table_entries", len(self._roles))
+        metrics.inc("role_table_resyncs_total")
+
+    def clear(self):
+        self._roles.clear()
+        self.ready = False
+
+    async def start(self, client_getter: Callable[[], redis.Redis]):
+        if self._task is not None:
+            return
+        self._task = asyncio.create_task(self._run(client_getter))
+
+    async def stop(self):
+        self.ready = False
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self, client_getter: Callable[[], redis.Redis]):
+        backoff = 0.5
+        while True:
+            client = client_getter()
+            pubsub = client.pubsub()
+            try:
+                # Подписка до HGETALL — события во время загрузки не теряются
+                await pubsub.subscribe(ROLE_TABLE_CHANNEL)
+                await self.resync(client)
+                backoff = 0.5
+                resync_at = time.monotonic() + self.resync_seconds
+
+                while True:
+                    message = await pubsub.get_message(ignore_subscribe_messages=True, timeout=1.0)
+                    if message is not None and message["type"] == "message":
+                        role_id = message["data"]
+                        self.apply(role_id, await client.hget(ROLE_TABLE_KEY, role_id))
+                    if time.monotonic() >= resync_at:
+                        await self.resync(client)
+                        resync_at = time.monotonic() + self.resync_seconds
+            except asyncio.CancelledError:
+                raise
+            except (redis.RedisError, OSError) as exc:
+                self.ready = False
+                metrics.inc("role_table_disconnects_total")
+                logger.warning("Role table lost Redis connection: %s", exc)
+                await asyncio.sleep(backoff)
+                backoff = min(backoff * 2, 30)
+            finally:
+                try:
+                    await pubsub.aclose()
+                except Exception:
+                    pass
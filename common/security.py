@@ -1,12 +1,15 @@
 import os
-from typing import Annotated
-from fastapi import Depends, HTTPException, status
+from typing import Annotated, Iterable, List, Optional, Sequence, Tuple, Union
+from fastapi import Depends, HTTPException, Request, status
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 import jwt
 from jwt.exceptions import InvalidTokenError
 import redis.asyncio as redis
-from .redis_config import is_token_blacklisted
+from .redis_config import is_token_blacklisted, get_user_generation, are_tokens_revoked
+from .permissions import resolve_permissions, resolve_permissions_local
 from .schemas import CurrentUser
+from .token_cache import token_cache
+from .access_rules import AllOf, AnyOf, Permission, Rule, MISSING, decision_cache, decide_many
 
 
 SECRET_KEY = os.getenv("SECRET_KEY", "CHANGE_ME_IN_PROD_SECRET_KEY")
@@ -18,8 +21,11 @@ oauth2_scheme = HTTPBearer()
 async def get_token_payload(auth: Annotated[HTTPAuthorizationCredentials, Depends(oauth2_scheme)]) -> dict:
     """
     Асинхронная зависимость:
-    1. Проверяет подпись JWT (CPU).
-    2. Проверяет Blacklist через redis_client (IO).
+    1. Проверяет подпись JWT (CPU) — или берет payload из token_cache.
+    2. Проверяет Blacklist через redis_client (IO) — всегда, даже при попадании в кэш.
+    3. Если в токене есть "gen", сверяет его с текущим поколением пользователя
+       (отзыв всех сессий: logout-all, деактивация, смена пароля).
+    Возвращаемый payload может быть общим для нескольких запросов: не мутируйте его.
     """
     token = auth.credentials
     credentials_exception = HTTPException(
@@ -29,14 +35,26 @@ async def get_token_payload(auth: Annotated[HTTPAuthorizationCredentials, Depend
     )
     
     try:
-        # 1. Декодируем токен
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+        # 1. Декодируем токен (повторные предъявления — из кэша)
+        payload = token_cache.get(token)
+        if payload is None:
+            payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+            token_cache.put(token, payload)
         
         # 2. Проверяем Blacklist (функция импортирована из redis_client.py)
         jti = payload.get("jti")
         if jti:
             # Если Redis упал, is_token_blacklisted выбросит redis.RedisError
-            if await is_token_blacklisted(jti):
+            if await is_token_blacklisted(jti, payload.get("exp")):
+                raise HTTPException(
+                    status_code=status.HTTP_401_UNAUTHORIZED,
+                    detail="Token has been revoked"
+                )
+
+        # 3. Проверяем поколение (токены, выпущенные до "gen", его не содержат)
+        token_generation = payload.get("gen")
+        if token_generation is not None:
+            if token_generation < await get_user_generation(payload.get("sub")):
                 raise HTTPException(
                     status_code=status.HTTP_401_UNAUTHORIZED,
                     detail="Token has been revoked"
@@ -64,7 +82,15 @@ async def get_current_user_identity(
     Используйте это в Farm/Sensor сервисах.
     """
     # Pydantic сам распарсит поля: sub -> id, g_perms, access и т.д.
-    user = CurrentUser(**payload)
+    # Для role_ref токенов права берутся из таблицы ролей.
+    try:
+        permissions = await resolve_permissions(payload)
+    except redis.RedisError:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Authentication check unavailable"
+        )
+    user = CurrentUser(**{**payload, **permissions})
     # Сохраняем сырой payload на всякий случай
     user.raw_payload = payload
     return user
@@ -74,50 +100,117 @@ class CheckAccess:
     """
     Асинхронный класс защиты.
     Использование: Depends(CheckAccess("farms", "write"))
+    Несколько прав: Depends(CheckAccess(AllOf(("farms", "read"), ("sensors", "write"))))
+    или AnyOf(...); правила можно вкладывать друг в друга.
+    Правило компилируется один раз при создании (см. access_rules.py).
+    Решения кэшируются: для токенов с правами внутри — по JTI между запросами,
+    для role_ref токенов — только в пределах запроса (права роли могут измениться).
     """
-    def __init__(self, resource: str, action: str):
-        self.resource = resource 
-        self.action = action     
-
-    async def __call__(self, payload: dict = Depends(get_token_payload)) -> dict:
-        g_perms = payload.get("g_perms", {})
-        access_list = payload.get("access", {})
-
-        # Проверка глобальных прав
-        if self.action == "read" and g_perms.get("r_all") is True:
-            return payload
-        if self.action in ["write", "delete"] and g_perms.get("w_all") is True:
-            return payload
-
-        # Проверка ресурса
-        resource_access = access_list.get(self.resource)
-        if not resource_access:
-            raise HTTPException(
-                status_code=status.HTTP_403_FORBIDDEN,
-                detail=f"Access to resource '{self.resource}' denied"
-            )
+    def __init__(self, resource: Union[str, Rule], action: Optional[str] = None):
+        self.rule = resource if isinstance(resource, Rule) else Permission(resource, action)
+        self.resource = getattr(self.rule, "resource", None)
+        self.action = getattr(self.rule, "action", None)
+
+    async def __call__(self, payload: dict = Depends(get_token_payload), request: Request = None) -> dict:
+        jti = payload.get("jti")
+        shared = jti is not None and "rid" not in payload
+        decisions = None
+        if shared:
+            decision = decision_cache.get((jti, self.rule.key))
+        elif request is not None:
+            decisions = _request_decisions(request)
+            decision = decisions.get(self.rule.key, MISSING)
+        else:
+            decision = MISSING
+
+        if decision is MISSING:
+            # Права в самом токене / в локальных таблицах — без лишней корутины
+            permissions = resolve_permissions_local(payload)
+            if permissions is None:
+                try:
+                    permissions = await resolve_permissions(payload)
+                except redis.RedisError:
+                    raise HTTPException(
+                        status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                        detail="Authentication check unavailable"
+                    )
+            decision = self.rule.denial(permissions["g_perms"], permissions["access"])
+            if shared:
+                decision_cache.put((jti, self.rule.key), decision)
+            elif decisions is not None:
+                decisions[self.rule.key] = decision
+
+        if decision is not None:
+            raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail=decision)
+        return payload
+
 
-        # Проверка действия
-        has_permission = False
-        if self.action == "read":
-            has_permission = bool(resource_access.get("r"))
-        elif self.action == "write":
-            has_permission = bool(resource_access.get("w"))
-        elif self.action == "delete":
-            has_permission = bool(resource_access.get("d"))
+def _request_decisions(request: Request) -> dict:
+    decisions = getattr(request.state, "access_decisions", None)
+    if decisions is None:
+        decisions = request.state.access_decisions = {}
+    return decisions
 
-        if not has_permission:
+async def authorize_many(payload: dict, checks: Iterable[Tuple[str, str]]) -> List[bool]:
+    """
+    Пакетная проверка: одно решение на каждую пару (resource, action) —
+    для сервисов, которым нужно авторизовать список объектов, а не один маршрут.
+    payload — результат get_token_payload (отзыв уже проверен).
+    Без обращений к БД; Redis — только если локальные таблицы отстали от токена.
+    """
+    permissions = resolve_permissions_local(payload)
+    if permissions is None:
+        try:
+            permissions = await resolve_permissions(payload)
+        except redis.RedisError:
             raise HTTPException(
-                status_code=status.HTTP_403_FORBIDDEN,
-                detail=f"Not enough permissions to {self.action} {self.resource}"
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                detail="Authentication check unavailable"
             )
+    return decide_many(permissions["g_perms"], permissions["access"], checks)
+
+
+async def introspect_tokens(tokens: Sequence[str]) -> List[Optional[dict]]:
+    """
+    Пакетная проверка чужих токенов (RFC 7662): payload активного токена
+    или None (подпись/срок/формат не прошли или токен отозван).
+    Декодирование — в одном цикле через token_cache, проверки отзыва и
+    поколений всех токенов — одним pipeline (are_tokens_revoked).
+    Возвращаемые payload общие с token_cache: не мутируйте их.
+    """
+    payloads: List[Optional[dict]] = []
+    for token in tokens:
+        payload = token_cache.get(token)
+        if payload is None:
+            try:
+                payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+            except InvalidTokenError:
+                payloads.append(None)
+                continue
+            token_cache.put(token, payload)
+        payloads.append(payload)
+
+    decoded = [payload for payload in payloads if payload is not None]
+    try:
+        revoked = await are_tokens_revoked([
+            (payload.get("jti"), payload.get("exp"), payload.get("sub"), payload.get("gen"))
+            for payload in decoded
+        ])
+    except redis.RedisError:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Authentication check unavailable"
+        )
+    flags = iter(revoked)
+    return [None if payload is None or next(flags) else payload for payload in payloads]
 
-        return payload
 
 # --- Helpers ---
 
 def is_admin(payload: dict) -> bool:
-    return payload.get("g_perms", {}).get("w_all", False)
+    # role_ref токен с неизвестной локально ролью — не админ
+    permissions = resolve_permissions_local(payload) or {}
+    return permissions.get("g_perms", {}).get("w_all", False)
 
 def get_current_user_id(payload: dict) -> str:
     return payload.get("sub")
\ No newline at end of file
@@ -0,0 +1,125 @@
+import asyncio
+import time
+import pytest
+import pytest_asyncio
+from unittest.mock import AsyncMock, patch
+import fakeredis.aioredis
+import redis.asyncio as redis
+
+from common import redis_config
+from common.circuit_breaker import CircuitBreaker, CircuitOpenError, CLOSED, OPEN
+from common.redis_config import is_token_blacklisted, get_user_generation
+from common.revocation_filter import RevocationFilter
+
+
+@pytest_asyncio.fixture(autouse=True)
+async def fake_redis():
+    client = fakeredis.aioredis.FakeRedis(decode_responses=True)
+    with patch("common.redis_config.redis_client", client):
+        redis_config.redis_breaker.reset()
+        yield client
+        await redis_config.redis_breaker.stop()
+        redis_config.redis_breaker.reset()
+    await client.flushall()
+
+
+@pytest.fixture
+def broken_redis(fake_redis):
+    """Все команды (и pipeline) падают с ConnectionError."""
+    error = redis.ConnectionError("connection refused")
+    with patch.object(redis_config.lookup_batcher, "submit", AsyncMock(side_effect=error)):
+        yield
+
+
+@pytest.mark.asyncio
+async def test_breaker_opens_and_fails_fast():
+    failing = AsyncMock(side_effect=redis.ConnectionError("down"))
+    breaker = CircuitBreaker("test", probe=failing, failure_threshold=3, probe_interval=60)
+
+    for _ in range(3):
+        with pytest.raises(redis.ConnectionError):
+            await breaker.call(failing)
+    assert breaker.state == OPEN
+
+    # Открытый breaker не обращается к Redis
+    with pytest.raises(CircuitOpenError):
+        await breaker.call(failing)
+    assert failing.await_count == 3
+    await breaker.stop()
+
+
+@pytest.mark.asyncio
+async def test_breaker_ignores_command_errors():
+    breaker = CircuitBreaker("test", probe=AsyncMock(), failure_threshold=1)
+    with pytest.raises(redis.ResponseError):
+        await breaker.call(AsyncMock(side_effect=redis.ResponseError("WRONGTYPE")))
+    assert breaker.state == CLOSED
+
+
+@pytest.mark.asyncio
+async def test_background_probe_recovers():
+    probe = AsyncMock(side_effect=[redis.ConnectionError("down"), True])
+    breaker = CircuitBreaker("test", probe=probe, failure_threshold=1, probe_interval=0.01)
+
+    with pytest.raises(redis.ConnectionError):
+        await breaker.call(AsyncMock(side_effect=redis.ConnectionError("down")))
+    assert breaker.state == OPEN
+
+    for _ in range(100):
+        if breaker.state != OPEN:
+            break
+        await asyncio.sleep(0.01)
+
+    # Проба прошла — первый успешный вызов закрывает breaker
+    assert await breaker.call(AsyncMock(return_value="ok")) == "ok"
+    assert breaker.state == CLOSED
+    await breaker.stop()
+
+
+@pytest.mark.asyncio
+async def test_fail_closed_raises(broken_redis):
+    with patch.object(redis_config, "REDIS_DEGRADED_POLICY", "fail_closed"):
+        with pytest.raises(redis.RedisError):
+            await is_token_blacklisted("jti")
+
+
+@pytest.mark.asyncio
+async def test_snapshot_policy_answers_from_filter(broken_redis):
+    rf = RevocationFilter(capacity=100, error_rate=0.01)
+    rf.load(["revoked-jti"])
+    rf._mark_stale()  # соединение потеряно, снимок остался
+
+    with patch.object(redis_config, "revocation_filter", rf), \
+            patch.object(redis_config, "REDIS_DEGRADED_POLICY", "snapshot"):
+        assert await is_token_blacklisted("revoked-jti") is True
+        assert await is_token_blacklisted("clean-jti") is False
+
+        rf.generations.set("user-1", 3)
+        rf.generations._entries["user-1"] = (3, time.monotonic() - 3600)
+        assert await get_user_generation("user-1") == 3
+        # Поколение неизвестно — ответить нечем
+        with pytest.raises(redis.RedisError):
+            await get_user_generation("user-2")
+
+        # Слишком старый снимок не используется
+        rf.stale_since = time.monotonic() - redis_config.REDIS_DEGRADED_MAX_STALENESS - 1
+        with pytest.raises(redis.RedisError):
+            await is_token_blacklisted("clean-jti")
+
+
+@pytest.mark.asyncio
+async def test_snapshot_policy_without_snapshot_fails_closed(broken_redis):
+    rf = RevocationFilter(capacity=100, error_rate=0.01)
+    with patch.object(redis_config, "revocation_filter", rf), \
+            patch.object(redis_config, "REDIS_DEGRADED_POLICY", "snapshot"):
+        with pytest.raises(redis.RedisError):
+            await is_token_blacklisted("jti")
+
+
+@pytest.mark.asyncio
+async def test_open_breaker_skips_redis(fake_redis):
+    redis_config.redis_breaker._open()
+    with patch.object(redis_config.lookup_batcher, "submit") as submit, \
+            patch.object(redis_config, "REDIS_DEGRADED_POLICY", "fail_open"):
+        assert await is_token_blacklisted("jti") is False
+        submit.assert_not_called()
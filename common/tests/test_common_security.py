@@ -31,7 +31,7 @@ async def test_get_token_payload_success():
         result = await get_token_payload(auth)
         
         assert result["sub"] == "user_1"
-        mock_blacklist.assert_called_once_with("unique_jti")
+        mock_blacklist.assert_called_once_with("unique_jti", 9999999999)
 
 @pytest.mark.asyncio
 async def test_get_token_payload_blacklisted():
@@ -144,4 +144,97 @@ class TestCheckAccess:
         with pytest.raises(HTTPException) as exc:
             await checker(payload)
         assert exc.value.status_code == status.HTTP_403_FORBIDDEN
-        assert "Not enough permissions" in exc.value.detail
\ No newline at end of file
+        assert "Not enough permissions" in exc.value.detail
+
+
+@pytest.mark.asyncio
+async def test_get_token_payload_rejects_old_generation():
+    token = create_test_token({"sub": "gen_user", "jti": "gen-jti", "gen": 1, "exp": 9999999999})
+    auth = HTTPAuthorizationCredentials(scheme="Bearer", credentials=token)
+
+    with patch("common.security.is_token_blacklisted", new_callable=AsyncMock, return_value=False), \
+         patch("common.security.get_user_generation", new_callable=AsyncMock) as mock_gen:
+        mock_gen.return_value = 1
+        assert (await get_token_payload(auth))["sub"] == "gen_user"
+
+        # Все сессии пользователя отозваны (logout-all / деактивация)
+        mock_gen.return_value = 2
+        with pytest.raises(HTTPException) as exc:
+            await get_token_payload(auth)
+        assert exc.value.status_code == status.HTTP_401_UNAUTHORIZED
+        mock_gen.assert_called_with("gen_user")
+
+
+class TestCompiledRules:
+    def test_unknown_action_fails_at_construction(self):
+        with pytest.raises(ValueError):
+            CheckAccess("farms", "execute")
+
+    def test_rule_without_denial_fails_at_construction(self):
+        from common.access_rules import Rule
+
+        class Incomplete(Rule):
+            key = "incomplete"
+
+        with pytest.raises(TypeError):
+            Incomplete()
+
+    @pytest.mark.asyncio
+    async def test_all_of_and_any_of(self):
+        from common.security import AllOf, AnyOf
+
+        payload = {"access": {"farms": {"r": 1, "w": 0}, "sensors": {"r": 1, "w": 1}}}
+        assert await CheckAccess(AllOf(("farms", "read"), ("sensors", "write")))(payload) == payload
+        assert await CheckAccess(AnyOf(("farms", "write"), ("sensors", "write")))(payload) == payload
+
+        with pytest.raises(HTTPException) as exc:
+            await CheckAccess(AllOf(("farms", "read"), ("farms", "write")))(payload)
+        assert exc.value.detail == "Not enough permissions to write farms"
+
+        # Вложенные правила; отказ AnyOf — по первому правилу
+        rule = AnyOf(AllOf(("farms", "write"), ("sensors", "write")), ("orders", "read"))
+        with pytest.raises(HTTPException) as exc:
+            await CheckAccess(rule)(payload)
+        assert exc.value.status_code == status.HTTP_403_FORBIDDEN
+        assert exc.value.detail == "Not enough permissions to write farms"
+
+    @pytest.mark.asyncio
+    async def test_decisions_are_cached_by_jti(self):
+        from common.access_rules import decision_cache
+
+        decision_cache.clear()
+        payload = {"jti": "cached-decision", "access": {"farms": {"r": 1}}}
+        permissions = {"g_perms": {}, "access": payload["access"]}
+        with patch("common.security.resolve_permissions_local", return_value=permissions) as mock_resolve:
+            for _ in range(3):
+                await CheckAccess("farms", "read")(payload)
+                with pytest.raises(HTTPException):
+                    await CheckAccess("farms", "write")(payload)
+        assert mock_resolve.call_count == 2
+        decision_cache.clear()
+
+    @pytest.mark.asyncio
+    async def test_role_ref_decisions_are_cached_only_per_request(self):
+        from types import SimpleNamespace
+
+        payload = {"jti": "role-ref", "rid": "r1", "rv": 1}
+        permissions = {"g_perms": {}, "access": {"farms": {"r": 1}}}
+        with patch("common.security.resolve_permissions", new_callable=AsyncMock, return_value=permissions) as mock_resolve:
+            request = SimpleNamespace(state=SimpleNamespace())
+            await CheckAccess("farms", "read")(payload, request)
+            await CheckAccess("farms", "read")(payload, request)
+            assert mock_resolve.await_count == 1
+
+            # Следующий запрос видит актуальные права роли
+            await CheckAccess("farms", "read")(payload, SimpleNamespace(state=SimpleNamespace()))
+            assert mock_resolve.await_count == 2
+
+
+@pytest.mark.asyncio
+async def test_authorize_many_returns_vector_in_order():
+    from common.security import authorize_many
+
+    payload = {"g_perms": {"r_all": True}, "access": {"orders": {"r": 1, "w": 1, "d": 0}, "farms.**": {"w": 1}}}
+    checks = [("orders", "write"), ("orders", "delete"), ("users", "read"), ("farms.north", "write"), ("orders", "write")]
+    assert await authorize_many(payload, checks) == [True, False, True, True, True]
+    assert await authorize_many(payload, []) == []
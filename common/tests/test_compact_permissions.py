@@ -0,0 +1,119 @@
+import pytest
+import pytest_asyncio
+from unittest.mock import patch
+import fakeredis.aioredis
+from fastapi import HTTPException
+
+from common import redis_config
+from common import blacklist_storage as storage
+from common.compact_permissions import ResourceDictionary, pack_access, unpack_access
+from common.permissions import resolve_permissions
+from common.security import CheckAccess, is_admin
+
+FRAGMENT = {
+    "role": "manager",
+    "g_perms": {"r_all": False, "w_all": False},
+    "access": {
+        "orders": {"r": 1, "w": 1, "d": 0},
+        "farms": {"r": 1, "w": 0, "d": 0},
+        "reports": {"r": 0, "w": 0, "d": 0},
+    },
+}
+
+
+@pytest_asyncio.fixture(autouse=True)
+async def fake_redis():
+    client = fakeredis.aioredis.FakeRedis(decode_responses=True)
+    dictionary = ResourceDictionary()
+    with patch("common.redis_config.redis_client", client), \
+            patch("common.redis_config.resource_dictionary", dictionary):
+        redis_config.redis_breaker.reset()
+        yield client
+    await client.flushall()
+
+
+def test_pack_roundtrip_with_large_indexes_and_compression():
+    pairs = [(0, 7), (127, 1), (128, 3), (300_000, 4)]
+    assert unpack_access(pack_access(pairs)) == pairs
+
+    # Большая карта сжимается zlib, результат тот же
+    many = [(i, 1 + i % 7) for i in range(1000)]
+    packed = pack_access(many)
+    assert unpack_access(packed) == many
+    with patch("common.compact_permissions.COMPACT_PERMS_COMPRESS_MIN_BYTES", 10**9):
+        assert len(packed) < len(pack_access(many))
+
+    with pytest.raises(ValueError):
+        unpack_access("Av8")  # флаг zlib, мусор вместо тела
+
+
+@pytest.mark.asyncio
+async def test_encode_decode_matches_embedded_format(fake_redis):
+    dictionary = redis_config.resource_dictionary
+    assert dictionary.encode(FRAGMENT) is None
+
+    await dictionary.ensure(fake_redis, FRAGMENT["access"])
+    claims = dictionary.encode(FRAGMENT)
+    assert set(claims) == {"role", "gp", "pm", "pd"}
+    assert dictionary.decode(claims) == FRAGMENT
+
+    # Повторная выдача не меняет индексы
+    indexes = dict(await fake_redis.hgetall("resource_dict"))
+    await dictionary.ensure(fake_redis, ["orders", "sensors"])
+    assert {k: v for k, v in (await fake_redis.hgetall("resource_dict")).items() if k != "sensors"} == indexes
+
+
+@pytest.mark.asyncio
+async def test_other_process_syncs_dictionary_on_unknown_index(fake_redis):
+    issuer = ResourceDictionary()
+    await issuer.ensure(fake_redis, FRAGMENT["access"])
+    payload = {"sub": "u1", **issuer.encode(FRAGMENT)}
+
+    # Локальный словарь сервиса пуст: один sync из Redis, дальше — без сети
+    assert await resolve_permissions(payload) == FRAGMENT
+    with patch.object(fake_redis, "hgetall", side_effect=AssertionError("no network")):
+        assert await CheckAccess("orders", "write")(payload) == payload
+        with pytest.raises(HTTPException) as exc:
+            await CheckAccess("farms", "write")(payload)
+        assert exc.value.status_code == 403
+        assert "Not enough permissions" in exc.value.detail
+    assert is_admin(payload) is False
+
+
+@pytest.mark.asyncio
+async def test_foreign_epoch_and_malformed_claims_grant_nothing(fake_redis):
+    await redis_config.resource_dictionary.ensure(fake_redis, FRAGMENT["access"])
+
+    stale = {"sub": "u1", "role": "manager", "gp": 2, "pm": pack_access([(0, 7)]), "pd": "old-epoch"}
+    permissions = await resolve_permissions(stale)
+    assert permissions["access"] == {} and permissions["g_perms"]["w_all"] is False
+
+    broken = {"sub": "u1", "role": "manager", "gp": 0, "pm": "!!", "pd": redis_config.resource_dictionary.epoch}
+    assert (await resolve_permissions(broken))["access"] == {}
+
+
+@pytest.mark.asyncio
+async def test_unknown_epoch_or_index_is_synced_only_once(fake_redis):
+    dictionary = redis_config.resource_dictionary
+    await dictionary.ensure(fake_redis, FRAGMENT["access"])
+
+    foreign = {"sub": "u1", "role": "manager", "gp": 0, "pm": pack_access([(0, 7)]), "pd": "old-epoch"}
+    other_foreign = {**foreign, "pm": pack_access([(1, 1)])}
+    missing_index = {**foreign, "pm": pack_access([(10_000, 7)]), "pd": dictionary.epoch}
+
+    for payload in (foreign, missing_index):
+        assert (await resolve_permissions(payload))["access"] == {}
+
+    with patch.object(dictionary, "sync", side_effect=AssertionError("no sync")):
+        for payload in (foreign, other_foreign, missing_index):
+            assert (await resolve_permissions(payload))["access"] == {}
+
+
+def test_short_jti_is_stored_as_16_bytes():
+    import base64
+    import secrets
+
+    raw = secrets.token_bytes(16)
+    jti = base64.urlsafe_b64encode(raw).rstrip(b"=").decode("ascii")
+    assert len(jti) == 22
+    assert storage.encode_jti(jti) == raw
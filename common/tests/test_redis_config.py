@@ -62,4 +62,166 @@ async def test_key_format_in_redis(mock_redis):
     
     # Напрямую проверяем наличие ключа в fake-клиенте
     exists = await mock_redis.exists(f"blacklist:{jti}")
-    assert exists == 1
\ No newline at end of file
+    assert exists == 1
+
+@pytest.mark.asyncio
+async def test_concurrent_lookups_share_one_pipeline(mock_redis):
+    """
+    Конкурентные проверки склеиваются в один pipeline,
+    и каждый вызывающий получает свой результат.
+    """
+    import asyncio
+    from common.revocation_filter import RevocationFilter
+
+    await add_token_to_blacklist("revoked-1", 60)
+    jtis = [f"jti-{i}" for i in range(50)] + ["revoked-1"]
+
+    with patch("common.redis_config.revocation_filter", RevocationFilter(enabled=False)), \
+         patch.object(mock_redis, "pipeline", wraps=mock_redis.pipeline) as mock_pipeline:
+        results = await asyncio.gather(*(is_token_blacklisted(j) for j in jtis))
+
+    assert results == [False] * 50 + [True]
+    assert mock_pipeline.call_count == 1
+
+@pytest.mark.asyncio
+async def test_batcher_respects_max_batch_and_propagates_errors(mock_redis):
+    import asyncio
+    import redis.asyncio as redis
+    from common.redis_batcher import CommandBatcher
+
+    batcher = CommandBatcher(lambda: mock_redis, window_ms=0, max_batch=10)
+    with patch.object(mock_redis, "pipeline", wraps=mock_redis.pipeline) as mock_pipeline:
+        await asyncio.gather(*(batcher.submit("exists", f"k{i}") for i in range(25)))
+    assert mock_pipeline.call_count == 3
+
+    with patch.object(mock_redis, "pipeline", side_effect=redis.ConnectionError("down")):
+        with pytest.raises(redis.ConnectionError):
+            await batcher.submit("exists", "k1")
+
+@pytest.mark.asyncio
+async def test_consume_token_once_is_atomic(mock_redis):
+    """Из двух одновременных попыток израсходовать JTI успешна ровно одна."""
+    import asyncio
+    from common.redis_config import consume_token_once
+
+    results = await asyncio.gather(
+        consume_token_once("refresh-jti", 60),
+        consume_token_once("refresh-jti", 60),
+    )
+    assert sorted(results) == [False, True]
+    assert await is_token_blacklisted("refresh-jti") is True
+    assert await consume_token_once("refresh-jti", 60) is False
+
+@pytest.mark.asyncio
+async def test_user_generation_is_cached_locally(mock_redis):
+    from common.redis_config import get_user_generation, bump_user_generation, revocation_filter
+
+    revocation_filter.generations.clear()
+    assert await get_user_generation("u-1") == 0
+
+    with patch.object(mock_redis, "pipeline", wraps=mock_redis.pipeline) as mock_pipeline:
+        assert await get_user_generation("u-1") == 0
+        mock_pipeline.assert_not_called()
+
+    assert await bump_user_generation("u-1") == 1
+    assert await get_user_generation("u-1") == 1
+    assert await mock_redis.get("user_gen:u-1") == "1"
+    revocation_filter.generations.clear()
+
+
+# --- Компактный формат (BLACKLIST_STORAGE=buckets) ---
+
+@pytest.fixture
+def bucket_storage():
+    with patch("common.blacklist_storage.BLACKLIST_STORAGE", "buckets"):
+        yield
+
+@pytest.mark.asyncio
+async def test_bucket_storage_flow(mock_redis, bucket_storage):
+    import time
+    import uuid
+    from common import blacklist_storage as storage
+
+    jti = str(uuid.uuid4())
+    exp = time.time() + 120
+
+    assert await is_token_blacklisted(jti, exp) is False
+    await add_token_to_blacklist(jti, 120, exp=exp)
+    assert await is_token_blacklisted(jti, exp) is True
+
+    # Один hash на окно истечения, JTI хранится 16 байтами, без ключа на токен
+    key = storage.bucket_key(exp)
+    assert await mock_redis.exists(f"blacklist:{jti}") == 0
+    assert await mock_redis.hexists(key, uuid.UUID(jti).bytes) is True
+    assert await mock_redis.ttl(key) > 120
+
+@pytest.mark.asyncio
+async def test_bucket_storage_consume_and_legacy_read(mock_redis, bucket_storage):
+    import time
+    from common.redis_config import consume_token_once
+
+    exp = time.time() + 60
+    assert await consume_token_once("bucket-jti", 60, exp=exp) is True
+    assert await consume_token_once("bucket-jti", 60, exp=exp) is False
+
+    # Токен, отозванный до переключения формата, остается отозванным
+    await mock_redis.set("blacklist:legacy-jti", "true", ex=60)
+    assert await is_token_blacklisted("legacy-jti", exp) is True
+    assert await consume_token_once("legacy-jti", 60, exp=exp) is False
+
+@pytest.mark.asyncio
+async def test_revocation_filter_resync_reads_buckets(mock_redis, bucket_storage):
+    import time
+    import uuid
+    from common.revocation_filter import RevocationFilter
+
+    jti = str(uuid.uuid4())
+    await add_token_to_blacklist(jti, 60, exp=time.time() + 60)
+    await mock_redis.set("blacklist:legacy-jti", "true", ex=60)
+
+    rf = RevocationFilter(capacity=100, error_rate=0.001)
+    await rf.resync(mock_redis)
+    assert rf.might_contain(jti) is True
+    assert rf.might_contain("legacy-jti") is True
+    assert rf.might_contain(str(uuid.uuid4())) is False
+
+@pytest.mark.asyncio
+async def test_check_eviction_policy_warns(mock_redis):
+    from unittest.mock import AsyncMock
+    from common.redis_config import check_eviction_policy
+
+    with patch.object(mock_redis, "config_get", new_callable=AsyncMock) as mock_config:
+        mock_config.return_value = {"maxmemory-policy": "allkeys-lru"}
+        assert await check_eviction_policy() == "allkeys-lru"
+
+@pytest.mark.asyncio
+async def test_are_tokens_revoked_uses_one_pipeline(mock_redis):
+    """Отзыв и поколения пакета токенов — один pipeline, порядок ответов сохраняется."""
+    from common.redis_config import are_tokens_revoked, bump_user_generation, revocation_filter
+    from common.revocation_filter import RevocationFilter
+
+    await add_token_to_blacklist("revoked-1", 60)
+    await bump_user_generation("u-2")
+    tokens = [
+        ("jti-1", None, "u-1", 0),
+        ("revoked-1", None, "u-1", 0),
+        ("jti-2", None, "u-2", 0),  # выпущен до logout-all
+        ("jti-3", None, "u-2", 1),
+        (None, None, "u-3", None),
+    ]
+
+    revocation_filter.generations.clear()
+    with patch("common.redis_config.revocation_filter", RevocationFilter(enabled=False)), \
+         patch.object(mock_redis, "pipeline", wraps=mock_redis.pipeline) as mock_pipeline:
+        assert await are_tokens_revoked(tokens) == [False, True, True, False, False]
+    assert mock_pipeline.call_count == 1
+
+    # Фильтр отзывов и кэш поколений отсекают все проверки — Redis не нужен
+    loaded = RevocationFilter()
+    loaded.load(["revoked-1"])
+    with patch("common.redis_config.revocation_filter", loaded), \
+         patch.object(mock_redis, "pipeline", wraps=mock_redis.pipeline) as mock_pipeline:
+        loaded.generations.set("u-2", 1)
+        assert await are_tokens_revoked([("jti-1", None, "u-2", 1)]) == [False]
+    mock_pipeline.assert_not_called()
+    revocation_filter.generations.clear()
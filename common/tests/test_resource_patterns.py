@@ -0,0 +1,63 @@
+import pytest
+from fastapi import HTTPException
+
+from common.resource_patterns import PermissionTrie, match_resource, normalize_pattern, split_resource
+from common.security import CheckAccess
+
+READ = {"r": 1, "w": 0, "d": 0}
+WRITE = {"r": 1, "w": 1, "d": 0}
+NONE = {"r": 0, "w": 0, "d": 0}
+
+
+def test_normalize_pattern():
+    assert normalize_pattern("farms:*") == "farms.*"
+    assert normalize_pattern(" farms.sensors.readings ") == "farms.sensors.readings"
+    for bad in ("farms..x", "farms.**.x", "farms/x", ""):
+        with pytest.raises(ValueError):
+            normalize_pattern(bad)
+
+
+def test_wildcards_and_precedence():
+    access = {
+        "farms.**": READ,
+        "farms.*.sensors": WRITE,
+        "farms.secret.**": NONE,
+        "orders": WRITE,
+    }
+    trie = PermissionTrie(access)
+
+    def match(resource):
+        return trie.match(split_resource(resource))
+
+    assert match("farms") is READ
+    assert match("farms.north") is READ
+    assert match("farms.north.sensors") is WRITE
+    assert match("farms.north.sensors.readings") is READ
+    # Более конкретное правило запрещает ветку
+    assert match("farms.secret.sensors") is NONE
+    # Точные правила в дерево не входят
+    assert match("orders") is None
+    assert match_resource(access, "orders") is WRITE
+    assert match_resource(access, "sensors") is None
+
+
+def test_single_segment_wildcard():
+    trie = PermissionTrie({"farms.*": READ})
+    assert trie.match(["farms", "north"]) is READ
+    assert trie.match(["farms"]) is None
+    assert trie.match(["farms", "north", "sensors"]) is None
+
+
+@pytest.mark.asyncio
+async def test_check_access_with_patterns():
+    payload = {"access": {"farms.**": READ, "farms.*.sensors": WRITE}}
+    assert await CheckAccess("farms:north:sensors", "write")(payload) == payload
+    assert await CheckAccess("farms.south", "read")(payload) == payload
+
+    with pytest.raises(HTTPException) as exc:
+        await CheckAccess("farms.south", "write")(payload)
+    assert exc.value.detail == "Not enough permissions to write farms.south"
+
+    with pytest.raises(HTTPException) as exc:
+        await CheckAccess("orders", "read")(payload)
+    assert exc.value.detail == "Access to resource 'orders' denied"
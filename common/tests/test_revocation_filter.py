@@ -0,0 +1,115 @@
+import asyncio
+import pytest
+import pytest_asyncio
+from unittest.mock import patch
+import fakeredis.aioredis
+from common.revocation_filter import BloomFilter, RevocationFilter, REVOCATION_CHANNEL
+from common.redis_config import add_token_to_blacklist, is_token_blacklisted
+
+
+@pytest_asyncio.fixture
+async def fake_redis():
+    client = fakeredis.aioredis.FakeRedis(decode_responses=True)
+    with patch("common.redis_config.redis_client", client):
+        yield client
+    await client.flushall()
+
+
+def test_bloom_filter_has_no_false_negatives():
+    bloom = BloomFilter(capacity=1000, error_rate=0.01)
+    items = [f"jti-{i}" for i in range(1000)]
+    for item in items:
+        bloom.add(item)
+
+    assert all(item in bloom for item in items)
+    false_positives = sum(f"other-{i}" in bloom for i in range(10000))
+    assert false_positives < 300  # ~1% ожидаемо, с запасом
+
+
+def test_filter_not_ready_defers_to_redis():
+    rf = RevocationFilter(capacity=100, error_rate=0.01)
+    assert rf.might_contain("anything") is True
+
+    rf.load(["revoked"])
+    assert rf.might_contain("revoked") is True
+    assert rf.might_contain("anything") is False
+
+
+@pytest.mark.asyncio
+async def test_negative_answer_skips_redis(fake_redis):
+    rf = RevocationFilter(capacity=100, error_rate=0.01)
+    rf.load([])
+
+    with patch("common.redis_config.revocation_filter", rf):
+        with patch.object(fake_redis, "exists", wraps=fake_redis.exists) as mock_exists:
+            assert await is_token_blacklisted("clean-jti") is False
+            mock_exists.assert_not_called()
+
+        # Отзыв в этом же процессе сразу попадает в фильтр
+        await add_token_to_blacklist("revoked-jti", 60)
+        assert await is_token_blacklisted("revoked-jti") is True
+
+
+@pytest.mark.asyncio
+async def test_sync_via_resync_and_pubsub(fake_redis):
+    await fake_redis.set("blacklist:old-jti", "true", ex=60)
+    rf = RevocationFilter(capacity=100, error_rate=0.01)
+
+    await rf.start(lambda: fake_redis)
+    try:
+        for _ in range(50):
+            if rf.ready:
+                break
+            await asyncio.sleep(0.02)
+        assert rf.ready
+        assert rf.might_contain("old-jti") is True
+        assert rf.might_contain("new-jti") is False
+
+        # Отзыв, сделанный другим процессом
+        await fake_redis.publish(REVOCATION_CHANNEL, "new-jti")
+        for _ in range(100):
+            if rf.might_contain("new-jti"):
+                break
+            await asyncio.sleep(0.02)
+        assert rf.might_contain("new-jti") is True
+    finally:
+        await rf.stop()
+    assert rf.ready is False
+
+
+def test_generation_fill_is_dropped_after_concurrent_invalidation():
+    """GET user_gen -> (bump + pub/sub инвалидация) -> запись старого значения в кэш не попадает."""
+    from common.revocation_filter import GenerationCache
+
+    cache = GenerationCache()
+    version = cache.version          # перед GET user_gen:u1 (ответ: 0)
+    cache.invalidate("u1")           # bump в другом процессе, событие пришло раньше ответа
+    cache.set("u1", 0, version)
+    assert cache.get("u1", synced=True) is None
+
+    # Без гонки значение кэшируется; поколение не откатывается назад
+    cache.set("u1", 2, cache.version)
+    cache.set("u1", 1)
+    assert cache.get("u1", synced=True) == 2
+
+
+@pytest.mark.asyncio
+async def test_get_user_generation_does_not_cache_value_raced_by_bump(fake_redis):
+    from common.redis_config import get_user_generation, lookup_batcher, revocation_filter
+
+    generations = revocation_filter.generations
+    generations.clear()
+    original_submit = lookup_batcher.submit
+
+    async def racing_submit(command, *args):
+        value = await original_submit(command, *args)
+        # INCR и его pub/sub-событие успели между ответом GET и записью в кэш
+        await fake_redis.incr("user_gen:u-race")
+        generations.invalidate("u-race")
+        return value
+
+    with patch("common.redis_config.lookup_batcher.submit", side_effect=racing_submit):
+        assert await get_user_generation("u-race") == 0
+    assert generations.get("u-race", synced=True) is None
+    assert await get_user_generation("u-race") == 1
+    generations.clear()
@@ -0,0 +1,103 @@
+import json
+import pytest
+import pytest_asyncio
+from unittest.mock import patch
+import fakeredis.aioredis
+from fastapi import HTTPException
+
+from common import redis_config
+from common.permissions import resolve_permissions
+from common.role_table import RoleTable, store_role, GUEST_PERMISSIONS, ROLE_TABLE_KEY
+from common.security import CheckAccess, is_admin
+
+READER = {"role": "reader", "g_perms": {"r_all": False, "w_all": False}, "access": {"farms": {"r": 1, "w": 0, "d": 0}}}
+WRITER = {"role": "reader", "g_perms": {"r_all": False, "w_all": False}, "access": {"farms": {"r": 1, "w": 1, "d": 0}}}
+
+
+@pytest_asyncio.fixture(autouse=True)
+async def fake_redis():
+    client = fakeredis.aioredis.FakeRedis(decode_responses=True)
+    table = RoleTable()
+    with patch("common.redis_config.redis_client", client), \
+            patch("common.redis_config.role_table", table):
+        redis_config.redis_breaker.reset()
+        yield client
+    await client.flushall()
+
+
+@pytest.mark.asyncio
+async def test_store_role_ignores_older_versions(fake_redis):
+    assert await store_role(fake_redis, "r1", 2, WRITER) is True
+    # Запоздавшая запись с меньшей версией не откатывает права
+    assert await store_role(fake_redis, "r1", 1, READER) is False
+    stored = json.loads(await fake_redis.hget(ROLE_TABLE_KEY, "r1"))
+    assert stored == {"v": 2, "fragment": WRITER}
+
+
+@pytest.mark.asyncio
+async def test_resolve_role_ref_from_local_table(fake_redis):
+    await store_role(fake_redis, "r1", 1, READER)
+    await redis_config.role_table.resync(fake_redis)
+
+    payload = {"sub": "u1", "role": "reader", "rid": "r1", "rv": 1}
+    with patch.object(fake_redis, "hget", side_effect=AssertionError("no network")):
+        assert await resolve_permissions(payload) == READER
+        assert await CheckAccess("farms", "read")(payload) == payload
+        with pytest.raises(HTTPException) as exc:
+            await CheckAccess("farms", "write")(payload)
+    assert exc.value.status_code == 403
+    assert is_admin(payload) is False
+
+
+@pytest.mark.asyncio
+async def test_permission_change_applies_to_issued_tokens(fake_redis):
+    table = redis_config.role_table
+    await store_role(fake_redis, "r1", 1, READER)
+    await table.resync(fake_redis)
+    payload = {"sub": "u1", "rid": "r1", "rv": 1}
+
+    # Событие pub/sub -> apply: уже выданный токен получает новые права
+    await store_role(fake_redis, "r1", 2, WRITER)
+    table.apply("r1", await fake_redis.hget(ROLE_TABLE_KEY, "r1"))
+    assert await CheckAccess("farms", "write")(payload) == payload
+
+
+@pytest.mark.asyncio
+async def test_table_behind_token_fetches_from_redis(fake_redis):
+    await store_role(fake_redis, "r1", 3, WRITER)
+    # Таблица не загружена (или отстала): версия из токена подтягивается из Redis
+    payload = {"sub": "u1", "rid": "r1", "rv": 3}
+    assert await resolve_permissions(payload) == WRITER
+
+
+@pytest.mark.asyncio
+async def test_deleted_or_missing_role_has_no_permissions(fake_redis):
+    await store_role(fake_redis, "r1", 1, READER)
+    await store_role(fake_redis, "r1", 2, None)
+    assert await resolve_permissions({"sub": "u1", "rid": "r1", "rv": 1}) == GUEST_PERMISSIONS
+    assert await resolve_permissions({"sub": "u1", "rid": "unknown", "rv": 0}) == GUEST_PERMISSIONS
+    assert await resolve_permissions({"sub": "u1", "rid": None, "rv": 0}) == GUEST_PERMISSIONS
+
+
+@pytest.mark.asyncio
+async def test_sync_task_applies_published_changes(fake_redis):
+    import asyncio
+
+    table = redis_config.role_table
+    await store_role(fake_redis, "r1", 1, READER)
+    await redis_config.start_role_table()
+    try:
+        for _ in range(100):
+            if table.ready:
+                break
+            await asyncio.sleep(0.01)
+        assert table.get("r1") == READER
+
+        await store_role(fake_redis, "r1", 2, WRITER)
+        for _ in range(300):
+            if table.get("r1") == WRITER:
+                break
+            await asyncio.sleep(0.01)
+        assert table.get("r1") == WRITER
+    finally:
+        await redis_config.stop_role_table()
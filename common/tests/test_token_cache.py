@@ -0,0 +1,91 @@
+import time
+import pytest
+import jwt
+from unittest.mock import AsyncMock, patch
+from fastapi import HTTPException
+from fastapi.security import HTTPAuthorizationCredentials
+from common.security import get_token_payload, SECRET_KEY, ALGORITHM
+from common.token_cache import TokenCache, token_cache
+
+
+@pytest.fixture(autouse=True)
+def clean_cache():
+    token_cache.clear()
+    yield
+    token_cache.clear()
+
+
+def test_put_and_get_until_exp():
+    cache = TokenCache(max_entries=10, max_bytes=1_000_000, max_ttl=300)
+    payload = {"sub": "u1", "exp": time.time() + 60}
+
+    assert cache.get("token-a") is None
+    cache.put("token-a", payload)
+
+    assert cache.get("token-a") is payload
+    assert cache.stats()["hits"] == 1
+    assert cache.stats()["misses"] == 1
+
+
+def test_expired_entries_are_not_returned():
+    cache = TokenCache(max_entries=10, max_bytes=1_000_000, max_ttl=300)
+    cache.put("expired", {"sub": "u1", "exp": time.time() - 1})
+    assert cache.get("expired") is None
+
+    cache.put("short", {"sub": "u1", "exp": time.time() + 60})
+    with patch("common.token_cache.time.time", return_value=time.time() + 61):
+        assert cache.get("short") is None
+    assert cache.stats()["entries"] == 0
+
+
+def test_lru_eviction_by_entries_and_bytes():
+    cache = TokenCache(max_entries=2, max_bytes=1_000_000, max_ttl=300)
+    exp = time.time() + 60
+    cache.put("t1", {"exp": exp})
+    cache.put("t2", {"exp": exp})
+    cache.get("t1")  # t1 становится самым свежим
+    cache.put("t3", {"exp": exp})
+
+    assert cache.get("t2") is None
+    assert cache.get("t1") is not None
+    assert cache.get("t3") is not None
+
+    small = TokenCache(max_entries=100, max_bytes=1200, max_ttl=300)
+    for i in range(10):
+        small.put(f"token-{i}", {"exp": exp})
+    assert small.size_bytes <= 1200
+    assert small.stats()["entries"] == 2
+
+
+def test_token_cache_sizes_entries_by_payload_not_token():
+    cache = TokenCache(max_entries=100, max_bytes=1_000_000, max_ttl=300)
+    exp = time.time() + 60
+    access = {f"service-{i}": [f"resource-{j}:read" for j in range(20)] for i in range(20)}
+    cache.put("short-token", {"exp": exp, "access": access})
+
+    # Короткий токен с большим payload занимает память по payload
+    assert cache.size_bytes > 20 * 20 * len("resource-0:read")
+
+    tight = TokenCache(max_entries=100, max_bytes=cache.size_bytes - 1, max_ttl=300)
+    tight.put("short-token", {"exp": exp, "access": access})
+    assert tight.stats()["entries"] == 0
+
+
+@pytest.mark.asyncio
+async def test_get_token_payload_uses_cache_but_still_checks_blacklist():
+    token = jwt.encode({"sub": "u1", "jti": "cached-jti", "exp": time.time() + 60}, SECRET_KEY, algorithm=ALGORITHM)
+    auth = HTTPAuthorizationCredentials(scheme="Bearer", credentials=token)
+
+    with patch("common.security.is_token_blacklisted", new_callable=AsyncMock) as mock_blacklist, \
+         patch("common.security.jwt.decode", wraps=jwt.decode) as mock_decode:
+        mock_blacklist.return_value = False
+        await get_token_payload(auth)
+        await get_token_payload(auth)
+        assert mock_decode.call_count == 1
+
+        # Отзыв применяется и к закэшированному токену
+        mock_blacklist.return_value = True
+        with pytest.raises(HTTPException) as exc:
+            await get_token_payload(auth)
+        assert exc.value.status_code == 401
+        assert mock_blacklist.await_count == 3
@@ -0,0 +1,140 @@
+import hashlib
+import os
+import sys
+import time
+from collections import OrderedDict
+from typing import Optional, Tuple
+
+from .metrics import metrics
+
+TOKEN_CACHE_MAX_ENTRIES = int(os.getenv("TOKEN_CACHE_MAX_ENTRIES", 10000))
+TOKEN_CACHE_MAX_BYTES = int(os.getenv("TOKEN_CACHE_MAX_BYTES", 16 * 1024 * 1024))
+# Верхняя граница жизни записи (и TTL для токенов без exp)
+TOKEN_CACHE_MAX_TTL = int(os.getenv("TOKEN_CACHE_MAX_TTL", 300))
+
+# Память записи помимо payload: ключ-digest, кортеж (payload, expires_at, size),
+# его float/int и узел OrderedDict (связный список + слот хэш-таблицы)
+_ENTRY_OVERHEAD = (
+    sys.getsizeof(bytes(16)) + sys.getsizeof((None, None, None))
+    + sys.getsizeof(0.0) + sys.getsizeof(2 ** 20) + 96
+)
+
+
+def _deep_size(obj) -> int:
+    """Размер JSON-значения (payload JWT) в памяти со всеми вложенными объектами."""
+    size = sys.getsizeof(obj)
+    if isinstance(obj, dict):
+        for key, value in obj.items():
+            size += _deep_size(key) + _deep_size(value)
+    elif isinstance(obj, (list, tuple)):
+        for item in obj:
+            size += _deep_size(item)
+    return size
+
+
+class TokenCache:
+    """
+    LRU/TTL кэш проверенных JWT: digest токена -> decoded payload.
+    - Запись живет до exp токена (но не дольше max_ttl).
+    - Ограничен по числу записей и по памяти (max_bytes): размер записи —
+      sys.getsizeof payload со всеми вложенными объектами плюс служебные.
+    - Храним только digest, а не сам токен.
+    Проверку отзыва (blacklist) кэш НЕ заменяет — она выполняется всегда.
+    """
+
+    def __init__(
+        self,
+        max_entries: int = TOKEN_CACHE_MAX_ENTRIES,
+        max_bytes: int = TOKEN_CACHE_MAX_BYTES,
+        max_ttl: int = TOKEN_CACHE_MAX_TTL,
+    ):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.max_ttl = max_ttl
+        self._entries: "OrderedDict[bytes, Tuple[dict, float, int]]" = OrderedDict()
+        self.size_bytes = 0
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_entries > 0 and self.max_bytes > 0
+
+    @staticmethod
+    def _digest(token: str) -> bytes:
+        return hashlib.blake2b(token.encode("utf-8"), digest_size=16).digest()
+
+    def get(self, token: str) -> Optional[dict]:
+        if not self.enabled:
+            return None
+        key = self._digest(token)
+        entry = self._entries.get(key)
+        if entry is None:
+            self._miss()
+            return None
+
+        payload, expires_at, _ = entry
+        if time.time() >= expires_at:
+            self._evict(key)
+            self._miss()
+            return None
+
+        self._entries.move_to_end(key)
+        self.hits += 1
+        metrics.inc("token_cache_hits_total")
+        return payload
+
+    def put(self, token: str, payload: dict):
+        if not self.enabled:
+            return
+        now = time.time()
+        expires_at = now + self.max_ttl
+        exp = payload.get("exp")
+        if isinstance(exp, (int, float)):
+            expires_at = min(expires_at, exp)
+        # nbf в будущем — пусть jwt.decode проверит его еще раз позже
+        nbf = payload.get("nbf")
+        if expires_at <= now or (isinstance(nbf, (int, float)) and nbf > now):
+            return
+
+        size = _deep_size(payload) + _ENTRY_OVERHEAD
+        if size > self.max_bytes:
+            return
+
+        key = self._digest(token)
+        if key in self._entries:
+            self._evict(key)
+        self._entries[key] = (payload, expires_at, size)
+        self.size_bytes += size
+
+        while len(self._entries) > self.max_entries or self.size_bytes > self.max_bytes:
+            oldest = next(iter(self._entries))
+            self._evict(oldest)
+            metrics.inc("token_cache_evictions_total")
+        metrics.set_gauge("token_cache_entries", len(self._entries))
+        metrics.set_gauge("token_cache_bytes", self.size_bytes)
+
+    def _miss(self):
+        self.misses += 1
+        metrics.inc("token_cache_misses_total")
+
+    def _evict(self, key: bytes):
+        _, _, size = self._entries.pop(key)
+        self.size_bytes -= size
+
+    def clear(self):
+        self._entries.clear()
+        self.size_bytes = 0
+        metrics.set_gauge("token_cache_entries", 0)
+        metrics.set_gauge("token_cache_bytes", 0)
+
+    def stats(self) -> dict:
+        return {
+            "entries": len(self._entries),
+            "bytes": self.size_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+        }
+
+
+token_cache = TokenCache()
@@ -0,0 +1,6 @@
+import os
+
+# common.security and user_service.security read these at import time, and
+# common/tests is collected before user_service/tests: set them once for all.
+os.environ["SECRET_KEY"] = "test-secret-key-123"
+os.environ["ALGORITHM"] = "HS256"
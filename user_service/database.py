@@ -1,8 +1,12 @@
-from sqlalchemy.orm import DeclarativeBase
+from sqlalchemy import event
+from sqlalchemy.orm import DeclarativeBase, Session
 from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine, AsyncSession
 import os
-from typing import Annotated
-from fastapi import Depends
+from typing import Annotated, Callable, Optional, Union
+from fastapi import Depends, Request
+from common.metrics import metrics
+from user_service.db_pool import engine_options
+from user_service.replica import ReplicaRouter
 
 SQLALCHEMY_DATABASE_URL = (
     f"postgresql+asyncpg://{os.getenv('POSTGRES_USER_DATABASE_USERNAME')}:"
@@ -12,7 +16,8 @@ SQLALCHEMY_DATABASE_URL = (
 )
 
 
-engine = create_async_engine(SQLALCHEMY_DATABASE_URL)
+# Профиль пула, pre-ping, recycle и кэш выражений asyncpg — см. db_pool.py
+engine = create_async_engine(**engine_options(SQLALCHEMY_DATABASE_URL))
 AsyncSessionLocal = async_sessionmaker(
     autocommit=False,
     autoflush=False,
@@ -22,16 +27,189 @@ AsyncSessionLocal = async_sessionmaker(
 )
 
 
+# Реплика для чтения (необязательна): те же учетные данные и имя БД, другой хост
+REPLICA_HOST = os.getenv("POSTGRES_USER_DATABASE_REPLICA_HOST")
+replica_engine = None
+ReplicaSessionLocal = None
+replica_router = None
+if REPLICA_HOST:
+    SQLALCHEMY_REPLICA_URL = (
+        f"postgresql+asyncpg://{os.getenv('POSTGRES_USER_DATABASE_USERNAME')}:"
+        f"{os.getenv('POSTGRES_USER_DATABASE_PASSWORD')}@"
+        f"{REPLICA_HOST}:5432/"
+        f"{os.getenv('POSTGRES_USER_DATABASE_NAME')}"
+    )
+    replica_engine = create_async_engine(**engine_options(SQLALCHEMY_REPLICA_URL, name="replica"))
+    ReplicaSessionLocal = async_sessionmaker(
+        autocommit=False,
+        autoflush=False,
+        bind=replica_engine,
+        class_=AsyncSession,
+        expire_on_commit=False
+    )
+    replica_router = ReplicaRouter(replica_engine)
+
+
 class Base(DeclarativeBase):
     pass
 
 
-async def get_db():
-    db = AsyncSessionLocal()
+# Флаги в Session.info: сессия хотя бы раз брала соединение из пула / что-то писала /
+# это сессия реплики
+DB_USED_KEY = "db_used"
+DB_WROTE_KEY = "db_wrote"
+REPLICA_SESSION_KEY = "replica"
+
+
+@event.listens_for(Session, "after_begin")
+def _mark_db_used(session, transaction, connection):
+    session.info[DB_USED_KEY] = True
+
+
+@event.listens_for(Session, "after_flush")
+def _mark_flush_written(session, flush_context):
+    session.info[DB_WROTE_KEY] = True
+
+
+@event.listens_for(Session, "do_orm_execute")
+def _mark_statement_written(orm_execute_state):
+    if orm_execute_state.is_insert or orm_execute_state.is_update or orm_execute_state.is_delete:
+        orm_execute_state.session.info[DB_WROTE_KEY] = True
+
+
+class LazySession:
+    """
+    Сессия запроса, которая создается при первом обращении к ней.
+    Маршрут, который получил сервис (AuthServiceDependency и т.п.), но не
+    сделал ни одного запроса (например, /auth/logout — только Redis), не
+    создает ни сессию, ни транзакцию, ни checkout соединения.
+    Все атрибуты проксируются в AsyncSession (primary).
+    Чтения, которым подходит реплика, берут сессию через read_session(db).
+    """
+
+    def __init__(
+        self,
+        factory: Optional[Callable[[], AsyncSession]] = None,
+        replica_factory: Optional[Callable[[], AsyncSession]] = None,
+        router: Optional[ReplicaRouter] = None,
+    ):
+        self._factory = factory or AsyncSessionLocal
+        self._replica_factory = replica_factory or ReplicaSessionLocal
+        self._router = router or replica_router
+        self._session: Optional[AsyncSession] = None
+        self._replica_session: Optional[AsyncSession] = None
+
+    @property
+    def session(self) -> AsyncSession:
+        if self._session is None:
+            self._session = self._factory()
+        return self._session
+
+    @property
+    def started(self) -> bool:
+        return self._session is not None
+
+    @property
+    def used_connection(self) -> bool:
+        return any(
+            session is not None and session.sync_session.info.get(DB_USED_KEY, False)
+            for session in (self._session, self._replica_session)
+        )
+
+    @property
+    def wrote(self) -> bool:
+        return self._session is not None and self._session.sync_session.info.get(DB_WROTE_KEY, False)
+
+    async def reader(self, key: Optional[str] = None) -> Union["LazySession", AsyncSession]:
+        """
+        Сессия для чтения: реплика, если она настроена и не отстает.
+        После записи в этой сессии (read-your-writes) — только primary:
+        реплика могла еще не получить изменение. Так же — если ключ key
+        (id пользователя) недавно изменялся в этом процессе (note_write).
+        """
+        if self._replica_factory is None or self._router is None:
+            return self
+        if self.wrote:
+            metrics.inc("db_replica_reads_total", labels={"target": "primary", "reason": "after_write"})
+            return self
+        if key is not None and self._router.recently_written(key):
+            metrics.inc("db_replica_reads_total", labels={"target": "primary", "reason": "recent_write"})
+            return self
+        if not await self._router.healthy():
+            metrics.inc("db_replica_reads_total", labels={"target": "primary", "reason": "lag"})
+            return self
+        if self._replica_session is None:
+            self._replica_session = self._replica_factory()
+            self._replica_session.info[REPLICA_SESSION_KEY] = True
+        metrics.inc("db_replica_reads_total", labels={"target": "replica", "reason": "ok"})
+        return self._replica_session
+
+    def note_write(self, key: str):
+        if self._router is not None:
+            self._router.note_write(key)
+
+    def __getattr__(self, name: str):
+        return getattr(self.session, name)
+
+    async def close(self):
+        if self._replica_session is not None:
+            await self._replica_session.close()
+        if self._session is not None:
+            await self._session.close()
+
+
+async def read_session(db: AsyncSession, key: Optional[str] = None) -> AsyncSession:
+    """
+    Сессия для read-only методов сервисов (get_user_by_id, get_all_roles, ...).
+    key — id пользователя, если читается его строка (см. note_write).
+    Обычная AsyncSession (тесты, фоновые задачи) возвращается как есть.
+    Объекты, полученные с реплики, не изменяйте: для записи читайте через db.
+    """
+    if isinstance(db, LazySession):
+        return await db.reader(key)
+    return db
+
+
+def note_write(db: AsyncSession, key: str):
+    """После commit изменения строки key: ее чтения в этом процессе — из primary."""
+    if isinstance(db, LazySession):
+        db.note_write(key)
+
+
+def is_replica_session(db: AsyncSession) -> bool:
+    return isinstance(db, AsyncSession) and db.info.get(REPLICA_SESSION_KEY, False)
+
+
+async def release_connection(db: AsyncSession):
+    """
+    Завершает текущую read-only транзакцию и возвращает соединение в пул.
+    Загруженные объекты остаются доступными (expire_on_commit=False),
+    а следующий запрос сессии возьмет соединение заново.
+    Если в сессии есть несохраненные изменения, ничего не делаем.
+    """
+    if isinstance(db, LazySession) and not db.started:
+        return
+    if db.new or db.dirty or db.deleted:
+        return
+    await db.commit()
+
+
+async def get_db(request: Request):
+    db = LazySession()
     try:
         yield db
     finally:
         await db.close()
+        # Какие маршруты действительно ходят в БД: db="none" — кандидаты
+        # на то, чтобы не зависеть от сервисов с сессией вовсе
+        route = getattr(request.scope.get("route"), "path", None) or request.url.path
+        if db.used_connection:
+            usage = "used"
+        elif db.started:
+            usage = "session_only"
+        else:
+            usage = "none"
+        metrics.inc("db_requests_total", labels={"route": route, "db": usage})
 
 
 db_dependency = Annotated[AsyncSession, Depends(get_db)]
@@ -0,0 +1,145 @@
+import asyncio
+import logging
+import os
+import time
+from typing import Optional
+
+from sqlalchemy import text
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import AsyncEngine
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+
+from common.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+# Профили пула соединений; любой параметр профиля переопределяется
+# своей переменной окружения (DB_POOL_SIZE, DB_MAX_OVERFLOW, ...).
+#   statement_cache_size — кэш подготовленных выражений asyncpg на соединение;
+#   pgbouncer — PgBouncer в режиме transaction: соединение сервера меняется
+#   между транзакциями, поэтому подготовленные выражения выключены.
+POOL_PROFILES = {
+    "small": {
+        "pool_size": 5, "max_overflow": 5, "pool_timeout": 10,
+        "pool_recycle": 1800, "pool_pre_ping": True, "statement_cache_size": 100,
+    },
+    "default": {
+        "pool_size": 10, "max_overflow": 10, "pool_timeout": 10,
+        "pool_recycle": 1800, "pool_pre_ping": True, "statement_cache_size": 100,
+    },
+    "large": {
+        "pool_size": 30, "max_overflow": 20, "pool_timeout": 10,
+        "pool_recycle": 1800, "pool_pre_ping": True, "statement_cache_size": 500,
+    },
+    "pgbouncer": {
+        "pool_size": 20, "max_overflow": 0, "pool_timeout": 10,
+        "pool_recycle": 300, "pool_pre_ping": True, "statement_cache_size": 0,
+    },
+}
+DB_POOL_PROFILE = os.getenv("DB_POOL_PROFILE", "default")
+
+_OVERRIDES = {
+    "pool_size": ("DB_POOL_SIZE", int),
+    "max_overflow": ("DB_MAX_OVERFLOW", int),
+    "pool_timeout": ("DB_POOL_TIMEOUT", float),
+    "pool_recycle": ("DB_POOL_RECYCLE", int),
+    "pool_pre_ping": ("DB_POOL_PRE_PING", lambda value: value.lower() == "true"),
+    "statement_cache_size": ("DB_STATEMENT_CACHE_SIZE", int),
+}
+
+
+def pool_settings(profile: Optional[str] = None) -> dict:
+    """Параметры профиля с учетом переменных окружения; ValueError — неизвестный профиль."""
+    profile = profile or DB_POOL_PROFILE
+    if profile not in POOL_PROFILES:
+        raise ValueError(f"Unknown DB_POOL_PROFILE {profile!r}, expected one of {sorted(POOL_PROFILES)}")
+    settings = dict(POOL_PROFILES[profile])
+    for key, (variable, parse) in _OVERRIDES.items():
+        value = os.getenv(variable)
+        if value is not None:
+            settings[key] = parse(value)
+    return settings
+
+
+class InstrumentedPool(AsyncAdaptedQueuePool):
+    """
+    Пул с телеметрией (метки pool=<pool_logging_name>):
+    db_pool_checkout_wait_seconds — сколько запрос ждал соединение
+    (очередь + установка нового соединения + pre-ping);
+    db_pool_in_use / db_pool_overflow — занятые и сверхлимитные соединения.
+    """
+
+    def _labels(self) -> dict:
+        return {"pool": self._orig_logging_name or "primary"}
+
+    def _update_gauges(self):
+        labels = self._labels()
+        metrics.set_gauge("db_pool_in_use", self.checkedout(), labels=labels)
+        metrics.set_gauge("db_pool_overflow", max(self.overflow(), 0), labels=labels)
+
+    def connect(self):
+        started = time.perf_counter()
+        try:
+            return super().connect()
+        finally:
+            metrics.observe("db_pool_checkout_wait_seconds", time.perf_counter() - started, labels=self._labels())
+            self._update_gauges()
+
+    def _do_return_conn(self, record):
+        super()._do_return_conn(record)
+        self._update_gauges()
+
+
+def engine_options(url: str, profile: Optional[str] = None, name: str = "primary") -> dict:
+    """
+    kwargs для create_async_engine(**engine_options(url)).
+    Кэш подготовленных выражений передается только драйверу asyncpg.
+    """
+    settings = pool_settings(profile)
+    statement_cache_size = settings.pop("statement_cache_size")
+    sa_url = make_url(url)
+    options = {
+        "url": sa_url,
+        "poolclass": InstrumentedPool,
+        "pool_logging_name": name,
+        **settings,
+    }
+    if sa_url.drivername == "postgresql+asyncpg":
+        options["url"] = sa_url.update_query_dict(
+            {"prepared_statement_cache_size": str(statement_cache_size)}
+        )
+        if statement_cache_size == 0:
+            # И собственный кэш asyncpg, иначе PgBouncer получит чужие prepared statements
+            options["connect_args"] = {"statement_cache_size": 0}
+    return options
+
+
+async def warm_up_pool(engine: AsyncEngine, connections: Optional[int] = None) -> int:
+    """
+    Заранее открывает соединения пула (по умолчанию — pool_size), чтобы первые
+    запросы после деплоя не платили за установку соединения и TLS.
+    Возвращает число прогретых соединений; ошибка подключения пробрасывается.
+    """
+    pool = engine.sync_engine.pool
+    if connections is None:
+        connections = pool.size() if hasattr(pool, "size") else 0
+    if connections <= 0:
+        return 0
+
+    async def open_connection():
+        conn = await engine.connect()
+        await conn.execute(text("SELECT 1"))
+        return conn
+
+    # Держим все соединения одновременно: иначе пул вернет одно и то же
+    results = await asyncio.gather(
+        *(open_connection() for _ in range(connections)), return_exceptions=True
+    )
+    opened = [conn for conn in results if not isinstance(conn, BaseException)]
+    for conn in opened:
+        await conn.close()
+    errors = [error for error in results if isinstance(error, BaseException)]
+    if errors:
+        raise errors[0]
+    logger.info("Warmed up %d database connections", len(opened))
+    return len(opened)
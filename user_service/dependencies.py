@@ -1,6 +1,5 @@
 from fastapi import Depends, HTTPException, status
-from user_service.database import db_dependency
-from sqlalchemy import select
+from user_service.database import db_dependency, read_session
 from user_service.models import User
 from fastapi.security import HTTPBearer
 from user_service.services.user_service import UserService
@@ -8,6 +7,8 @@ from typing import Annotated
 from common.security import get_token_payload
 from user_service.services.auth_service import AuthService
 from user_service.services.rbac_service import RBACService
+from user_service.security import ensure_hashing_capacity
+from user_service.user_cache import load_user
 
 oauth2_scheme = HTTPBearer()
 
@@ -18,8 +19,8 @@ async def get_current_user(
     # Use "sub" as per your login_user service logic
     user_id = payload.get("sub")
 
-    result = await db.execute(select(User).where(User.id == user_id))
-    user = result.scalar_one_or_none()
+    # Загруженный объект остается в сессии запроса: сервисы берут его оттуда
+    user = await load_user(await read_session(db, user_id), user_id)
 
     if user is None or not user.is_active:
         raise HTTPException(
@@ -31,6 +32,14 @@ async def get_current_user(
     return user
 
 
+async def require_hashing_capacity():
+    """
+    Admission control для эндпоинтов, которые заканчиваются bcrypt:
+    при заполненной очереди сразу отдаем 429, не трогая БД.
+    """
+    ensure_hashing_capacity()
+
+
 async def get_user_service(db: db_dependency) -> UserService:
     return UserService(db)
 
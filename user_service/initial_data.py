@@ -3,7 +3,7 @@ import os
 from sqlalchemy import select
 from user_service.database import AsyncSessionLocal
 from user_service.models import User, Role, RoleAccess
-from user_service.security import hash_password
+from user_service.security import hash_password_async
 
 async def init_db_data():
     """
@@ -56,7 +56,7 @@ async def init_db_data():
             result = await db.execute(select(User).where(User.email == admin_email))
             existing_admin = result.scalar_one_or_none()
             
-            new_password_hash = hash_password(os.getenv("ADMIN_PASSWORD", "admin123"))
+            new_password_hash = await hash_password_async(os.getenv("ADMIN_PASSWORD", "admin123"))
 
             if not existing_admin:
                 print(f"Seeding: Creating admin user '{admin_email}'...")
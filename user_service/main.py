@@ -1,10 +1,25 @@
+import logging
 from fastapi import FastAPI
-from user_service.database import engine
+from user_service.database import engine, replica_engine, AsyncSessionLocal
+from user_service.db_pool import warm_up_pool
 from user_service.models import Base
-from user_service.routers import user, admin, auth, business
+from user_service.routers import user, admin, auth, authz, business, metrics
 from contextlib import asynccontextmanager
 from fastapi.middleware.cors import CORSMiddleware
 from user_service.initial_data import init_db_data
+from user_service.password_hasher import password_hasher
+from user_service.services.rbac_service import RBACService
+from user_service.role_cache import role_permission_cache
+from common.redis_config import (
+    start_revocation_filter,
+    stop_revocation_filter,
+    start_role_table,
+    stop_role_table,
+    check_eviction_policy,
+)
+from common.role_table import use_role_refs
+
+logger = logging.getLogger(__name__)
 
 
 @asynccontextmanager
@@ -15,16 +30,47 @@ async def lifespan(app: FastAPI):
         await conn.run_sync(Base.metadata.create_all)
     print("Database tables created or already exist.")
 
+    # Open pool_size connections up front: the first requests after a deploy
+    # should not pay for connection setup
+    await warm_up_pool(engine)
+    if replica_engine is not None:
+        # The replica is optional: if it is down, ReplicaRouter sends reads
+        # to the primary, so the service must still start
+        try:
+            await warm_up_pool(replica_engine)
+        except Exception as exc:
+            logger.warning("Replica warm-up failed, reads will use the primary: %s", exc)
+
     # Seed initial data (Roles, Admin User)
     await init_db_data()
 
+    # Local revocation filter in front of the Redis blacklist
+    await check_eviction_policy()
+    await start_revocation_filter()
+
+    # Materialize effective (inherited) permissions of roles that have none yet.
+    # Roles that are already materialized are left alone, so a deploy does not
+    # invalidate role caches fleet-wide
+    async with AsyncSessionLocal() as db:
+        await RBACService(db).materialize_missing()
+        # Role-reference tokens (TOKEN_PERMISSION_MODE=role_ref) need every role
+        # in the shared role table; publish only the ones it lacks
+        if use_role_refs():
+            await role_permission_cache.publish_missing(db)
+    await start_role_table()
+
     # Yield control to the application
     yield
 
     # Shutdown logic (executed after the application stops receiving requests)
+    await stop_role_table()
+    await stop_revocation_filter()
     print("Application shutdown: Disposing database engine...")
     await engine.dispose()
+    if replica_engine is not None:
+        await replica_engine.dispose()
     print("Database engine disposed.")
+    password_hasher.shutdown()
 
 
 app = FastAPI(root_path="/api/user-service", lifespan=lifespan)
@@ -41,4 +87,6 @@ app.add_middleware(
 app.include_router(admin.router)
 app.include_router(user.router)
 app.include_router(auth.router)
+app.include_router(authz.router)
 app.include_router(business.router)
+app.include_router(metrics.router)
@@ -1,7 +1,7 @@
 from user_service.database import Base
 import uuid
 from sqlalchemy.orm import relationship, Mapped, mapped_column
-from sqlalchemy import ForeignKey, String, Boolean
+from sqlalchemy import ForeignKey, String, Boolean, Index, JSON, func
 from typing import Optional, List
 from datetime import datetime
 from sqlalchemy.schema import UniqueConstraint
@@ -42,6 +42,17 @@ class User(Base):
         default=datetime.now, onupdate=datetime.now
     )
 
+    __table_args__ = (
+        # Логин: поиск по lower(email) без обращения к таблице (index-only scan
+        # в PostgreSQL — все выбираемые колонки, включая email для сортировки
+        # точного совпадения, лежат в INCLUDE)
+        Index(
+            "ix_users_email_lower",
+            func.lower(email),
+            postgresql_include=["id", "email", "hashed_password", "is_active", "role_id"],
+        ),
+    )
+
 
 class Role(Base):
     __tablename__ = "roles"
@@ -92,4 +103,31 @@ class RoleAccess(Base):
     __table_args__ = (UniqueConstraint("role_id", "resource", name="uq_role_resource"),)
 
     def __repr__(self):
-        return f"<Access(res='{self.resource}', R={self.can_read}, W={self.can_write}, D={self.can_delete})>"
\ No newline at end of file
+        return f"<Access(res='{self.resource}', R={self.can_read}, W={self.can_write}, D={self.can_delete})>"
+
+class RoleParent(Base):
+    """Наследование ролей: role_id получает все права parent_id (граф без циклов)."""
+
+    __tablename__ = "role_parents"
+
+    role_id: Mapped[str] = mapped_column(
+        ForeignKey("roles.id", ondelete="CASCADE"), primary_key=True
+    )
+    parent_id: Mapped[str] = mapped_column(
+        ForeignKey("roles.id", ondelete="CASCADE"), primary_key=True, index=True
+    )
+
+
+class RoleEffectivePermissions(Base):
+    """
+    Материализованные эффективные права роли (собственные + унаследованные)
+    в виде фрагмента JWT payload: {"role", "g_perms", "access"}.
+    Пересчитывается RBACService при изменении ролей, а не при логине.
+    """
+
+    __tablename__ = "role_effective_permissions"
+
+    role_id: Mapped[str] = mapped_column(
+        ForeignKey("roles.id", ondelete="CASCADE"), primary_key=True
+    )
+    fragment: Mapped[dict] = mapped_column(JSON, nullable=False)
@@ -0,0 +1,99 @@
+import base64
+import json
+from typing import Any, List, Optional, Sequence, Tuple
+
+from fastapi import HTTPException, status
+from sqlalchemy import Select, func, select, text, tuple_
+from sqlalchemy.ext.asyncio import AsyncSession
+
+# Keyset-пагинация: страница — это "следующие limit строк после ключа
+# последней строки предыдущей страницы" по индексированному упорядоченному
+# ключу. Стоимость страницы не зависит от ее номера (в отличие от OFFSET),
+# а вставки/удаления между запросами не сдвигают страницы.
+MAX_PAGE_SIZE = 1000
+# Для эндпоинтов, у которых тело — простой список (например, /admin/roles/)
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+
+_ESTIMATE_QUERY = text("SELECT reltuples FROM pg_class WHERE oid = to_regclass(:table)")
+
+
+def encode_cursor(values: Sequence[Any]) -> str:
+    """Непрозрачный курсор из значений ключа (значения должны сериализоваться в JSON)."""
+    data = json.dumps(list(values), separators=(",", ":"))
+    return base64.urlsafe_b64encode(data.encode("utf-8")).rstrip(b"=").decode("ascii")
+
+
+def decode_cursor(cursor: str, types: Sequence[type]) -> List[Any]:
+    """
+    Значения ключа из курсора; types — Python-типы колонок ключа.
+    ValueError — курсор поврежден или от другого ключа (в т.ч. значение
+    другого типа: в запрос к БД оно не попадает).
+    """
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+    except (ValueError, UnicodeDecodeError):
+        raise ValueError("malformed cursor")
+    if not isinstance(values, list) or len(values) != len(types):
+        raise ValueError("malformed cursor")
+    for value, expected in zip(values, types):
+        # bool — подкласс int, но ключом быть не должен
+        if not isinstance(value, expected) or (isinstance(value, bool) and expected is not bool):
+            raise ValueError("malformed cursor")
+    return values
+
+
+def _key_type(key) -> type:
+    try:
+        return key.type.python_type
+    except NotImplementedError:
+        return object
+
+
+async def keyset_page(
+    db: AsyncSession,
+    stmt: Select,
+    keys: Sequence[Any],
+    limit: int,
+    cursor: Optional[str] = None,
+) -> Tuple[list, Optional[str]]:
+    """
+    Страница stmt по ключу keys (колонки, вместе уникальные; нужен индекс по ним).
+    Возвращает (объекты, курсор следующей страницы или None на последней).
+    Неверный курсор — 400.
+    """
+    if cursor:
+        try:
+            values = decode_cursor(cursor, [_key_type(key) for key in keys])
+        except ValueError:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid cursor")
+        if len(keys) == 1:
+            stmt = stmt.where(keys[0] > values[0])
+        else:
+            stmt = stmt.where(tuple_(*keys) > tuple_(*values))
+    # Лишняя строка показывает, есть ли следующая страница, без COUNT
+    stmt = stmt.order_by(*keys).limit(limit + 1)
+    rows = list((await db.execute(stmt)).scalars().all())
+    if len(rows) <= limit:
+        return rows, None
+    rows = rows[:limit]
+    last = rows[-1]
+    return rows, encode_cursor([getattr(last, key.key) for key in keys])
+
+
+async def exact_count(db: AsyncSession, model) -> int:
+    return (await db.execute(select(func.count()).select_from(model))).scalar_one()
+
+
+async def estimated_count(db: AsyncSession, model) -> Tuple[Optional[int], bool]:
+    """
+    (число строк, это оценка?). Оценка — из статистики планировщика
+    (pg_class.reltuples), без сканирования таблицы; точность — на момент
+    последнего ANALYZE/autovacuum; None — статистики еще нет.
+    На других СУБД (SQLite в тестах) — точный COUNT и False.
+    """
+    if db.get_bind().dialect.name != "postgresql":
+        return await exact_count(db, model), False
+    estimate = (await db.execute(_ESTIMATE_QUERY, {"table": model.__tablename__})).scalar()
+    if estimate is None or estimate < 0:
+        return None, True
+    return int(estimate), True
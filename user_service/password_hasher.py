@@ -0,0 +1,175 @@
+import asyncio
+import math
+import multiprocessing
+import os
+import time
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Callable, Optional
+
+import bcrypt
+
+from common.metrics import metrics
+
+# Количество процессов для bcrypt. 0 -> пул потоков (удобно для тестов/dev).
+PASSWORD_HASH_WORKERS = int(os.getenv("PASSWORD_HASH_WORKERS", os.cpu_count() or 1))
+# Сколько задач может ждать свободный слот; остальные сразу получают отказ.
+PASSWORD_HASH_MAX_QUEUE = int(os.getenv("PASSWORD_HASH_MAX_QUEUE", 32))
+# Сколько секунд задача может ждать слот, прежде чем получить отказ.
+PASSWORD_HASH_QUEUE_TIMEOUT = float(os.getenv("PASSWORD_HASH_QUEUE_TIMEOUT", 0.5))
+# spawn не наследует состояние event loop / соединений родителя
+PASSWORD_HASH_START_METHOD = os.getenv("PASSWORD_HASH_START_METHOD", "spawn")
+
+
+# --- Функции, исполняемые в дочерних процессах (должны быть picklable) ---
+
+def _bcrypt_hash(password: str) -> str:
+    hashed = bcrypt.hashpw(password.encode("utf-8"), bcrypt.gensalt())
+    return hashed.decode("utf-8")
+
+
+def _bcrypt_verify(plain_password: str, hashed_password: str) -> bool:
+    return bcrypt.checkpw(
+        plain_password.encode("utf-8"), hashed_password.encode("utf-8")
+    )
+
+
+class HashingOverloadedError(Exception):
+    """Нет свободного слота для bcrypt: очередь заполнена или истек дедлайн."""
+
+    def __init__(self, reason: str, retry_after: int):
+        super().__init__(f"Password hashing overloaded ({reason})")
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class AdmissionGate:
+    """
+    Ограничитель конкурентности с короткой очередью ожидания.
+    - limit: сколько задач выполняется одновременно;
+    - max_queue: сколько задач может ждать слот;
+    - timeout: сколько секунд задача ждет слот до отказа.
+    Отказ (HashingOverloadedError) происходит быстро, без работы с пулом.
+    """
+
+    def __init__(self, limit: int, max_queue: int, timeout: float):
+        self.limit = limit
+        self.max_queue = max_queue
+        self.timeout = timeout
+        self.active = 0
+        self.waiting = 0
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        # Скользящее среднее длительности задачи для оценки Retry-After
+        self._avg_seconds = 0.25
+
+    def _get_semaphore(self) -> asyncio.Semaphore:
+        # Семафор привязан к event loop, поэтому пересоздаем его при смене loop
+        loop = asyncio.get_running_loop()
+        if self._semaphore is None or self._loop is not loop:
+            self._semaphore = asyncio.Semaphore(self.limit)
+            self._loop = loop
+            self.active = 0
+            self.waiting = 0
+        return self._semaphore
+
+    def retry_after(self) -> int:
+        backlog = self.waiting + self.active
+        return max(1, math.ceil(self._avg_seconds * backlog / max(self.limit, 1)))
+
+    def _reject(self, reason: str):
+        metrics.inc("password_hash_rejected_total", labels={"reason": reason})
+        raise HashingOverloadedError(reason, self.retry_after())
+
+    def is_saturated(self) -> bool:
+        """Очередь заполнена: новую задачу точно не примем."""
+        return self.active >= self.limit and self.waiting >= self.max_queue
+
+    def ensure_capacity(self):
+        if self.is_saturated():
+            self._reject("queue_full")
+
+    async def acquire(self):
+        semaphore = self._get_semaphore()
+        if semaphore.locked():
+            if self.waiting >= self.max_queue:
+                self._reject("queue_full")
+            self.waiting += 1
+            metrics.set_gauge("password_hash_queue_depth", self.waiting)
+            try:
+                await asyncio.wait_for(semaphore.acquire(), self.timeout)
+            except asyncio.TimeoutError:
+                self._reject("timeout")
+            finally:
+                self.waiting -= 1
+                metrics.set_gauge("password_hash_queue_depth", self.waiting)
+        else:
+            await semaphore.acquire()
+        self.active += 1
+        metrics.set_gauge("password_hash_in_flight", self.active)
+
+    def release(self, duration: float):
+        self.active -= 1
+        metrics.set_gauge("password_hash_in_flight", self.active)
+        self._avg_seconds = 0.9 * self._avg_seconds + 0.1 * duration
+        self._semaphore.release()
+
+
+class PasswordHasher:
+    """
+    Выносит bcrypt из event loop в пул процессов.
+    - workers: размер пула (0 = пул потоков);
+    - max_queue / queue_timeout: параметры AdmissionGate перед пулом.
+    """
+
+    def __init__(
+        self,
+        workers: int = PASSWORD_HASH_WORKERS,
+        max_queue: int = PASSWORD_HASH_MAX_QUEUE,
+        queue_timeout: float = PASSWORD_HASH_QUEUE_TIMEOUT,
+        start_method: str = PASSWORD_HASH_START_METHOD,
+    ):
+        self.workers = workers
+        self.start_method = start_method
+        self.gate = AdmissionGate(max(workers, 1), max_queue, queue_timeout)
+        self._executor: Optional[Executor] = None
+        metrics.set_gauge("password_hash_pool_size", max(workers, 1))
+        metrics.set_gauge("password_hash_queue_limit", max_queue)
+
+    def _get_executor(self) -> Executor:
+        if self._executor is None:
+            if self.workers > 0:
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.workers,
+                    mp_context=multiprocessing.get_context(self.start_method),
+                )
+            else:
+                self._executor = ThreadPoolExecutor(
+                    max_workers=1, thread_name_prefix="bcrypt"
+                )
+        return self._executor
+
+    async def _run(self, op: str, func: Callable, *args):
+        await self.gate.acquire()
+        started = time.perf_counter()
+        try:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self._get_executor(), func, *args)
+        finally:
+            duration = time.perf_counter() - started
+            self.gate.release(duration)
+            metrics.inc("password_hash_total", labels={"op": op})
+            metrics.observe("password_hash_seconds", duration, labels={"op": op})
+
+    async def hash(self, password: str) -> str:
+        return await self._run("hash", _bcrypt_hash, password)
+
+    async def verify(self, plain_password: str, hashed_password: str) -> bool:
+        return await self._run("verify", _bcrypt_verify, plain_password, hashed_password)
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=True, cancel_futures=True)
+            self._executor = None
+
+
+password_hasher = PasswordHasher()
@@ -0,0 +1,102 @@
+import logging
+import os
+import time
+from typing import Awaitable, Callable, Dict, Optional
+
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncConnection, AsyncEngine
+
+from common.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+# Реплика, отстающая больше чем на столько секунд, не используется для чтения
+DB_REPLICA_MAX_LAG = float(os.getenv("DB_REPLICA_MAX_LAG", 2.0))
+# Как часто перемеряем отставание (между замерами решение берется из последнего)
+DB_REPLICA_LAG_CHECK_SECONDS = float(os.getenv("DB_REPLICA_LAG_CHECK_SECONDS", 5.0))
+
+# Сколько недавно измененных ключей (id пользователей) помнит процесс
+_RECENT_WRITES_MAX = 10000
+
+# Отставание в секундах; 0, если реплика проиграла все полученное WAL
+# (иначе простаивающая БД выглядела бы "отстающей" на время с последней записи)
+_POSTGRES_LAG_QUERY = text(
+    "SELECT CASE WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0 "
+    "ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0) END"
+)
+
+
+async def postgres_replication_lag(conn: AsyncConnection) -> float:
+    return float((await conn.execute(_POSTGRES_LAG_QUERY)).scalar() or 0)
+
+
+class ReplicaRouter:
+    """
+    Решает, можно ли сейчас читать с реплики.
+    Отставание измеряется не чаще раза в check_interval отдельным соединением
+    реплики; пока оно больше max_lag или замер не удался — чтения идут в primary.
+    note_write(key) — read-your-writes между запросами: чтения ключа (id
+    пользователя) идут в primary еще max_lag + check_interval секунд после
+    записи. Только в этом процессе: другой воркер может прочитать с реплики
+    строку, отстающую не больше чем на max_lag.
+    """
+
+    def __init__(
+        self,
+        engine: AsyncEngine,
+        lag_probe: Callable[[AsyncConnection], Awaitable[float]] = postgres_replication_lag,
+        max_lag: float = DB_REPLICA_MAX_LAG,
+        check_interval: float = DB_REPLICA_LAG_CHECK_SECONDS,
+    ):
+        self.engine = engine
+        self.lag_probe = lag_probe
+        self.max_lag = max_lag
+        self.check_interval = check_interval
+        self._healthy = False
+        self._checked_at: Optional[float] = None
+        self._checking = False
+        self._recent_writes: Dict[str, float] = {}
+
+    @property
+    def sticky_seconds(self) -> float:
+        # Реплика с отставанием <= max_lag на момент замера могла отстать
+        # еще на check_interval до следующего
+        return self.max_lag + self.check_interval
+
+    def note_write(self, key: str):
+        self._recent_writes.pop(key, None)
+        self._recent_writes[key] = time.monotonic() + self.sticky_seconds
+        if len(self._recent_writes) > _RECENT_WRITES_MAX:
+            del self._recent_writes[next(iter(self._recent_writes))]
+
+    def recently_written(self, key: str) -> bool:
+        until = self._recent_writes.get(key)
+        if until is None:
+            return False
+        if until <= time.monotonic():
+            del self._recent_writes[key]
+            return False
+        return True
+
+    async def healthy(self) -> bool:
+        now = time.monotonic()
+        if self._checking or (self._checked_at is not None and now - self._checked_at < self.check_interval):
+            return self._healthy
+        # Один замер на процесс: конкурентные запросы берут прошлый результат
+        self._checking = True
+        try:
+            async with self.engine.connect() as conn:
+                lag = await self.lag_probe(conn)
+            metrics.set_gauge("db_replica_lag_seconds", lag)
+            self._healthy = lag <= self.max_lag
+        except Exception as exc:
+            logger.warning("Replica lag check failed: %s", exc)
+            self._healthy = False
+        finally:
+            self._checked_at = time.monotonic()
+            self._checking = False
+        return self._healthy
+
+    def reset(self):
+        self._checked_at = None
+        self._recent_writes.clear()
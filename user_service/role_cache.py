@@ -0,0 +1,221 @@
+import json
+import logging
+import os
+import time
+from typing import Dict, List, Optional, Tuple
+
+import redis.asyncio as redis
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import joinedload
+
+from common import redis_config
+from common.role_table import ROLE_TABLE_KEY, store_role
+from common.metrics import metrics
+from user_service.models import Role, RoleEffectivePermissions
+
+logger = logging.getLogger(__name__)
+
+# Сколько секунд процесс доверяет локальной копии без сверки версии в Redis
+ROLE_CACHE_LOCAL_TTL = float(os.getenv("ROLE_CACHE_LOCAL_TTL", 5))
+# Срок жизни общего фрагмента в Redis (страховка от правок ролей в обход RBACService)
+ROLE_CACHE_REDIS_TTL = int(os.getenv("ROLE_CACHE_REDIS_TTL", 3600))
+
+VERSION_PREFIX = "role_version:"
+FRAGMENT_PREFIX = "role_perms:"
+
+# Фрагмент payload для пользователя без роли
+GUEST_FRAGMENT = {
+    "role": "guest",
+    "g_perms": {"r_all": False, "w_all": False},
+    "access": {},
+}
+
+
+def build_role_fragment(role) -> dict:
+    """Часть JWT payload, зависящая только от роли: role, g_perms, access."""
+    if role is None:
+        return GUEST_FRAGMENT
+    return {
+        "role": role.name,
+        "g_perms": {
+            "r_all": getattr(role, "can_read_all", False),
+            "w_all": getattr(role, "can_write_all", False),
+        },
+        "access": {
+            access.resource: {
+                "r": int(access.can_read),
+                "w": int(access.can_write),
+                "d": int(access.can_delete),
+            }
+            for access in role.access_list
+        },
+    }
+
+
+def merge_inherited(own: dict, inherited: List[dict]) -> dict:
+    """
+    Эффективные права роли: глобальные флаги и права на ресурс — OR по всем
+    родителям; собственное правило роли на тот же ресурс важнее унаследованных
+    (так роль может сузить доступ, полученный от родителя).
+    """
+    g_perms = dict(own["g_perms"])
+    access: Dict[str, dict] = {}
+    for parent in inherited:
+        for flag, value in parent["g_perms"].items():
+            g_perms[flag] = bool(g_perms.get(flag)) or bool(value)
+        for resource, rules in parent["access"].items():
+            current = access.get(resource)
+            if current is None:
+                access[resource] = dict(rules)
+            else:
+                access[resource] = {
+                    action: int(bool(current.get(action)) or bool(rules.get(action)))
+                    for action in ("r", "w", "d")
+                }
+    access.update(own["access"])
+    return {"role": own["role"], "g_perms": g_perms, "access": access}
+
+
+class RolePermissionCache:
+    """
+    Версионированный кэш role_id -> фрагмент прав для выдачи токенов.
+    - Локально: role_id -> (version, fragment, checked_at); в течение
+      local_ttl секунд используется без обращения к Redis.
+    - Redis (общий для воркеров): role_version:{id} — счетчик версии,
+      role_perms:{id} — JSON {"v": version, "fragment": {...}}.
+    - Сверка — один MGET; при промахе фрагмент строится из БД и кладется в Redis.
+    - invalidate() увеличивает версию: остальные воркеры увидят ее
+      не позже чем через local_ttl.
+    Если Redis недоступен, фрагмент строится из БД (логин не ломается).
+    """
+
+    def __init__(self, local_ttl: float = ROLE_CACHE_LOCAL_TTL, redis_ttl: int = ROLE_CACHE_REDIS_TTL):
+        self.local_ttl = local_ttl
+        self.redis_ttl = redis_ttl
+        self._local: Dict[str, Tuple[Optional[int], dict, float]] = {}
+
+    async def get_fragment(self, db: AsyncSession, role_id: Optional[str]) -> dict:
+        return (await self.get_entry(db, role_id))[1]
+
+    async def get_entry(self, db: AsyncSession, role_id: Optional[str]) -> Tuple[int, dict]:
+        """(версия роли, фрагмент прав); версия нужна для role_ref токенов."""
+        if role_id is None:
+            return 0, GUEST_FRAGMENT
+
+        local = self._local.get(role_id)
+        if local is not None and time.monotonic() - local[2] < self.local_ttl:
+            metrics.inc("role_cache_hits_total", labels={"tier": "local"})
+            return local[0] or 0, local[1]
+
+        try:
+            raw_version, raw_fragment = await redis_config.redis_breaker.call(
+                redis_config.lookup_batcher.submit,
+                "mget", [f"{VERSION_PREFIX}{role_id}", f"{FRAGMENT_PREFIX}{role_id}"],
+            )
+        except redis.RedisError as exc:
+            logger.warning("Role cache: Redis unavailable, building from DB: %s", exc)
+            metrics.inc("role_cache_misses_total", labels={"reason": "redis_error"})
+            return 0, await self._load_from_db(db, role_id)
+
+        version = int(raw_version or 0)
+        if local is not None and local[0] == version:
+            self._local[role_id] = (version, local[1], time.monotonic())
+            metrics.inc("role_cache_hits_total", labels={"tier": "local"})
+            return version, local[1]
+
+        if raw_fragment:
+            stored = json.loads(raw_fragment)
+            if stored.get("v") == version:
+                self._local[role_id] = (version, stored["fragment"], time.monotonic())
+                metrics.inc("role_cache_hits_total", labels={"tier": "redis"})
+                return version, stored["fragment"]
+
+        metrics.inc("role_cache_misses_total", labels={"reason": "stale"})
+        fragment = await self._load_from_db(db, role_id)
+        self._local[role_id] = (version, fragment, time.monotonic())
+        try:
+            # Версия записана та, что была прочитана ДО запроса в БД:
+            # если роль изменили в это время, читатели увидят несовпадение.
+            await redis_config.redis_breaker.call(
+                redis_config.redis_client.set,
+                f"{FRAGMENT_PREFIX}{role_id}",
+                json.dumps({"v": version, "fragment": fragment}),
+                ex=self.redis_ttl,
+            )
+        except redis.RedisError as exc:
+            logger.warning("Role cache: failed to store fragment: %s", exc)
+        return version, fragment
+
+    async def _load_from_db(self, db: AsyncSession, role_id: str) -> dict:
+        # Материализованные эффективные права (с учетом наследования) — одна строка
+        stmt = select(RoleEffectivePermissions.fragment).where(
+            RoleEffectivePermissions.role_id == role_id
+        )
+        fragment = (await db.execute(stmt)).scalar_one_or_none()
+        if fragment is not None:
+            return fragment
+
+        # Права еще не материализованы (роль создана в обход RBACService):
+        # роль и ее собственные права одним запросом (LEFT OUTER JOIN role_access).
+        # populate_existing: роль могла остаться в сессии со старым access_list.
+        stmt = (
+            select(Role)
+            .options(joinedload(Role.access_list))
+            .where(Role.id == role_id)
+            .execution_options(populate_existing=True)
+        )
+        result = await db.execute(stmt)
+        return build_role_fragment(result.unique().scalar_one_or_none())
+
+    async def invalidate(self, db: AsyncSession, role_id: str, deleted: bool = False):
+        """
+        Вызывать ПОСЛЕ commit изменений роли: новая версия роли, сброс
+        фрагмента и публикация актуальных прав в общую таблицу ролей
+        (role_table) для role_ref токенов.
+        """
+        self._local.pop(role_id, None)
+        try:
+            async with redis_config.redis_client.pipeline(transaction=False) as pipe:
+                pipe.incr(f"{VERSION_PREFIX}{role_id}")
+                pipe.delete(f"{FRAGMENT_PREFIX}{role_id}")
+                version, _ = await redis_config.redis_breaker.call(pipe.execute)
+            # Права читаются ПОСЛЕ увеличения версии: запись с большей
+            # версией всегда содержит не более старые права
+            fragment = None if deleted else await self._load_from_db(db, role_id)
+            await redis_config.redis_breaker.call(
+                store_role, redis_config.redis_client, role_id, int(version), fragment
+            )
+            # Этот процесс видит изменение сразу, остальные — по pub/sub
+            redis_config.role_table.set(role_id, int(version), fragment)
+        except redis.RedisError as exc:
+            # Изменение в БД уже сохранено; остальные воркеры догонят по ROLE_CACHE_REDIS_TTL
+            logger.warning("Role cache: failed to invalidate role %s: %s", role_id, exc)
+            metrics.inc("role_cache_invalidation_errors_total")
+
+    async def publish_missing(self, db: AsyncSession) -> int:
+        """
+        Для role_ref токенов при старте: публикует в role_table только роли,
+        которых там нет (например, Redis очищен). Один HMGET, если все на месте.
+        Возвращает число опубликованных ролей.
+        """
+        role_ids = (await db.execute(select(Role.id))).scalars().all()
+        if not role_ids:
+            return 0
+        try:
+            stored = await redis_config.redis_breaker.call(
+                redis_config.redis_client.hmget, ROLE_TABLE_KEY, role_ids
+            )
+        except redis.RedisError as exc:
+            logger.warning("Role cache: failed to check the role table: %s", exc)
+            return 0
+        missing = [role_id for role_id, raw in zip(role_ids, stored) if raw is None]
+        for role_id in missing:
+            await self.invalidate(db, role_id)
+        return len(missing)
+
+    def clear(self):
+        self._local.clear()
+
+
+role_permission_cache = RolePermissionCache()
@@ -1,8 +1,9 @@
-from fastapi import APIRouter, status, Depends
-from user_service.schemas import RoleResponse, RoleCreate, PermissionSet
+from fastapi import APIRouter, status, Depends, Query, Response
+from user_service.schemas import RoleResponse, RoleCreate, PermissionSet, RoleParentSet
 from user_service.dependencies import RBACServiceDependency
 from common.security import CheckAccess
-from typing import List
+from typing import List, Optional
+from user_service.pagination import MAX_PAGE_SIZE, NEXT_CURSOR_HEADER
 
 router = APIRouter(prefix="/admin/roles", tags=["Admin"])
 
@@ -12,9 +13,23 @@ router = APIRouter(prefix="/admin/roles", tags=["Admin"])
     response_model=List[RoleResponse],
     dependencies=[Depends(CheckAccess("roles", "read"))],
 )
-async def get_all_roles(rbac_service: RBACServiceDependency):
-    """Список всех доступных ролей с их правами."""
-    return await rbac_service.get_all_roles()
+async def get_all_roles(
+    rbac_service: RBACServiceDependency,
+    response: Response,
+    limit: Optional[int] = Query(None, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+):
+    """
+    Список всех доступных ролей с их правами.
+    С limit — постранично по имени; курсор следующей страницы приходит
+    в заголовке X-Next-Cursor (тело остается списком, как без limit).
+    """
+    if limit is None:
+        return await rbac_service.get_all_roles()
+    roles, next_cursor = await rbac_service.get_roles_page(limit, cursor)
+    if next_cursor:
+        response.headers[NEXT_CURSOR_HEADER] = next_cursor
+    return roles
 
 
 @router.post(
@@ -32,6 +47,7 @@ async def create_new_role(
         name=role_data.name,
         can_read_all=role_data.can_read_all,
         can_write_all=role_data.can_write_all,
+        parents=role_data.parents,
     )
 
 
@@ -55,6 +71,43 @@ async def set_permission_for_role(
     )
 
 
+@router.get(
+    "/{role_name}/parents",
+    response_model=List[str],
+    dependencies=[Depends(CheckAccess("roles", "read"))],
+)
+async def get_role_parents(role_name: str, rbac_service: RBACServiceDependency):
+    """Роли, от которых роль наследует права."""
+    return await rbac_service.get_parent_names(role_name)
+
+
+@router.post(
+    "/{role_name}/parents",
+    response_model=RoleResponse,
+    dependencies=[Depends(CheckAccess("roles", "write"))],
+)
+async def add_role_parent(
+    role_name: str, parent_data: RoleParentSet, rbac_service: RBACServiceDependency
+):
+    """
+    Наследование: роль получает все права родительской роли.
+    Эффективные права роли и ее потомков пересчитываются сразу.
+    """
+    return await rbac_service.add_parent(role_name, parent_data.parent)
+
+
+@router.delete(
+    "/{role_name}/parents/{parent_name}",
+    response_model=RoleResponse,
+    dependencies=[Depends(CheckAccess("roles", "write"))],
+)
+async def remove_role_parent(
+    role_name: str, parent_name: str, rbac_service: RBACServiceDependency
+):
+    """Убрать наследование от родительской роли."""
+    return await rbac_service.remove_parent(role_name, parent_name)
+
+
 @router.get(
     "/{role_name}",
     response_model=RoleResponse,
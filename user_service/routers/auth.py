@@ -1,17 +1,39 @@
-from fastapi import APIRouter, status, Depends
-from user_service.schemas import UserRegister, UserLogin, TokenPair, RefreshRequest, UserResponse
+import os
+import time
+import redis.asyncio as redis
+from fastapi import APIRouter, status, Depends, HTTPException, Response
+from user_service.schemas import (
+    UserRegister,
+    UserLogin,
+    TokenPair,
+    RefreshRequest,
+    UserResponse,
+    TokenIntrospectRequest,
+    TokenIntrospectResponse,
+)
 from user_service.dependencies import (
     db_dependency,
     get_token_payload,
     UserServiceDependency,
     AuthServiceDependency,
+    require_hashing_capacity,
 )
+from common.gateway import identity_headers
+from common.permissions import resolve_permissions
+from common.security import CheckAccess, introspect_tokens
+
+# Сколько секунд промежуточный кэш может переиспользовать ответ /auth/verify.
+# 0 — не переиспользовать: иначе отзыв токена вступит в силу с этой задержкой.
+GATEWAY_VERIFY_MAX_AGE = int(os.getenv("GATEWAY_VERIFY_MAX_AGE", 0))
 
 router = APIRouter(prefix="/auth", tags=["Authentication"])
 
 print(f"DEBUG: TokenPair is {TokenPair}")
 @router.post(
-    "/register", response_model=UserResponse, status_code=status.HTTP_201_CREATED
+    "/register",
+    response_model=UserResponse,
+    status_code=status.HTTP_201_CREATED,
+    dependencies=[Depends(require_hashing_capacity)],
 )
 async def register_new_user(
     new_user_info: UserRegister, user_service: UserServiceDependency
@@ -20,7 +42,11 @@ async def register_new_user(
     return created_user
 
 
-@router.post("/token", response_model=TokenPair)
+@router.post(
+    "/token",
+    response_model=TokenPair,
+    dependencies=[Depends(require_hashing_capacity)],
+)
 async def login(
     login_data: UserLogin,
     auth_service: AuthServiceDependency,
@@ -38,6 +64,16 @@ async def logout(
     return {"detail": "Successfully logged out"}
 
 
+@router.post("/logout-all")
+async def logout_all(
+    auth_service: AuthServiceDependency,
+    payload: dict = Depends(get_token_payload),
+):
+    """Отзывает все токены пользователя (все устройства) одной записью."""
+    await auth_service.logout_all_sessions(payload)
+    return {"detail": "Successfully logged out from all sessions"}
+
+
 @router.post("/refresh", response_model=TokenPair)
 async def refresh_tokens(
     request: RefreshRequest,
@@ -45,3 +81,54 @@ async def refresh_tokens(
 ):
 
     return await auth_service.refresh_access_token(request.refresh_token)
+
+
+@router.get("/verify", status_code=status.HTTP_200_OK)
+async def verify(payload: dict = Depends(get_token_payload)):
+    """
+    Traefik forwardAuth: проверка токена (кэш проверенных токенов, фильтр
+    отзывов) без БД. 200 + заголовки X-User-Id / X-Role / X-Perms / X-Token-Id /
+    X-Auth-Expires / X-Auth-Signature, которые Traefik передает в бэкенд;
+    401/503 Traefik возвращает клиенту как есть.
+    """
+    # Refresh токен живет дольше и не должен открывать доступ к бэкендам
+    if payload.get("type") != "access":
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Access token required",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+    try:
+        permissions = await resolve_permissions(payload)
+    except redis.RedisError:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Authentication check unavailable",
+        )
+    headers = dict(identity_headers(payload, permissions))
+    max_age = GATEWAY_VERIFY_MAX_AGE
+    exp = payload.get("exp")
+    if isinstance(exp, (int, float)):
+        max_age = max(0, min(max_age, int(exp - time.time())))
+    headers["Cache-Control"] = f"private, max-age={max_age}" if max_age else "private, no-cache"
+    headers["Vary"] = "Authorization"
+    # Пустое тело: ответ нужен только ради статуса и заголовков
+    return Response(status_code=status.HTTP_200_OK, headers=headers)
+
+
+@router.post(
+    "/introspect",
+    response_model=TokenIntrospectResponse,
+    dependencies=[Depends(CheckAccess("tokens", "read"))],
+)
+async def introspect(request: TokenIntrospectRequest):
+    """
+    Пакетная проверка токенов для других сервисов (RFC 7662, JSON вместо form).
+    Вызывающий предъявляет свой токен с правом tokens:read.
+    Отзыв всех токенов проверяется одним обращением к Redis; БД не используется.
+    """
+    payloads = await introspect_tokens(request.tokens)
+    return TokenIntrospectResponse(results=[
+        {"active": True, **payload} if payload is not None else {"active": False}
+        for payload in payloads
+    ])
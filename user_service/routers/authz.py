@@ -0,0 +1,20 @@
+from fastapi import APIRouter, Depends
+from common.security import get_token_payload, authorize_many
+from user_service.schemas import AuthzCheckRequest, AuthzCheckResponse
+
+router = APIRouter(prefix="/authz", tags=["Authorization"])
+
+
+@router.post("/check", response_model=AuthzCheckResponse)
+async def check_permissions(
+    request: AuthzCheckRequest, payload: dict = Depends(get_token_payload)
+):
+    """
+    Пакетная проверка прав владельца токена (токен — в Authorization).
+    Возвращает решение для каждой пары (resource, action) в том же порядке.
+    БД не используется: права берутся из токена / локальной таблицы ролей.
+    """
+    decisions = await authorize_many(
+        payload, [(check.resource, check.action) for check in request.checks]
+    )
+    return AuthzCheckResponse(sub=payload.get("sub"), decisions=decisions)
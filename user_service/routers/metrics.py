@@ -0,0 +1,11 @@
+from fastapi import APIRouter, Depends
+from common.metrics import metrics
+from common.security import CheckAccess
+
+router = APIRouter(prefix="/metrics", tags=["Metrics"])
+
+
+@router.get("/", dependencies=[Depends(CheckAccess("metrics", "read"))])
+async def get_metrics() -> dict:
+    """Снимок in-process метрик воркера (пулы, очереди, кэши)."""
+    return metrics.snapshot()
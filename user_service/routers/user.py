@@ -1,8 +1,9 @@
-from fastapi import APIRouter, status, Response, Depends
-from user_service.schemas import UserUpdate, UserResponse
+from fastapi import APIRouter, status, Response, Depends, Query
+from user_service.schemas import UserUpdate, UserResponse, Page, CountMode
+from user_service.pagination import MAX_PAGE_SIZE
 from user_service.dependencies import UserServiceDependency, CurrentUserDependency
 from common.security import CheckAccess
-from typing import List
+from typing import List, Optional
 
 router = APIRouter(prefix="/user", tags=["Users"])
 
@@ -38,14 +39,22 @@ async def delete_my_profile(
 # --- ADMIN PANEL ---
 
 
-@router.get("/", dependencies=[Depends(CheckAccess("users", "read"))])
+@router.get(
+    "/",
+    response_model=Page[UserResponse],
+    dependencies=[Depends(CheckAccess("users", "read"))],
+)
 async def get_all_users(
     user_service: UserServiceDependency,
-    skip: int = 0,
-    limit: int = 100,
+    limit: int = Query(100, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    count: CountMode = "none",
 ):
-    # Note: Ensure get_all_users is implemented in your UserService class
-    return await user_service.get_all_users(skip, limit)
+    """
+    Постраничный список: следующая страница — ?cursor=<next_cursor>.
+    count=estimate — оценка total по статистике Postgres, exact — COUNT(*).
+    """
+    return await user_service.get_all_users(limit, cursor, count)
 
 
 @router.get(
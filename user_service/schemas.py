@@ -1,5 +1,6 @@
+import os
 from pydantic import BaseModel, ConfigDict, Field, model_validator
-from typing import Optional, List
+from typing import Generic, Literal, Optional, List, TypeVar
 from datetime import datetime
 
 
@@ -81,7 +82,11 @@ class RoleBase(BaseModel):
     can_write_all: bool = False
 
 class RoleCreate(RoleBase):
-    pass
+    # Роли, права которых наследует новая роль
+    parents: List[str] = []
+
+class RoleParentSet(BaseModel):
+    parent: str
 
 class RoleResponse(RoleBase):
     id: str
@@ -107,4 +112,48 @@ class AccessRoleRuleCreate(AccessRoleRuleBase):
 
 class AccessRoleRuleResponse(AccessRoleRuleBase):
     id: str
-    model_config = ConfigDict(from_attributes=True)
\ No newline at end of file
+    model_config = ConfigDict(from_attributes=True)
+
+
+class AuthzCheck(BaseModel):
+    resource: str
+    action: Literal["read", "write", "delete"]
+
+
+class AuthzCheckRequest(BaseModel):
+    checks: List[AuthzCheck] = Field(max_length=1000)
+
+
+class AuthzCheckResponse(BaseModel):
+    sub: Optional[str] = None
+    # decisions[i] — решение для checks[i]
+    decisions: List[bool]
+
+
+# Сколько токенов можно проверить одним запросом /auth/introspect
+INTROSPECT_MAX_TOKENS = int(os.getenv("INTROSPECT_MAX_TOKENS", 100))
+
+
+class TokenIntrospectRequest(BaseModel):
+    tokens: List[str] = Field(min_length=1, max_length=INTROSPECT_MAX_TOKENS)
+
+
+class TokenIntrospectResponse(BaseModel):
+    # results[i] — ответ для tokens[i] в духе RFC 7662: {"active": false}
+    # или {"active": true, <claims токена>}
+    results: List[dict]
+
+
+T = TypeVar("T")
+
+# Как считать total в постраничных ответах: не считать, оценка по статистике
+# планировщика (дешево) или точный COUNT(*) (полное сканирование)
+CountMode = Literal["none", "estimate", "exact"]
+
+
+class Page(BaseModel, Generic[T]):
+    items: List[T]
+    # Курсор следующей страницы (None — это последняя)
+    next_cursor: Optional[str] = None
+    total: Optional[int] = None
+    total_is_estimate: bool = False
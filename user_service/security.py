@@ -6,7 +6,10 @@ from datetime import timedelta, datetime, timezone
 import os
 from passlib.context import CryptContext
 import uuid
+import base64
+import secrets
 from jwt.exceptions import PyJWTError
+from user_service.password_hasher import password_hasher, HashingOverloadedError
 
 SECRET_KEY = os.getenv("SECRET_KEY")
 if not SECRET_KEY:
@@ -22,6 +25,9 @@ if not ACCESS_TOKEN_EXPIRE_MINUTES:
 
 REFRESH_TOKEN_EXPIRE_DAYS = 7
 
+# Формат jti: uuid — 36 символов; short — 16 случайных байт в base64url (22 символа)
+TOKEN_JTI_FORMAT = os.getenv("TOKEN_JTI_FORMAT", "uuid")
+
 # bcrypt_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 
 
@@ -40,6 +46,44 @@ def verify_password(plain_password, hashed_password):
     )
 
 
+# Асинхронные версии для обработчиков: bcrypt выполняется в пуле процессов
+# и не блокирует event loop. При перегрузке пула отвечаем 429.
+def _too_many_requests(exc: HashingOverloadedError) -> HTTPException:
+    return HTTPException(
+        status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+        detail="Too many authentication requests, try again later",
+        headers={"Retry-After": str(exc.retry_after)},
+    )
+
+
+def ensure_hashing_capacity():
+    """Быстрый отказ до любой работы с БД, если очередь bcrypt уже заполнена."""
+    try:
+        password_hasher.gate.ensure_capacity()
+    except HashingOverloadedError as exc:
+        raise _too_many_requests(exc)
+
+
+async def hash_password_async(password: str) -> str:
+    try:
+        return await password_hasher.hash(password)
+    except HashingOverloadedError as exc:
+        raise _too_many_requests(exc)
+
+
+async def verify_password_async(plain_password: str, hashed_password: str) -> bool:
+    try:
+        return await password_hasher.verify(plain_password, hashed_password)
+    except HashingOverloadedError as exc:
+        raise _too_many_requests(exc)
+
+
+def new_jti() -> str:
+    if TOKEN_JTI_FORMAT == "short":
+        return base64.urlsafe_b64encode(secrets.token_bytes(16)).rstrip(b"=").decode("ascii")
+    return str(uuid.uuid4())
+
+
 def create_token(
     data: Dict[str, Any],
     expires_delta: Union[timedelta, None] = None,
@@ -64,7 +108,7 @@ def create_token(
     to_encode.update(
         {
             "exp": expire,
-            "jti": str(uuid.uuid4()),  # Уникальный ID
+            "jti": new_jti(),  # Уникальный ID
             "type": token_type,  # "access" или "refresh"
         }
     )
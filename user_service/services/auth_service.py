@@ -1,12 +1,19 @@
+import asyncio
+from typing import Optional
 from datetime import datetime, timezone
 from fastapi import HTTPException, status
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select
-from sqlalchemy.orm import selectinload
+from sqlalchemy import func, select
 from user_service.schemas import TokenPair, UserLogin
-from user_service.security import verify_password, create_access_token, create_refresh_token, decode_access_token
-from user_service.models import User, Role
-from common.redis_config import is_token_blacklisted
+from user_service.security import verify_password_async, create_access_token, create_refresh_token, decode_access_token
+from user_service.models import User
+from user_service.database import release_connection
+from user_service.role_cache import build_role_fragment, role_permission_cache
+import redis.asyncio as redis
+from common import redis_config
+from common.redis_config import consume_token_once, get_user_generation, bump_user_generation
+from common.role_table import use_role_refs
+from common.compact_permissions import use_compact_permissions
 
 
 # Импортируем функцию для работы с Redis из common-библиотеки
@@ -18,7 +25,7 @@ except ImportError:
     # Заглушка, если библиотека common не найдена
     print("Warning: common.redis_client not found. Logout will not work.")
 
-    async def add_token_to_blacklist(jti: str, expire_seconds: int):
+    async def add_token_to_blacklist(jti: str, expire_seconds: int, exp=None):
         pass
 
 
@@ -26,55 +33,93 @@ class AuthService:
     def __init__(self, db: AsyncSession):
         self.db = db
 
-    def _create_payload(self, user: User) -> dict:
-        role_name = "guest"
-        global_perms = {"r_all": False, "w_all": False}
-        resource_access = {}
-
-        if user.role:
-            role_name = user.role.name
-            global_perms = {
-                "r_all": getattr(user.role, "can_read_all", False),
-                "w_all": getattr(user.role, "can_write_all", False),
-            }
-            # Access list is loaded via selectinload, so iterating it is safe
-            for access in user.role.access_list:
-                resource_access[access.resource] = {
-                    "r": int(access.can_read),
-                    "w": int(access.can_write),
-                    "d": int(access.can_delete),
-                }
-
+    def _create_payload(self, user: User, role_claims: Optional[dict] = None) -> dict:
+        """
+        role_claims — готовая часть payload с правами роли (см. _role_claims).
+        Без нее права собираются из загруженного user.role.
+        """
+        if role_claims is None:
+            role_claims = build_role_fragment(user.role)
         return {
             "sub": str(user.id),
             "email": user.email,
-            "role": role_name,
-            "g_perms": global_perms,
-            "access": resource_access,
+            **role_claims,
         }
 
-    async def login_user(self, login_info: UserLogin) -> TokenPair:
-        """Вход в систему: выдача пары токенов."""
+    async def _get_credentials(self, email: str):
+        """
+        Строка (id, email, hashed_password, is_active, role_id) по email без учета регистра.
+        Если есть несколько адресов, отличающихся только регистром, точное совпадение — первым.
+        """
         stmt = (
-            select(User)
-            .options(selectinload(User.role).selectinload(Role.access_list))
-            .where(User.email == login_info.email)
+            select(User.id, User.email, User.hashed_password, User.is_active, User.role_id)
+            .where(func.lower(User.email) == email.lower())
+            .order_by((User.email == email).desc())
+            .limit(1)
         )
         result = await self.db.execute(stmt)
-        user = result.scalar_one_or_none()
+        return result.first()
 
-        if user is None or not verify_password(
-            login_info.password, user.hashed_password
+    async def _role_claims(self, role_id: Optional[str]) -> dict:
+        """
+        Права роли для payload:
+        - embedded: role, g_perms, access целиком;
+        - role_ref: role, rid (id роли) и rv (версия) — права сервисы берут
+          из своей таблицы ролей, поэтому изменения применяются сразу;
+        - compact: role, gp/pm/pd — маски по индексам словаря ресурсов.
+        """
+        # При промахе кэша читает роль из БД — соединение сразу отдаем обратно
+        version, fragment = await role_permission_cache.get_entry(self.db, role_id)
+        await release_connection(self.db)
+        if use_role_refs():
+            return {"role": fragment["role"], "rid": role_id, "rv": version}
+        if use_compact_permissions():
+            return await self._compact_claims(fragment)
+        return fragment
+
+    async def _compact_claims(self, fragment: dict) -> dict:
+        dictionary = redis_config.resource_dictionary
+        claims = dictionary.encode(fragment)
+        if claims is not None:
+            return claims
+        try:
+            # Новый ресурс: выдаем индекс в общем словаре (один раз на ресурс)
+            await redis_config.redis_breaker.call(
+                dictionary.ensure, redis_config.redis_client, fragment["access"]
+            )
+        except redis.RedisError:
+            # Без словаря — прежний формат, сервисы понимают оба
+            return fragment
+        return dictionary.encode(fragment) or fragment
+
+    async def login_user(self, login_info: UserLogin) -> TokenPair:
+        """Вход в систему: выдача пары токенов."""
+        # Один round trip: только нужные колонки пользователя (покрывающий
+        # индекс ix_users_email_lower), права роли — из role_permission_cache.
+        # Соединение отдаем в пул ДО bcrypt: проверка пароля не должна его держать.
+        credentials = await self._get_credentials(login_info.email)
+        await release_connection(self.db)
+
+        if credentials is None or not await verify_password_async(
+            login_info.password, credentials.hashed_password
         ):
             raise HTTPException(status_code=401, detail="Incorrect email or password")
 
-        # Формируем Payload
-        payload = self._create_payload(user)
+        # Деактивированный (мягко удаленный) пользователь не получает новых токенов.
+        # Сообщение то же, что и при неверном пароле.
+        if not credentials.is_active:
+            raise HTTPException(status_code=401, detail="Incorrect email or password")
+
+        user_id, email, role_id = str(credentials.id), credentials.email, credentials.role_id
+        payload = {"sub": user_id, "email": email, **await self._role_claims(role_id)}
+
+        # Поколение токенов пользователя: bump_user_generation отзовет их все разом
+        payload["gen"] = await get_user_generation(payload["sub"])
 
         # Генерируем ПАРУ токенов
-        # В Refresh токен кладем только sub (ID), чтобы он был легче,
+        # В Refresh токен кладем только sub (ID) и gen, чтобы он был легче,
         # так как права мы всё равно перечитаем из БД при обновлении.
-        refresh_payload = {"sub": str(user.id)}
+        refresh_payload = {"sub": payload["sub"], "gen": payload["gen"]}
 
         return TokenPair(
             access_token=create_access_token(payload),
@@ -97,7 +142,20 @@ class AuthService:
 
         if ttl > 0:
             # Блокируем токен в Redis ровно на то время, пока он еще валиден
-            await add_token_to_blacklist(jti, ttl)
+            await add_token_to_blacklist(jti, ttl, exp=exp)
+
+    async def logout_all_sessions(self, payload: dict):
+        """
+        Выход со всех устройств: одной записью в Redis (INCR поколения)
+        отзывает все access и refresh токены пользователя.
+        """
+        user_id = payload.get("sub")
+        if user_id:
+            await bump_user_generation(user_id)
+
+    async def _get_user(self, user_id: str):
+        result = await self.db.execute(select(User).where(User.id == user_id))
+        return result.scalar_one_or_none()
 
     async def refresh_access_token(self, refresh_token: str) -> TokenPair:
         """Обновление токенов по Refresh Token."""
@@ -118,31 +176,38 @@ class AuthService:
                 detail="Invalid token type. Expected 'refresh'.",
             )
 
-        if await is_token_blacklisted(jti):
+        # 3. Token Rotation: атомарно проверяем и "сжигаем" СТАРЫЙ refresh token
+        # (SET NX EX). Это защищает от кражи и от гонки двух одновременных
+        # refresh с одним токеном — успешным будет только один.
+        # Параллельно (это независимые ресурсы) читаем пользователя из БД:
+        # Важно: Мы идем в БД, чтобы получить АКТУАЛЬНУЮ роль пользователя.
+        # Права роли берутся из role_permission_cache, который сбрасывается
+        # при изменении роли — новый Access Token будет уже с новыми правами.
+        now = datetime.now(timezone.utc).timestamp()
+        ttl = int(exp - now)
+        consumed, user, current_generation = await asyncio.gather(
+            consume_token_once(jti, ttl, exp=exp),
+            self._get_user(user_id),
+            get_user_generation(user_id),
+            return_exceptions=True,
+        )
+        # Дожидаемся всех операций и только потом пробрасываем ошибки,
+        # чтобы запрос к БД не остался висеть на закрываемой сессии.
+        for outcome in (consumed, user, current_generation):
+            if isinstance(outcome, BaseException):
+                raise outcome
+
+        # Refresh токен, выпущенный до logout-all/деактивации/смены пароля
+        token_generation = payload.get("gen")
+        if token_generation is not None and token_generation < current_generation:
+            consumed = False
+
+        if not consumed:
             raise HTTPException(
                 status_code=status.HTTP_401_UNAUTHORIZED,
                 detail="Token has been revoked",
             )
 
-        # 3. Token Rotation (Блокируем СТАРЫЙ refresh token)
-        # Это защищает от кражи: если токен украли и использовали,
-        # настоящий пользователь не сможет обновиться и поймет это (или наоборот).
-        now = datetime.now(timezone.utc).timestamp()
-        ttl = int(exp - now)
-        if ttl > 0:
-            await add_token_to_blacklist(jti, ttl)
-
-        # 4. Получаем актуального пользователя из БД
-        # Важно: Мы идем в БД, чтобы получить АКТУАЛЬНЫЕ права.
-        # Если роль изменили 5 минут назад, новый Access Token будет уже с новой ролью.
-        stmt = (
-            select(User)
-            .options(selectinload(User.role).selectinload(Role.access_list))
-            .where(User.id == user_id)
-        )
-        result = await self.db.execute(stmt)
-        user = result.scalar_one_or_none()
-
         if not user:
             raise HTTPException(
                 status_code=status.HTTP_401_UNAUTHORIZED,
@@ -150,9 +215,12 @@ class AuthService:
                 headers={"WWW-Authenticate": "Bearer"},
             )
 
-        # 5. Выдаем НОВУЮ пару
-        new_payload = self._create_payload(user)
-        new_refresh_payload = {"sub": str(user.id)}
+        # 4. Выдаем НОВУЮ пару (подпись токенов — уже без соединения с БД)
+        new_payload = self._create_payload(
+            user, await self._role_claims(getattr(user, "role_id", None))
+        )
+        new_payload["gen"] = current_generation
+        new_refresh_payload = {"sub": new_payload["sub"], "gen": current_generation}
 
         return TokenPair(
             access_token=create_access_token(new_payload),
@@ -1,10 +1,20 @@
-from typing import List
+from collections import defaultdict
+from typing import Dict, Iterable, List, Optional, Set, Tuple
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select
+from sqlalchemy import delete, func, select
 from sqlalchemy.orm import selectinload
 from sqlalchemy.dialects.postgresql import insert
 from fastapi import HTTPException
-from user_service.models import Role, RoleAccess
+from user_service.models import Role, RoleAccess, RoleParent, RoleEffectivePermissions
+from user_service.role_cache import role_permission_cache, build_role_fragment, merge_inherited
+from user_service.user_cache import user_cache
+from user_service.database import read_session
+from user_service.pagination import keyset_page
+from common.resource_patterns import normalize_pattern
+
+# Ключ pg_advisory_xact_lock: пересчеты эффективных прав (в т.ч. одновременный
+# старт нескольких воркеров) выполняются по одному
+MATERIALIZE_LOCK_ID = 0x726F6C65
 
 class RBACService:
     def __init__(self, db: AsyncSession):
@@ -14,26 +24,41 @@ class RBACService:
         self, 
         name: str, 
         can_read_all: bool = False, 
-        can_write_all: bool = False
+        can_write_all: bool = False,
+        parents: Optional[List[str]] = None,
     ) -> Role:
         stmt = select(Role).where(Role.name == name)
         result = await self.db.execute(stmt)
         if result.scalars().first():
             raise HTTPException(status_code=400, detail=f"Role '{name}' already exists")
 
+        # Повтор родителя в списке дал бы две одинаковые строки role_parents
+        parent_roles = [
+            await self.get_role_by_name(parent, fresh=True) for parent in dict.fromkeys(parents or [])
+        ]
+
         new_role = Role(
             name=name, 
             can_read_all=can_read_all, 
             can_write_all=can_write_all
         )
         self.db.add(new_role)
-        await self.db.commit()
+        await self.db.flush()
+        for parent in parent_roles:
+            self.db.add(RoleParent(role_id=new_role.id, parent_id=parent.id))
+        # Версия в Redis могла остаться от роли с тем же id — начинаем с новой
+        await self._materialize([new_role.id])
         await self.db.refresh(new_role)
         return new_role
 
-    async def get_role_by_name(self, name: str) -> Role:
+    async def get_role_by_name(self, name: str, fresh: bool = False) -> Role:
+        """
+        Роль с правами. Читается с реплики, если она есть и в запросе еще не
+        было записи; fresh=True — из primary (роль будет изменяться).
+        """
+        db = self.db if fresh else await read_session(self.db)
         stmt = select(Role).where(Role.name == name).options(selectinload(Role.access_list))
-        result = await self.db.execute(stmt)
+        result = await db.execute(stmt)
         role = result.scalars().first()
         
         if not role:
@@ -48,8 +73,14 @@ class RBACService:
         can_write: bool = False, 
         can_delete: bool = False
     ) -> Role:
+        # resource — имя ("orders", "farms.sensors") или шаблон ("farms.*", "farms.**")
+        try:
+            resource = normalize_pattern(resource)
+        except ValueError as exc:
+            raise HTTPException(status_code=400, detail=str(exc))
+
         # 1. Get role ID
-        role = await self.get_role_by_name(role_name)
+        role = await self.get_role_by_name(role_name, fresh=True)
 
         # 2. Perform UPSERT
         insert_stmt = insert(RoleAccess).values(
@@ -70,7 +101,7 @@ class RBACService:
         )
 
         await self.db.execute(do_update_stmt)
-        await self.db.commit()
+        await self._materialize([role.id])
 
         # FIX: Explicitly refresh the role to force reload the access_list relationship
         # This ensures the UPSERTED rows are visible in the returned object
@@ -78,11 +109,181 @@ class RBACService:
         return role
 
     async def get_all_roles(self) -> List[Role]:
+        db = await read_session(self.db)
         stmt = select(Role).options(selectinload(Role.access_list))
-        result = await self.db.execute(stmt)
+        result = await db.execute(stmt)
         return result.scalars().all()
 
+    async def get_roles_page(
+        self, limit: int, cursor: Optional[str] = None
+    ) -> Tuple[List[Role], Optional[str]]:
+        """Страница ролей по имени (keyset, см. pagination.py) и курсор следующей."""
+        db = await read_session(self.db)
+        stmt = select(Role).options(selectinload(Role.access_list))
+        return await keyset_page(db, stmt, [Role.name], limit, cursor)
+
     async def delete_role(self, role_name: str):
-        role = await self.get_role_by_name(role_name)
+        role = await self.get_role_by_name(role_name, fresh=True)
+        role_id = role.id
+        children = (await self.db.execute(
+            select(RoleParent.role_id).where(RoleParent.parent_id == role_id)
+        )).scalars().all()
+        # Явно, без расчета на ON DELETE CASCADE (в SQLite он выключен по умолчанию)
+        await self.db.execute(delete(RoleParent).where(
+            (RoleParent.role_id == role_id) | (RoleParent.parent_id == role_id)
+        ))
+        await self.db.execute(delete(RoleEffectivePermissions).where(
+            RoleEffectivePermissions.role_id == role_id
+        ))
         await self.db.delete(role)
-        await self.db.commit()
\ No newline at end of file
+        # Потомки теряют унаследованные от удаленной роли права
+        await self._materialize(children)
+        await role_permission_cache.invalidate(self.db, role_id, deleted=True)
+        # role_id пользователей удаленной роли в кэше больше не актуален
+        user_cache.clear()
+
+    # --- Наследование ролей ---
+
+    async def add_parent(self, role_name: str, parent_name: str) -> Role:
+        role = await self.get_role_by_name(role_name, fresh=True)
+        parent = await self.get_role_by_name(parent_name, fresh=True)
+        _, children = await self._load_graph()
+        if parent.id in self._descendants(children, [role.id]):
+            raise HTTPException(
+                status_code=400,
+                detail=f"Role '{parent_name}' inherits from '{role_name}': cycles are not allowed",
+            )
+        exists = await self.db.execute(select(RoleParent).where(
+            RoleParent.role_id == role.id, RoleParent.parent_id == parent.id
+        ))
+        if exists.scalar_one_or_none() is None:
+            self.db.add(RoleParent(role_id=role.id, parent_id=parent.id))
+            await self._materialize([role.id])
+        return role
+
+    async def remove_parent(self, role_name: str, parent_name: str) -> Role:
+        role = await self.get_role_by_name(role_name, fresh=True)
+        parent = await self.get_role_by_name(parent_name, fresh=True)
+        result = await self.db.execute(delete(RoleParent).where(
+            RoleParent.role_id == role.id, RoleParent.parent_id == parent.id
+        ))
+        if result.rowcount == 0:
+            raise HTTPException(
+                status_code=404, detail=f"Role '{role_name}' does not inherit from '{parent_name}'"
+            )
+        await self._materialize([role.id])
+        return role
+
+    async def get_parent_names(self, role_name: str) -> List[str]:
+        role = await self.get_role_by_name(role_name)
+        db = await read_session(self.db)
+        stmt = (
+            select(Role.name)
+            .join(RoleParent, RoleParent.parent_id == Role.id)
+            .where(RoleParent.role_id == role.id)
+            .order_by(Role.name)
+        )
+        return list((await db.execute(stmt)).scalars().all())
+
+    async def materialize_missing(self):
+        """
+        При старте сервиса: материализует только роли без строки в
+        role_effective_permissions (созданные в обход RBACService). Остальные
+        роли не пересчитываются, и кэши их прав во всех воркерах остаются целы.
+        """
+        stmt = (
+            select(Role.id)
+            .outerjoin(RoleEffectivePermissions, RoleEffectivePermissions.role_id == Role.id)
+            .where(RoleEffectivePermissions.role_id.is_(None))
+        )
+        missing = (await self.db.execute(stmt)).scalars().all()
+        if missing:
+            await self._materialize(missing)
+        else:
+            await self.db.commit()
+
+    async def _lock_materialization(self):
+        # До commit в _materialize; в SQLite писатель и так один
+        if self.db.get_bind().dialect.name == "postgresql":
+            await self.db.execute(select(func.pg_advisory_xact_lock(MATERIALIZE_LOCK_ID)))
+
+    async def _load_graph(self):
+        edges = (await self.db.execute(select(RoleParent.role_id, RoleParent.parent_id))).all()
+        parents: Dict[str, List[str]] = defaultdict(list)
+        children: Dict[str, List[str]] = defaultdict(list)
+        for role_id, parent_id in edges:
+            parents[role_id].append(parent_id)
+            children[parent_id].append(role_id)
+        return parents, children
+
+    @staticmethod
+    def _descendants(children: Dict[str, List[str]], role_ids: Iterable[str]) -> Set[str]:
+        """Сами роли и все роли, которые (транзитивно) от них наследуют."""
+        found: Set[str] = set()
+        stack = list(role_ids)
+        while stack:
+            role_id = stack.pop()
+            if role_id not in found:
+                found.add(role_id)
+                stack.extend(children[role_id])
+        return found
+
+    async def _materialize(self, role_ids: Iterable[str]):
+        """
+        Инкрементальный пересчет: эффективные права ролей role_ids и их потомков.
+        Права остальных ролей берутся уже материализованными. Делает commit и
+        сбрасывает кэш прав только тех ролей, чьи права действительно
+        изменились (новые токены — с новыми правами).
+        """
+        await self.db.flush()
+        await self._lock_materialization()
+        parents, children = await self._load_graph()
+        affected = self._descendants(children, role_ids)
+
+        outside = {p for role_id in affected for p in parents[role_id]} - affected
+        stored = dict((await self.db.execute(
+            select(RoleEffectivePermissions.role_id, RoleEffectivePermissions.fragment)
+            .where(RoleEffectivePermissions.role_id.in_(outside))
+        )).all()) if outside else {}
+        if outside - stored.keys():
+            # У кого-то из предков нет материализованных прав — считаем все роли
+            all_ids = (await self.db.execute(select(Role.id))).scalars().all()
+            affected, stored = set(all_ids), {}
+
+        roles = {}
+        if affected:
+            result = await self.db.execute(
+                select(Role)
+                .options(selectinload(Role.access_list))
+                .where(Role.id.in_(affected))
+                .execution_options(populate_existing=True)
+            )
+            roles = {role.id: role for role in result.scalars().all()}
+
+        effective: Dict[str, dict] = dict(stored)
+
+        def compute(role_id: str) -> dict:
+            # Граф ацикличен (проверяется в add_parent), глубина — высота иерархии
+            if role_id not in effective:
+                inherited = [
+                    compute(parent_id)
+                    for parent_id in parents[role_id]
+                    if parent_id in roles or parent_id in effective
+                ]
+                effective[role_id] = merge_inherited(build_role_fragment(roles[role_id]), inherited)
+            return effective[role_id]
+
+        previous = dict((await self.db.execute(
+            select(RoleEffectivePermissions.role_id, RoleEffectivePermissions.fragment)
+            .where(RoleEffectivePermissions.role_id.in_(roles))
+        )).all()) if roles else {}
+        changed = [role_id for role_id in roles if compute(role_id) != previous.get(role_id)]
+        if changed:
+            await self.db.execute(delete(RoleEffectivePermissions).where(
+                RoleEffectivePermissions.role_id.in_(changed)
+            ))
+            for role_id in changed:
+                self.db.add(RoleEffectivePermissions(role_id=role_id, fragment=effective[role_id]))
+        await self.db.commit()
+        for role_id in changed:
+            await role_permission_cache.invalidate(self.db, role_id)
\ No newline at end of file
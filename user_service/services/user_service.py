@@ -2,9 +2,14 @@ from sqlalchemy import update, select
 import re
 from fastapi import HTTPException, status
 from user_service.models import User, Role
-from user_service.schemas import UserRegister, UserUpdate
+from user_service.schemas import UserRegister, UserUpdate, Page, CountMode
+from user_service.pagination import keyset_page, estimated_count, exact_count
 from sqlalchemy.ext.asyncio import AsyncSession
-from user_service.security import hash_password
+from sqlalchemy.exc import IntegrityError
+from user_service.database import note_write, read_session, release_connection
+from user_service.security import ensure_hashing_capacity, hash_password_async
+from common.redis_config import bump_user_generation
+from user_service.user_cache import load_user, user_cache
 from typing import Optional
 
 
@@ -12,11 +17,16 @@ class UserService:
     def __init__(self, db: AsyncSession):
         self.db = db
 
-    async def get_user_by_id(self, user_id: str) -> User:
-        """Получить пользователя по ID."""
-        stmt = select(User).where(User.id == user_id)
-        result = await self.db.execute(stmt)
-        user = result.scalar_one_or_none()
+    async def get_user_by_id(self, user_id: str, fresh: bool = False) -> User:
+        """
+        Получить пользователя по ID.
+        Без запроса к БД, если пользователь уже загружен в этом запросе
+        (например, get_current_user) или есть в user_cache.
+        Читается с реплики, если она есть, в запросе еще не было записи и
+        пользователь недавно не изменялся в этом процессе; fresh=True — перечитать из primary (перед изменением).
+        """
+        db = self.db if fresh else await read_session(self.db, user_id)
+        user = await load_user(db, user_id, fresh=fresh)
 
         if not user:
             raise HTTPException(
@@ -24,6 +34,24 @@ class UserService:
             )
         return user
 
+    async def get_all_users(
+        self, limit: int = 100, cursor: Optional[str] = None, count: CountMode = "none"
+    ) -> Page:
+        """
+        Страница пользователей (read-only, с реплики): keyset по первичному
+        ключу вместо OFFSET, курсор следующей страницы — в next_cursor.
+        """
+        db = await read_session(self.db)
+        users, next_cursor = await keyset_page(db, select(User), [User.id], limit, cursor)
+        total, is_estimate = None, False
+        if count == "estimate":
+            total, is_estimate = await estimated_count(db, User)
+        elif count == "exact":
+            total = await exact_count(db, User)
+        return Page(
+            items=users, next_cursor=next_cursor, total=total, total_is_estimate=is_estimate
+        )
+
     async def get_user_by_email(self, email: str) -> Optional[User]:
         """Получить пользователя по Email (для вну  тренних проверок)."""
         stmt = select(User).where(User.email == email)
@@ -34,15 +62,13 @@ class UserService:
         query = update(User).where(User.id == user_id).values(is_active=False)
         await self.db.execute(query)
         await self.db.commit()
+        user_cache.invalidate(user_id)
+        note_write(self.db, user_id)
+        # Деактивация отзывает все выданные токены пользователя
+        await bump_user_generation(user_id)
 
     async def create_user(self, new_user: UserRegister):
-        email_exists = await self.db.execute(
-            select(User).filter(User.email == new_user.email)
-        )
-        if email_exists.scalars().first():
-            raise HTTPException(status_code=400, detail="Email already registered")
-
-        # password validation
+        # password validation (без БД, поэтому первой)
         password = new_user.password
         if (
             len(password) < 8
@@ -55,21 +81,46 @@ class UserService:
                 status_code=400,
                 detail="Password must be at least 8 characters long and include uppercase, lowercase, digit, and special character.",
             )
+
+        email_exists = await self.db.execute(
+            select(User).filter(User.email == new_user.email)
+        )
+        if email_exists.scalars().first():
+            raise HTTPException(status_code=400, detail="Email already registered")
+
+        # Возвращаем соединение в пул на время bcrypt
+        await release_connection(self.db)
+        hashed_password = await hash_password_async(new_user.password)
+
         create_user_model = User(
             email=new_user.email,
-            hashed_password=hash_password(new_user.password),
+            hashed_password=hashed_password,
             first_name=new_user.first_name,
             last_name=new_user.last_name,
             middle_name=new_user.middle_name,
         )
         self.db.add(create_user_model)
-        await self.db.commit()
+        try:
+            await self.db.commit()
+        except IntegrityError:
+            # Email заняли, пока мы считали хэш
+            await self.db.rollback()
+            raise HTTPException(status_code=400, detail="Email already registered")
         await self.db.refresh(create_user_model)
         return create_user_model
 
     async def update_user(self, user_id: str, user_update: UserUpdate) -> User:
         """Обновление профиля пользователя."""
-        user = await self.get_user_by_id(user_id)
+        # bcrypt считаем до загрузки пользователя и без занятого соединения.
+        # 429 при занятом пуле — только если есть что хэшировать: правка
+        # имени/email/is_active bcrypt не использует
+        new_password_hash = None
+        if user_update.password is not None:
+            ensure_hashing_capacity()
+            await release_connection(self.db)
+            new_password_hash = await hash_password_async(user_update.password)
+
+        user = await self.get_user_by_id(user_id, fresh=True)
     
         # Обновление Email с проверкой на уникальность
         if user_update.email is not None:
@@ -79,8 +130,8 @@ class UserService:
             user.email = user_update.email
     
         # Обновление пароля
-        if user_update.password is not None:
-            user.hashed_password = hash_password(user_update.password)
+        if new_password_hash is not None:
+            user.hashed_password = new_password_hash
     
         # Обновление личных данных
         if user_update.first_name is not None:
@@ -93,11 +144,18 @@ class UserService:
             user.middle_name = user_update.middle_name
     
         # Обновление статуса активности
+        deactivated = user_update.is_active is False and user.is_active
         if user_update.is_active is not None:
             user.is_active = user_update.is_active
     
         await self.db.commit()
         await self.db.refresh(user)
+        user_cache.invalidate(user.id)
+        note_write(self.db, user.id)
+
+        # Смена пароля или деактивация отзывают все выданные токены
+        if new_password_hash is not None or deactivated:
+            await bump_user_generation(user.id)
         return user
 
     async def assign_role_to_user(self, user_id: str, role_name: str) -> User:
@@ -106,7 +164,7 @@ class UserService:
         Пример: assign_role_to_user("123", "manager")
         """
         # 1. Ищем пользователя
-        user = await self.get_user_by_id(user_id)
+        user = await self.get_user_by_id(user_id, fresh=True)
 
         # 2. Ищем роль
         stmt_role = select(Role).where(Role.name == role_name)
@@ -124,4 +182,6 @@ class UserService:
 
         await self.db.commit()
         await self.db.refresh(user)  # Обновит объект, подтянув данные роли
+        user_cache.invalidate(user.id)
+        note_write(self.db, user.id)
         return user
@@ -1,11 +1,15 @@
 import pytest
 import pytest_asyncio
 import os
+from unittest.mock import patch
+import fakeredis.aioredis
 
 # Set environment variables before app imports to prevent configuration errors
 os.environ["SECRET_KEY"] = "test-secret-key-123"
 os.environ["ALGORITHM"] = "HS256"
 os.environ["REDIS_HOST"] = "localhost"
+os.environ.setdefault("PASSWORD_HASH_WORKERS", "2")
+os.environ.setdefault("PASSWORD_HASH_QUEUE_TIMEOUT", "30")
 
 from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncSession
 from httpx import AsyncClient, ASGITransport
@@ -14,7 +18,11 @@ from user_service.database import Base, get_db
 from user_service.services.auth_service import AuthService
 from user_service.services.rbac_service import RBACService
 from user_service.services.user_service import UserService
-from common.redis_config import redis_client
+from common.redis_config import redis_client, revocation_filter, role_table, resource_dictionary
+from user_service.password_hasher import password_hasher
+from user_service.role_cache import role_permission_cache
+from common.access_rules import decision_cache
+from user_service.user_cache import user_cache
 
 # SQLite in-memory is used for speed and isolation during tests
 TEST_DATABASE_URL = "sqlite+aiosqlite:///:memory:"
@@ -41,6 +49,31 @@ async def cleanup_resources():
     # Dispose of the SQLAlchemy engine using the local global variable
     await engine_test.dispose()
 
+    # Stop bcrypt worker processes
+    password_hasher.shutdown()
+
+@pytest.fixture(autouse=True)
+def fake_redis():
+    """
+    No test should talk to a real Redis: blacklist, token generations and
+    other shared state go to an in-memory FakeRedis instead.
+    """
+    fake = fakeredis.aioredis.FakeRedis(decode_responses=True)
+    revocation_filter.generations.clear()
+    role_permission_cache.clear()
+    role_table.clear()
+    resource_dictionary.clear()
+    decision_cache.clear()
+    user_cache.clear()
+    with patch("common.redis_config.redis_client", fake):
+        yield fake
+    revocation_filter.generations.clear()
+    role_permission_cache.clear()
+    role_table.clear()
+    resource_dictionary.clear()
+    decision_cache.clear()
+    user_cache.clear()
+
 @pytest_asyncio.fixture(scope="function")
 async def db_session():
     """Provides a fresh, clean database session for every individual test."""
@@ -119,4 +119,42 @@ async def test_rbac_restriction_api(client):
     
     response = await client.get("/admin/roles/")
     # Should return 403 Forbidden because CheckAccess("roles", "read") will fail
-    assert response.status_code == status.HTTP_403_FORBIDDEN
\ No newline at end of file
+    assert response.status_code == status.HTTP_403_FORBIDDEN
+
+@pytest.mark.asyncio
+async def test_role_parents_api(client, rbac_service):
+    """POST/GET/DELETE /admin/roles/{role_name}/parents."""
+    await rbac_service.create_role("staff")
+    await rbac_service.create_role("manager")
+
+    response = await client.post("/admin/roles/manager/parents", json={"parent": "staff"})
+    assert response.status_code == status.HTTP_200_OK
+    assert (await client.get("/admin/roles/manager/parents")).json() == ["staff"]
+
+    # Цикл staff -> manager -> staff
+    response = await client.post("/admin/roles/staff/parents", json={"parent": "manager"})
+    assert response.status_code == status.HTTP_400_BAD_REQUEST
+
+    response = await client.delete("/admin/roles/manager/parents/staff")
+    assert response.status_code == status.HTTP_200_OK
+    response = await client.delete("/admin/roles/manager/parents/staff")
+    assert response.status_code == status.HTTP_404_NOT_FOUND
+
+@pytest.mark.asyncio
+async def test_get_roles_keyset_pages(client, rbac_service):
+    """GET /admin/roles/?limit=: тот же список, курсор — в X-Next-Cursor."""
+    for name in ("alpha", "beta", "gamma"):
+        await rbac_service.create_role(name)
+
+    names, cursor = [], None
+    while True:
+        params = {"limit": 2}
+        if cursor:
+            params["cursor"] = cursor
+        response = await client.get("/admin/roles/", params=params)
+        assert response.status_code == status.HTTP_200_OK
+        names += [role["name"] for role in response.json()]
+        cursor = response.headers.get("x-next-cursor")
+        if cursor is None:
+            break
+    assert names == ["alpha", "beta", "gamma"]
@@ -96,4 +96,200 @@ async def test_refresh_tokens_api(client, user_service, auth_service):
     assert response.status_code == status.HTTP_200_OK
     data = response.json()
     assert "access_token" in data
-    assert "refresh_token" in data
\ No newline at end of file
+    assert "refresh_token" in data
+
+
+@pytest.mark.asyncio
+async def test_logout_all_revokes_every_token(client):
+    """POST /auth/logout-all: старые access и refresh токены перестают работать."""
+    await client.post("/auth/register", json=VALID_USER_DATA)
+    login_payload = {"email": VALID_USER_DATA["email"], "password": VALID_USER_DATA["password"]}
+    first = (await client.post("/auth/token", json=login_payload)).json()
+    second = (await client.post("/auth/token", json=login_payload)).json()
+
+    headers = {"Authorization": f"Bearer {first['access_token']}"}
+    response = await client.post("/auth/logout-all", headers=headers)
+    assert response.status_code == status.HTTP_200_OK, response.text
+
+    # Оба ранее выданных access токена отозваны
+    for pair in (first, second):
+        headers = {"Authorization": f"Bearer {pair['access_token']}"}
+        response = await client.post("/auth/logout", headers=headers)
+        assert response.status_code == status.HTTP_401_UNAUTHORIZED
+
+    # Как и refresh токен
+    response = await client.post("/auth/refresh", json={"refresh_token": second["refresh_token"]})
+    assert response.status_code == status.HTTP_401_UNAUTHORIZED
+
+    # Новый логин снова работает
+    fresh = (await client.post("/auth/token", json=login_payload)).json()
+    headers = {"Authorization": f"Bearer {fresh['access_token']}"}
+    response = await client.post("/auth/logout", headers=headers)
+    assert response.status_code == status.HTTP_200_OK
+
+
+@pytest.mark.asyncio
+async def test_role_ref_token_sees_permission_changes(client, rbac_service, user_service):
+    """TOKEN_PERMISSION_MODE=role_ref: в токене только rid/rv, права меняются сразу."""
+    import jwt
+
+    await rbac_service.create_role("viewer")
+    response = await client.post("/auth/register", json=VALID_USER_DATA)
+    await user_service.assign_role_to_user(response.json()["id"], "viewer")
+
+    with patch("common.role_table.TOKEN_PERMISSION_MODE", "role_ref"):
+        login_payload = {"email": VALID_USER_DATA["email"], "password": VALID_USER_DATA["password"]}
+        tokens = (await client.post("/auth/token", json=login_payload)).json()
+
+    claims = jwt.decode(tokens["access_token"], options={"verify_signature": False})
+    assert claims["role"] == "viewer" and "rid" in claims and "rv" in claims
+    assert "access" not in claims and "g_perms" not in claims
+
+    headers = {"Authorization": f"Bearer {tokens['access_token']}"}
+    response = await client.get("/admin/roles/", headers=headers)
+    assert response.status_code == status.HTTP_403_FORBIDDEN
+
+    # Тот же токен — новые права роли действуют без перевыпуска
+    await rbac_service.set_role_access("viewer", "roles", can_read=True)
+    response = await client.get("/admin/roles/", headers=headers)
+    assert response.status_code == status.HTTP_200_OK
+
+
+@pytest.mark.asyncio
+async def test_compact_token_is_understood_by_check_access(client, rbac_service, user_service):
+    """TOKEN_PERMISSION_MODE=compact: права масками по словарю ресурсов."""
+    import jwt
+
+    await rbac_service.create_role("viewer")
+    await rbac_service.set_role_access("viewer", "roles", can_read=True)
+    response = await client.post("/auth/register", json=VALID_USER_DATA)
+    await user_service.assign_role_to_user(response.json()["id"], "viewer")
+
+    with patch("common.role_table.TOKEN_PERMISSION_MODE", "compact"), \
+            patch("user_service.security.TOKEN_JTI_FORMAT", "short"):
+        login_payload = {"email": VALID_USER_DATA["email"], "password": VALID_USER_DATA["password"]}
+        tokens = (await client.post("/auth/token", json=login_payload)).json()
+
+    claims = jwt.decode(tokens["access_token"], options={"verify_signature": False})
+    assert claims["role"] == "viewer" and {"gp", "pm", "pd"} <= set(claims)
+    assert "access" not in claims and "g_perms" not in claims
+    assert len(claims["jti"]) == 22
+
+    headers = {"Authorization": f"Bearer {tokens['access_token']}"}
+    response = await client.get("/admin/roles/", headers=headers)
+    assert response.status_code == status.HTTP_200_OK
+    response = await client.post("/admin/roles/", json={"name": "x"}, headers=headers)
+    assert response.status_code == status.HTTP_403_FORBIDDEN
+
+    # Короткий jti отзывается так же, как UUID
+    await client.post("/auth/logout", headers=headers)
+    response = await client.get("/admin/roles/", headers=headers)
+    assert response.status_code == status.HTTP_401_UNAUTHORIZED
+
+
+@pytest.mark.asyncio
+async def test_verify_endpoint_for_gateway(client):
+    """GET /auth/verify (Traefik forwardAuth): 200 + подписанные identity-заголовки."""
+    from fastapi import FastAPI, Depends
+    from httpx import AsyncClient, ASGITransport
+    from common.gateway import get_gateway_payload, IDENTITY_HEADERS
+    from common.security import CheckAccess, get_token_payload
+
+    await client.post("/auth/register", json=VALID_USER_DATA)
+    login_payload = {"email": VALID_USER_DATA["email"], "password": VALID_USER_DATA["password"]}
+    tokens = (await client.post("/auth/token", json=login_payload)).json()
+    headers = {"Authorization": f"Bearer {tokens['access_token']}"}
+
+    # Refresh токен — не identity для бэкендов
+    response = await client.get(
+        "/auth/verify", headers={"Authorization": f"Bearer {tokens['refresh_token']}"}
+    )
+    assert response.status_code == status.HTTP_401_UNAUTHORIZED
+    assert "x-user-id" not in response.headers
+
+    response = await client.get("/auth/verify", headers=headers)
+    assert response.status_code == status.HTTP_200_OK
+    assert response.content == b""
+    assert response.headers["x-role"] == "guest"
+    assert "private" in response.headers["cache-control"]
+    forwarded = {name: response.headers[name] for name in IDENTITY_HEADERS}
+
+    # Бэкенд за шлюзом: без JWT, по заголовкам, которые передал Traefik
+    backend = FastAPI()
+    backend.dependency_overrides[get_token_payload] = get_gateway_payload
+
+    @backend.get("/orders", dependencies=[Depends(CheckAccess("orders", "read"))])
+    async def orders(payload: dict = Depends(get_gateway_payload)):
+        return {"user": payload["sub"]}
+
+    async with AsyncClient(transport=ASGITransport(app=backend), base_url="http://backend") as backend_client:
+        response = await backend_client.get("/orders", headers=forwarded)
+        assert response.status_code == status.HTTP_403_FORBIDDEN
+
+        forged = {**forwarded, "X-Perms": "eyJhY2Nlc3MiOnt9LCJnX3Blcm1zIjp7InJfYWxsIjp0cnVlfX0"}
+        response = await backend_client.get("/orders", headers=forged)
+        assert response.status_code == status.HTTP_401_UNAUTHORIZED
+        response = await backend_client.get("/orders")
+        assert response.status_code == status.HTTP_401_UNAUTHORIZED
+
+    # Отозванный токен шлюз не пропускает
+    await client.post("/auth/logout", headers=headers)
+    response = await client.get("/auth/verify", headers=headers)
+    assert response.status_code == status.HTTP_401_UNAUTHORIZED
+
+
+@pytest.mark.asyncio
+async def test_verify_encodes_non_latin_role_names(client, rbac_service, user_service):
+    """Имя роли вне latin-1 не ломает /auth/verify и восстанавливается бэкендом."""
+    from unittest.mock import MagicMock
+    from common.gateway import get_gateway_payload, IDENTITY_HEADERS
+
+    await rbac_service.create_role("менеджер")
+    await rbac_service.set_role_access("менеджер", "orders", can_read=True)
+    await client.post("/auth/register", json=VALID_USER_DATA)
+    user = await user_service.get_user_by_email(VALID_USER_DATA["email"])
+    await user_service.assign_role_to_user(user.id, "менеджер")
+    login_payload = {"email": VALID_USER_DATA["email"], "password": VALID_USER_DATA["password"]}
+    tokens = (await client.post("/auth/token", json=login_payload)).json()
+
+    response = await client.get("/auth/verify", headers={"Authorization": f"Bearer {tokens['access_token']}"})
+    assert response.status_code == status.HTTP_200_OK
+    assert response.headers["x-role"].isascii()
+
+    request = MagicMock()
+    request.headers = {name: response.headers[name] for name in IDENTITY_HEADERS}
+    payload = await get_gateway_payload(request)
+    assert payload["role"] == "менеджер"
+    assert payload["access"]["orders"]["r"] == 1
+
+
+@pytest.mark.asyncio
+async def test_introspect_batch_of_tokens(client, rbac_service, user_service):
+    """POST /auth/introspect: active + claims для каждого токена в порядке запроса."""
+    await rbac_service.create_role("introspector")
+    await rbac_service.set_role_access("introspector", "tokens", can_read=True)
+    caller = {**VALID_USER_DATA, "email": "service@example.com"}
+    response = await client.post("/auth/register", json=caller)
+    await user_service.assign_role_to_user(response.json()["id"], "introspector")
+    login = {"email": caller["email"], "password": caller["password"]}
+    caller_headers = {"Authorization": f"Bearer {(await client.post('/auth/token', json=login)).json()['access_token']}"}
+
+    await client.post("/auth/register", json=VALID_USER_DATA)
+    login = {"email": VALID_USER_DATA["email"], "password": VALID_USER_DATA["password"]}
+    live = (await client.post("/auth/token", json=login)).json()
+    revoked = (await client.post("/auth/token", json=login)).json()
+    await client.post("/auth/logout", headers={"Authorization": f"Bearer {revoked['access_token']}"})
+
+    tokens = [live["access_token"], "not-a-jwt", revoked["access_token"], live["refresh_token"]]
+    response = await client.post("/auth/introspect", json={"tokens": tokens}, headers=caller_headers)
+    assert response.status_code == status.HTTP_200_OK, response.text
+    results = response.json()["results"]
+    assert [result["active"] for result in results] == [True, False, False, True]
+    assert results[0]["sub"] == results[3]["sub"] and results[0]["type"] == "access"
+    assert results[1] == {"active": False}
+
+    # Без права tokens:read — 403
+    response = await client.post(
+        "/auth/introspect", json={"tokens": tokens}, headers={"Authorization": f"Bearer {live['access_token']}"}
+    )
+    assert response.status_code == status.HTTP_403_FORBIDDEN
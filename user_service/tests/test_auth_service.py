@@ -41,7 +41,7 @@ async def test_create_payload_logic(auth_service):
     assert payload["role"] == "operator"
 
 @pytest.mark.asyncio
-@patch("user_service.services.auth_service.verify_password")
+@patch("user_service.services.auth_service.verify_password_async", new_callable=AsyncMock)
 @patch("user_service.services.auth_service.create_access_token")
 @patch("user_service.services.auth_service.create_refresh_token")
 async def test_login_user_success(
@@ -53,10 +53,10 @@ async def test_login_user_success(
     mock_access.return_value = "fake_access"
     mock_refresh.return_value = "fake_refresh"
     
-    # Имитируем поведение БД
-    user = MockUser(id=1, email="test@test.com", hashed_password="hash")
+    # Имитируем поведение БД: login читает только колонки пользователя
+    row = MagicMock(id=1, email="test@test.com", hashed_password="hash", is_active=True, role_id=None)
     mock_result = MagicMock()
-    mock_result.scalar_one_or_none.return_value = user
+    mock_result.first.return_value = row
     
     with patch.object(db_session, 'execute', return_value=mock_result):
         login_info = UserLogin(email="test@test.com", password="password123")
@@ -67,15 +67,13 @@ async def test_login_user_success(
 
 @pytest.mark.asyncio
 @patch("user_service.services.auth_service.decode_access_token")
-@patch("user_service.services.auth_service.is_token_blacklisted", new_callable=AsyncMock)
-@patch("user_service.services.auth_service.add_token_to_blacklist", new_callable=AsyncMock)
+@patch("user_service.services.auth_service.consume_token_once", new_callable=AsyncMock)
 @patch("user_service.services.auth_service.create_access_token")
 @patch("user_service.services.auth_service.create_refresh_token")
 async def test_refresh_token_success(
     mock_create_refresh, 
     mock_create_access, 
-    mock_add_blacklist, 
-    mock_is_blacklisted, 
+    mock_consume, 
     mock_decode, 
     auth_service, 
     db_session
@@ -85,7 +83,7 @@ async def test_refresh_token_success(
     mock_decode.return_value = {
         "sub": "1", "jti": "old_jti", "type": "refresh", "exp": now + 300
     }
-    mock_is_blacklisted.return_value = False
+    mock_consume.return_value = True
     mock_create_access.return_value = "new_access"
     mock_create_refresh.return_value = "new_refresh"
     
@@ -97,8 +95,127 @@ async def test_refresh_token_success(
         result = await auth_service.refresh_access_token("old_refresh")
         assert result.access_token == "new_access"
         
-        # Verify Token Rotation: The old token MUST be blacklisted
-        mock_add_blacklist.assert_called_once()
-        # Verify we blacklist the correct JTI
-        args, _ = mock_add_blacklist.call_args
-        assert args[0] == "old_jti"
\ No newline at end of file
+        # Verify Token Rotation: The old token MUST be consumed atomically
+        mock_consume.assert_awaited_once()
+        # Verify we consume the correct JTI
+        args, _ = mock_consume.call_args
+        assert args[0] == "old_jti"
+
+@pytest.mark.asyncio
+@patch("user_service.services.auth_service.decode_access_token")
+@patch("user_service.services.auth_service.consume_token_once", new_callable=AsyncMock)
+async def test_refresh_token_reuse_rejected(mock_consume, mock_decode, auth_service, db_session):
+    """Повторное использование (уже израсходованного) refresh токена -> 401."""
+    now = datetime.now(timezone.utc).timestamp()
+    mock_decode.return_value = {
+        "sub": "1", "jti": "used_jti", "type": "refresh", "exp": now + 300
+    }
+    mock_consume.return_value = False
+
+    mock_result = MagicMock()
+    mock_result.scalar_one_or_none.return_value = MockUser(id=1, email="t@t.com", hashed_password="...")
+    with patch.object(db_session, 'execute', return_value=mock_result):
+        with pytest.raises(HTTPException) as exc:
+            await auth_service.refresh_access_token("used_refresh")
+    assert exc.value.status_code == 401
+    assert "revoked" in exc.value.detail
+
+
+@pytest.mark.asyncio
+async def test_login_releases_connection_before_password_check(tmp_path):
+    """
+    Пул из одного соединения + 5 параллельных логинов с "медленным" bcrypt:
+    пока идет проверка пароля, ни одно соединение не должно быть занято.
+    """
+    import asyncio
+    from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncSession
+    from sqlalchemy.pool import AsyncAdaptedQueuePool
+    from user_service.database import Base
+    from user_service.models import User
+    from user_service.services.auth_service import AuthService
+
+    engine = create_async_engine(
+        f"sqlite+aiosqlite:///{tmp_path / 'pool.db'}",
+        poolclass=AsyncAdaptedQueuePool,
+        pool_size=1,
+        max_overflow=0,
+        pool_timeout=1,
+    )
+    Session = async_sessionmaker(bind=engine, class_=AsyncSession, expire_on_commit=False)
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+    async with Session() as session:
+        session.add(User(email="pool@test.com", hashed_password="hash"))
+        await session.commit()
+
+    occupancy = []
+
+    async def slow_verify(plain, hashed):
+        occupancy.append(engine.pool.checkedout())
+        await asyncio.sleep(0.2)
+        return True
+
+    async def do_login():
+        async with Session() as session:
+            return await AuthService(session).login_user(
+                UserLogin(email="pool@test.com", password="password123")
+            )
+
+    try:
+        with patch("user_service.services.auth_service.verify_password_async", side_effect=slow_verify):
+            results = await asyncio.gather(*(do_login() for _ in range(5)))
+    finally:
+        await engine.dispose()
+
+    assert all(isinstance(r, TokenPair) for r in results)
+    assert len(occupancy) == 5
+    assert max(occupancy) == 0
+
+
+@pytest.mark.asyncio
+async def test_login_loads_only_user_row(auth_service, db_session):
+    """Повторный логин: одна строка пользователя, права роли — из кэша."""
+    from sqlalchemy import event
+    from user_service.models import User, Role, RoleAccess
+
+    role = Role(name="cached")
+    db_session.add(role)
+    await db_session.flush()
+    db_session.add(RoleAccess(role_id=role.id, resource="farms", can_read=True))
+    db_session.add(User(email="cache@test.com", hashed_password="hash", role_id=role.id))
+    await db_session.commit()
+
+    statements = []
+
+    def count(conn, cursor, statement, *args):
+        if statement.lstrip().upper().startswith("SELECT"):
+            statements.append(statement)
+
+    login_info = UserLogin(email="cache@test.com", password="password123")
+    sync_engine = db_session.bind.sync_engine
+    with patch("user_service.services.auth_service.verify_password_async", AsyncMock(return_value=True)):
+        await auth_service.login_user(login_info)  # прогрев кэша роли
+        event.listen(sync_engine, "before_cursor_execute", count)
+        try:
+            await auth_service.login_user(login_info)
+        finally:
+            event.remove(sync_engine, "before_cursor_execute", count)
+
+    assert len(statements) == 1
+
+
+@pytest.mark.asyncio
+async def test_login_email_case_insensitive_and_inactive_rejected(auth_service, db_session):
+    from user_service.models import User
+
+    db_session.add(User(email="Mixed@Test.com", hashed_password="hash"))
+    db_session.add(User(email="gone@test.com", hashed_password="hash", is_active=False))
+    await db_session.commit()
+
+    with patch("user_service.services.auth_service.verify_password_async", AsyncMock(return_value=True)):
+        tokens = await auth_service.login_user(UserLogin(email="mixed@test.com", password="password123"))
+        assert isinstance(tokens, TokenPair)
+
+        with pytest.raises(HTTPException) as exc:
+            await auth_service.login_user(UserLogin(email="gone@test.com", password="password123"))
+    assert exc.value.status_code == 401
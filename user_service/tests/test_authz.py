@@ -0,0 +1,50 @@
+import pytest
+from fastapi import status
+from user_service.main import app
+from user_service.database import get_db
+from common.security import get_token_payload
+
+PAYLOAD = {
+    "sub": "service-user",
+    "g_perms": {"r_all": False, "w_all": False},
+    "access": {"orders": {"r": 1, "w": 1, "d": 0}},
+}
+
+
+@pytest.fixture(autouse=True)
+def override_security():
+    async def mock_payload():
+        return PAYLOAD
+
+    async def no_db():
+        raise AssertionError("authz check must not touch the database")
+        yield
+
+    app.dependency_overrides[get_token_payload] = mock_payload
+    app.dependency_overrides[get_db] = no_db
+    yield
+    app.dependency_overrides.pop(get_token_payload, None)
+    app.dependency_overrides.pop(get_db, None)
+
+
+@pytest.mark.asyncio
+async def test_batch_check_returns_decision_per_item(client):
+    checks = [{"resource": "orders", "action": action} for action in ("read", "write", "delete")] * 200
+    checks.append({"resource": "users", "action": "read"})
+
+    response = await client.post("/authz/check", json={"checks": checks})
+
+    assert response.status_code == status.HTTP_200_OK
+    data = response.json()
+    assert data["sub"] == "service-user"
+    assert data["decisions"] == [True, True, False] * 200 + [False]
+
+
+@pytest.mark.asyncio
+async def test_batch_check_validates_input(client):
+    response = await client.post("/authz/check", json={"checks": [{"resource": "orders", "action": "execute"}]})
+    assert response.status_code == 422
+
+    too_many = [{"resource": "orders", "action": "read"}] * 1001
+    response = await client.post("/authz/check", json={"checks": too_many})
+    assert response.status_code == 422
@@ -0,0 +1,183 @@
+import pytest
+import pytest_asyncio
+from unittest.mock import patch
+from sqlalchemy import text
+from starlette.requests import Request
+from starlette.routing import Route
+from common.metrics import metrics
+from user_service.database import LazySession, get_db
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncSession
+
+
+@pytest_asyncio.fixture
+async def session_factory(tmp_path):
+    """Отдельный engine: соединения закрываются в том же event loop, что и тест."""
+    engine = create_async_engine(f"sqlite+aiosqlite:///{tmp_path / 'lazy.db'}")
+    factory = async_sessionmaker(bind=engine, class_=AsyncSession, expire_on_commit=False)
+    with patch("user_service.database.AsyncSessionLocal", factory):
+        yield factory
+    await engine.dispose()
+
+
+def make_request(path: str) -> Request:
+    route = Route(path, endpoint=lambda request: None)
+    return Request({"type": "http", "method": "POST", "path": path, "headers": [], "route": route})
+
+
+async def run_route(path: str, handler) -> None:
+    dependency = get_db(make_request(path))
+    db = await dependency.__anext__()
+    await handler(db)
+    with pytest.raises(StopAsyncIteration):
+        await dependency.__anext__()
+
+
+@pytest.mark.asyncio
+async def test_lazy_session_is_created_on_first_use(session_factory):
+    db = LazySession()
+    assert not db.started and not db.used_connection
+    await db.close()
+
+    db = LazySession()
+    await db.execute(text("SELECT 1"))
+    assert db.started and db.used_connection
+    await db.close()
+
+
+@pytest.mark.asyncio
+async def test_get_db_counts_database_usage_per_route(session_factory):
+    async def no_db(db):
+        pass
+
+    async def query(db):
+        await db.execute(text("SELECT 1"))
+
+    def count(route, usage):
+        return metrics.get("db_requests_total", labels={"route": route, "db": usage})
+
+    before_none = count("/test/no-db", "none")
+    before_used = count("/test/query", "used")
+    await run_route("/test/no-db", no_db)
+    await run_route("/test/query", query)
+    assert count("/test/no-db", "none") == before_none + 1
+    assert count("/test/query", "used") == before_used + 1
+
+
+def test_pool_profiles_and_overrides(monkeypatch):
+    from user_service.db_pool import engine_options, pool_settings
+
+    assert pool_settings("large")["pool_size"] == 30
+    monkeypatch.setenv("DB_POOL_SIZE", "7")
+    monkeypatch.setenv("DB_POOL_PRE_PING", "false")
+    settings = pool_settings("small")
+    assert settings["pool_size"] == 7 and settings["pool_pre_ping"] is False
+    with pytest.raises(ValueError):
+        pool_settings("huge")
+
+    # Кэш выражений — параметр диалекта asyncpg; для PgBouncer выключен совсем
+    options = engine_options("postgresql+asyncpg://u:p@db:5432/app", profile="pgbouncer")
+    assert options["url"].query["prepared_statement_cache_size"] == "0"
+    assert options["connect_args"] == {"statement_cache_size": 0}
+    options = engine_options("sqlite+aiosqlite:///x.db", profile="default")
+    assert "connect_args" not in options and not options["url"].query
+
+
+@pytest.mark.asyncio
+async def test_pool_warm_up_and_telemetry(tmp_path):
+    from user_service.db_pool import engine_options, warm_up_pool
+
+    options = engine_options(f"sqlite+aiosqlite:///{tmp_path / 'pool.db'}", profile="small", name="test")
+    engine = create_async_engine(**{**options, "pool_size": 3, "max_overflow": 1})
+    labels = {"pool": "test"}
+    try:
+        assert await warm_up_pool(engine) == 3
+        pool = engine.sync_engine.pool
+        assert pool.checkedin() == 3 and pool.checkedout() == 0
+
+        waits_before = metrics.snapshot()["summaries"]["db_pool_checkout_wait_seconds{pool=\"test\"}"]["count"]
+        conns = [await engine.connect() for _ in range(4)]
+        for conn in conns:
+            await conn.execute(text("SELECT 1"))
+        assert metrics.get("db_pool_in_use", labels=labels) == 4
+        assert metrics.get("db_pool_overflow", labels=labels) == 1
+        for conn in conns:
+            await conn.close()
+        assert metrics.get("db_pool_in_use", labels=labels) == 0
+        waits = metrics.snapshot()["summaries"]["db_pool_checkout_wait_seconds{pool=\"test\"}"]["count"]
+        assert waits == waits_before + 4
+    finally:
+        await engine.dispose()
+
+
+@pytest.mark.asyncio
+async def test_reads_are_routed_to_replica_with_lag_fallback_and_read_your_writes(tmp_path):
+    """Две SQLite-базы: primary и "реплика" с отличающимися данными."""
+    from user_service.database import Base
+    from user_service.models import Role, User
+    from user_service.replica import ReplicaRouter
+    from user_service.schemas import UserUpdate
+    from user_service.services.rbac_service import RBACService
+    from user_service.services.user_service import UserService
+    from user_service.user_cache import user_cache
+
+    factories, engines = {}, []
+    for name in ("primary", "replica"):
+        engine = create_async_engine(f"sqlite+aiosqlite:///{tmp_path / name}.db")
+        engines.append(engine)
+        factories[name] = async_sessionmaker(bind=engine, class_=AsyncSession, expire_on_commit=False)
+        async with engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+        async with factories[name]() as db:
+            db.add(User(id="u1", email=f"{name}@test.com", hashed_password="hash"))
+            db.add(Role(name=f"{name}-role"))
+            await db.commit()
+
+    lag = {"seconds": 0.0}
+
+    async def probe(conn):
+        if lag["seconds"] is None:
+            raise OSError("replica is down")
+        return lag["seconds"]
+
+    router = ReplicaRouter(engines[1], lag_probe=probe, max_lag=1.0, check_interval=0)
+
+    def session():
+        return LazySession(factories["primary"], factories["replica"], router)
+
+    try:
+        db = session()
+        assert (await UserService(db).get_user_by_id("u1")).email == "replica@test.com"
+        assert [role.name for role in await RBACService(db).get_all_roles()] == ["replica-role"]
+        # Запись идет в primary, даже если до нее читали с реплики
+        assert (await RBACService(db).get_role_by_name("primary-role", fresh=True)).name == "primary-role"
+        await db.close()
+
+        # Реплика отстает или недоступна — читаем из primary
+        for lag["seconds"] in (5.0, None):
+            db = session()
+            assert (await UserService(db).get_user_by_id("u1")).email == "primary@test.com"
+            await db.close()
+
+        # Read-your-writes: после записи в сессии чтения остаются на primary
+        lag["seconds"] = 0.0
+        db = session()
+        await UserService(db).update_user("u1", UserUpdate(first_name="Renamed"))
+        user = await UserService(db).get_user_by_id("u1")
+        assert user.email == "primary@test.com" and user.first_name == "Renamed"
+        await db.close()
+
+        # ...и в следующих запросах этого процесса, пока реплика может отставать
+        db = session()
+        assert (await UserService(db).get_user_by_id("u1")).first_name == "Renamed"
+        await db.close()
+        router.reset()
+
+        # Строки с реплики не попадают в межзапросный кэш пользователей
+        with patch.object(user_cache, "ttl", 60):
+            db = session()
+            assert (await UserService(db).get_user_by_id("u1")).email == "replica@test.com"
+            await db.close()
+            assert user_cache.get("u1") is None
+    finally:
+        for engine in engines:
+            await engine.dispose()
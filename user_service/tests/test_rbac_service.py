@@ -102,4 +102,145 @@ async def test_get_all_roles(rbac_service):
     await rbac_service.create_role("role2")
     
     roles = await rbac_service.get_all_roles()
-    assert len(roles) >= 2
\ No newline at end of file
+    assert len(roles) >= 2
+
+@pytest.mark.asyncio
+async def test_role_change_invalidates_permission_cache(rbac_service, auth_service, db_session):
+    """После set_role_access новый токен получает уже обновленные права."""
+    from user_service.role_cache import role_permission_cache
+
+    role = await rbac_service.create_role("cached_role")
+    fragment = await role_permission_cache.get_fragment(db_session, role.id)
+    assert fragment["access"] == {}
+
+    await rbac_service.set_role_access("cached_role", "farms", can_read=True)
+    fragment = await role_permission_cache.get_fragment(db_session, role.id)
+    assert fragment["access"] == {"farms": {"r": 1, "w": 0, "d": 0}}
+
+
+@pytest.mark.asyncio
+async def test_role_fragment_shared_through_redis(rbac_service, db_session):
+    """Второй воркер (свой локальный кэш) берет фрагмент из Redis, не из БД."""
+    from unittest.mock import patch
+    from user_service.role_cache import RolePermissionCache
+
+    role = await rbac_service.create_role("shared_role", can_read_all=True)
+    await RolePermissionCache().get_fragment(db_session, role.id)
+
+    other_worker = RolePermissionCache()
+    with patch.object(db_session, "execute", side_effect=AssertionError("DB must not be queried")):
+        fragment = await other_worker.get_fragment(db_session, role.id)
+    assert fragment["role"] == "shared_role"
+    assert fragment["g_perms"] == {"r_all": True, "w_all": False}
+
+
+@pytest.mark.asyncio
+async def test_set_role_access_accepts_patterns(rbac_service):
+    await rbac_service.create_role("farmer")
+    role = await rbac_service.set_role_access("farmer", "farms:*", can_read=True)
+    assert [access.resource for access in role.access_list] == ["farms.*"]
+
+    with pytest.raises(HTTPException) as exc:
+        await rbac_service.set_role_access("farmer", "farms.**.sensors", can_read=True)
+    assert exc.value.status_code == 400
+
+
+@pytest.mark.asyncio
+async def test_role_inheritance_is_materialized(rbac_service, db_session):
+    from user_service.role_cache import role_permission_cache
+
+    await rbac_service.create_role("base")
+    await rbac_service.set_role_access("base", "farms", can_read=True)
+    await rbac_service.create_role("middle", parents=["base"])
+    await rbac_service.set_role_access("middle", "sensors", can_read=True, can_write=True)
+    leaf = await rbac_service.create_role("leaf", parents=["middle"])
+    # Собственное правило роли важнее унаследованного
+    await rbac_service.set_role_access("leaf", "sensors", can_read=True)
+
+    fragment = await role_permission_cache.get_fragment(db_session, leaf.id)
+    assert fragment["access"] == {
+        "farms": {"r": 1, "w": 0, "d": 0},
+        "sensors": {"r": 1, "w": 0, "d": 0},
+    }
+
+    # Изменение базовой роли доходит до всех потомков
+    await rbac_service.set_role_access("base", "orders", can_read=True)
+    fragment = await role_permission_cache.get_fragment(db_session, leaf.id)
+    assert fragment["access"]["orders"] == {"r": 1, "w": 0, "d": 0}
+
+    await rbac_service.remove_parent("middle", "base")
+    fragment = await role_permission_cache.get_fragment(db_session, leaf.id)
+    assert set(fragment["access"]) == {"sensors"}
+    assert await rbac_service.get_parent_names("leaf") == ["middle"]
+
+
+@pytest.mark.asyncio
+async def test_create_role_ignores_duplicate_parents(rbac_service):
+    await rbac_service.create_role("staff")
+    await rbac_service.create_role("manager", parents=["staff", "staff"])
+    assert await rbac_service.get_parent_names("manager") == ["staff"]
+
+
+@pytest.mark.asyncio
+async def test_role_inheritance_recomputes_only_descendants(rbac_service):
+    from unittest.mock import AsyncMock, patch
+
+    await rbac_service.create_role("base")
+    await rbac_service.create_role("child", parents=["base"])
+    await rbac_service.create_role("unrelated")
+
+    with patch("user_service.services.rbac_service.role_permission_cache.invalidate", new_callable=AsyncMock) as invalidate:
+        await rbac_service.set_role_access("base", "farms", can_read=True)
+    touched = {call.args[1] for call in invalidate.await_args_list}
+    base = await rbac_service.get_role_by_name("base")
+    child = await rbac_service.get_role_by_name("child")
+    assert touched == {base.id, child.id}
+
+
+@pytest.mark.asyncio
+async def test_startup_materializes_only_missing_roles(rbac_service, db_session, fake_redis):
+    from unittest.mock import AsyncMock, patch
+    from sqlalchemy import delete
+    from user_service.models import RoleEffectivePermissions
+    from user_service.role_cache import role_permission_cache
+    from common.role_table import ROLE_TABLE_KEY
+
+    await rbac_service.create_role("base", can_read_all=True)
+    child = await rbac_service.create_role("child", parents=["base"])
+    base = await rbac_service.get_role_by_name("base")
+
+    # Повторный старт: все роли уже материализованы — кэши не сбрасываются
+    with patch("user_service.services.rbac_service.role_permission_cache.invalidate", new_callable=AsyncMock) as invalidate:
+        await rbac_service.materialize_missing()
+    invalidate.assert_not_awaited()
+
+    # Роль без материализованных прав пересчитывается, ее потомок не изменился
+    await db_session.execute(delete(RoleEffectivePermissions).where(RoleEffectivePermissions.role_id == base.id))
+    await db_session.commit()
+    with patch("user_service.services.rbac_service.role_permission_cache.invalidate", new_callable=AsyncMock) as invalidate:
+        await rbac_service.materialize_missing()
+    assert [call.args[1] for call in invalidate.await_args_list] == [base.id]
+
+    # role_table: публикуются только отсутствующие роли
+    await fake_redis.hdel(ROLE_TABLE_KEY, child.id)
+    assert await role_permission_cache.publish_missing(db_session) == 1
+    assert await fake_redis.hexists(ROLE_TABLE_KEY, child.id)
+    assert await role_permission_cache.publish_missing(db_session) == 0
+
+
+@pytest.mark.asyncio
+async def test_role_inheritance_rejects_cycles_and_survives_parent_deletion(rbac_service, db_session):
+    from user_service.role_cache import role_permission_cache
+
+    await rbac_service.create_role("a", can_read_all=True)
+    await rbac_service.create_role("b", parents=["a"])
+    with pytest.raises(HTTPException) as exc:
+        await rbac_service.add_parent("a", "b")
+    assert exc.value.status_code == 400
+    with pytest.raises(HTTPException):
+        await rbac_service.add_parent("a", "a")
+
+    b = await rbac_service.get_role_by_name("b")
+    assert (await role_permission_cache.get_fragment(db_session, b.id))["g_perms"]["r_all"] is True
+    await rbac_service.delete_role("a")
+    assert (await role_permission_cache.get_fragment(db_session, b.id))["g_perms"]["r_all"] is False
@@ -4,6 +4,8 @@ from fastapi import HTTPException
 from user_service.security import (
     hash_password, 
     verify_password, 
+    hash_password_async,
+    verify_password_async,
     create_access_token, 
     create_refresh_token, 
     decode_access_token
@@ -69,4 +71,126 @@ def test_decode_expired_token():
 def test_decode_invalid_token():
     with pytest.raises(HTTPException) as exc:
         decode_access_token("not-a-real-token-at-all")
-    assert exc.value.status_code == 401
\ No newline at end of file
+    assert exc.value.status_code == 401
+
+## --- Async (process pool) hashing ---
+
+@pytest.mark.asyncio
+async def test_async_password_hashing_roundtrip():
+    hashed = await hash_password_async("secure_password123")
+
+    assert hashed != "secure_password123"
+    assert await verify_password_async("secure_password123", hashed) is True
+    assert await verify_password_async("wrong_password", hashed) is False
+    # Хэши совместимы с синхронной версией
+    assert verify_password("secure_password123", hashed) is True
+
+@pytest.mark.asyncio
+async def test_async_hashing_does_not_block_event_loop():
+    """Пока bcrypt считается в пуле, event loop продолжает обслуживать другие корутины."""
+    import asyncio
+
+    ticks = 0
+
+    async def ticker():
+        nonlocal ticks
+        while True:
+            ticks += 1
+            await asyncio.sleep(0.005)
+
+    # Прогреваем пул, чтобы не мерить старт процессов
+    await hash_password_async("warmup")
+
+    task = asyncio.create_task(ticker())
+    try:
+        await asyncio.gather(*(hash_password_async(f"pwd-{i}") for i in range(4)))
+    finally:
+        task.cancel()
+
+    assert ticks > 5
+
+@pytest.mark.asyncio
+async def test_password_hasher_metrics():
+    from common.metrics import metrics
+
+    before = metrics.get("password_hash_total", {"op": "verify"})
+    hashed = await hash_password_async("metric_password")
+    await verify_password_async("metric_password", hashed)
+
+    assert metrics.get("password_hash_total", {"op": "verify"}) == before + 1
+    assert metrics.get("password_hash_in_flight") == 0
+
+
+## --- Admission control ---
+
+@pytest.mark.asyncio
+async def test_admission_gate_rejects_when_queue_full():
+    import asyncio
+    from user_service.password_hasher import AdmissionGate, HashingOverloadedError
+
+    gate = AdmissionGate(limit=1, max_queue=1, timeout=1)
+    await gate.acquire()                          # занимает единственный слот
+    waiter = asyncio.create_task(gate.acquire())  # встает в очередь
+    await asyncio.sleep(0)
+
+    with pytest.raises(HashingOverloadedError) as exc:
+        await gate.acquire()
+    assert exc.value.reason == "queue_full"
+    assert exc.value.retry_after >= 1
+
+    gate.release(0.1)
+    await waiter
+    gate.release(0.1)
+
+@pytest.mark.asyncio
+async def test_admission_gate_rejects_after_deadline():
+    from user_service.password_hasher import AdmissionGate, HashingOverloadedError
+
+    gate = AdmissionGate(limit=1, max_queue=5, timeout=0.05)
+    await gate.acquire()
+
+    with pytest.raises(HashingOverloadedError) as exc:
+        await gate.acquire()
+    assert exc.value.reason == "timeout"
+    assert gate.waiting == 0
+
+    gate.release(0.1)
+
+@pytest.mark.asyncio
+async def test_hashing_overload_returns_429_with_retry_after(client):
+    from unittest.mock import patch
+    from user_service.password_hasher import password_hasher
+
+    with patch.object(password_hasher.gate, "is_saturated", return_value=True):
+        response = await client.post(
+            "/auth/token", json={"email": "a@b.com", "password": "whatever"}
+        )
+
+    assert response.status_code == 429
+    assert int(response.headers["Retry-After"]) >= 1
+
+
+@pytest.mark.asyncio
+async def test_profile_update_without_password_is_not_shed(client, user_service):
+    from unittest.mock import patch
+    from user_service.main import app
+    from user_service.dependencies import get_current_user, get_token_payload
+    from user_service.password_hasher import password_hasher
+    from user_service.schemas import UserRegister
+
+    user = await user_service.create_user(UserRegister(
+        email="shed@example.com", password="SafePassword123!", password_confirm="SafePassword123!",
+        first_name="A", last_name="B", middle_name="C",
+    ))
+    app.dependency_overrides[get_token_payload] = lambda: {"sub": user.id}
+    app.dependency_overrides[get_current_user] = lambda: user
+    try:
+        with patch.object(password_hasher.gate, "is_saturated", return_value=True):
+            renamed = await client.put("/user/me", json={"first_name": "Renamed"})
+            repassword = await client.put("/user/me", json={"password": "OtherPassword123!"})
+    finally:
+        app.dependency_overrides.clear()
+
+    assert renamed.status_code == 200
+    assert renamed.json()["first_name"] == "Renamed"
+    assert repassword.status_code == 429
@@ -111,4 +111,47 @@ async def test_admin_rbac_denial_api(client):
         response = await client.get("/user/")
         assert response.status_code == status.HTTP_403_FORBIDDEN
     finally:
-        app.dependency_overrides.clear()
\ No newline at end of file
+        app.dependency_overrides.clear()
+
+
+@pytest.mark.asyncio
+async def test_admin_list_users_keyset_pagination(client, db_session):
+    """GET /user/: страницы по курсору, без пропусков и повторов; total по запросу."""
+    from user_service.models import User
+
+    for i in range(5):
+        db_session.add(User(id=f"user-{i}", email=f"page{i}@example.com", hashed_password="hash"))
+    await db_session.commit()
+    admin_payload = {
+        "sub": "admin-id",
+        "access": {"users": {"r": 1, "w": 0, "d": 0}},
+        "g_perms": {"r_all": False, "w_all": False}
+    }
+    app.dependency_overrides[get_token_payload] = lambda: admin_payload
+
+    try:
+        seen, cursor = [], None
+        while True:
+            params = {"limit": 2, "count": "exact"}
+            if cursor:
+                params["cursor"] = cursor
+            response = await client.get("/user/", params=params)
+            assert response.status_code == status.HTTP_200_OK, response.text
+            page = response.json()
+            assert page["total"] == 5 and page["total_is_estimate"] is False
+            seen += [user["id"] for user in page["items"]]
+            cursor = page["next_cursor"]
+            if cursor is None:
+                break
+        assert seen == [f"user-{i}" for i in range(5)]
+
+        # Курсор другого ключа или с чужими типами значений — тоже 400, не 500
+        for bad in ("not-a-cursor", "W3siYSI6MX1d", "WzFd", "W3RydWVd"):
+            response = await client.get("/user/", params={"cursor": bad})
+            assert response.status_code == status.HTTP_400_BAD_REQUEST, bad
+
+        # На SQLite оценки нет — total точный и так и помечен
+        page = (await client.get("/user/", params={"count": "estimate"})).json()
+        assert page["total"] == 5 and page["total_is_estimate"] is False
+    finally:
+        app.dependency_overrides.clear()
@@ -129,4 +129,93 @@ async def test_assign_role_integration(user_service, rbac_service, db_session):
     updated_user = await user_service.assign_role_to_user(user.id, role_name)
     
     await db_session.refresh(updated_user, ["role"])
-    assert updated_user.role.name == role_name
\ No newline at end of file
+    assert updated_user.role.name == role_name
+
+
+@pytest.mark.asyncio
+async def test_deactivation_and_password_change_bump_token_generation(user_service, fake_redis):
+    """Деактивация и смена пароля отзывают все токены пользователя."""
+    from common.redis_config import get_user_generation
+
+    user = await user_service.create_user(UserRegister(**VALID_USER_PAYLOAD))
+    assert await get_user_generation(user.id) == 0
+
+    await user_service.update_user(user.id, UserUpdate(password="NewSecret456!"))
+    assert await get_user_generation(user.id) == 1
+
+    # Изменение профиля без пароля и статуса поколение не трогает
+    await user_service.update_user(user.id, UserUpdate(first_name="Changed"))
+    assert await get_user_generation(user.id) == 1
+
+    await user_service.soft_delete_user(user.id)
+    assert await get_user_generation(user.id) == 2
+
+@pytest.mark.asyncio
+async def test_user_is_loaded_once_per_request_and_cached_across_requests(tmp_path):
+    """
+    get_current_user и get_user_by_id в одной сессии — один SELECT;
+    с включенным user_cache следующая сессия обходится без БД,
+    а update_user сбрасывает запись.
+    """
+    from unittest.mock import patch
+    from sqlalchemy import event
+    from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncSession
+    from user_service.database import Base
+    from user_service.dependencies import get_current_user
+    from user_service.models import User
+    from user_service.services.user_service import UserService
+    from user_service.user_cache import user_cache
+
+    # Файловая БД: каждая новая сессия (как каждый запрос) берет свое соединение
+    engine = create_async_engine(f"sqlite+aiosqlite:///{tmp_path / 'users.db'}")
+    Session = async_sessionmaker(bind=engine, class_=AsyncSession, expire_on_commit=False)
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+    async with Session() as db:
+        user = User(email="cache@test.com", hashed_password="hash")
+        db.add(user)
+        await db.commit()
+
+    statements = []
+
+    def count(conn, cursor, statement, *args):
+        if statement.lstrip().upper().startswith("SELECT"):
+            statements.append(statement)
+
+    event.listen(engine.sync_engine, "before_cursor_execute", count)
+    try:
+        with patch.object(user_cache, "ttl", 60):
+            async with Session() as db:
+                current = await get_current_user(db, {"sub": user.id})
+                assert (await UserService(db).get_user_by_id(current.id)) is current
+            assert len(statements) == 1
+
+            async with Session() as db:
+                await get_current_user(db, {"sub": user.id})
+                assert (await UserService(db).get_user_by_id(user.id)).email == "cache@test.com"
+            assert len(statements) == 1
+
+            async with Session() as db:
+                await UserService(db).update_user(user.id, UserUpdate(first_name="Renamed"))
+            async with Session() as db:
+                assert (await UserService(db).get_user_by_id(user.id)).first_name == "Renamed"
+    finally:
+        event.remove(engine.sync_engine, "before_cursor_execute", count)
+        await engine.dispose()
+
+
+def test_user_cache_skips_row_read_before_invalidation():
+    """SELECT, начатый до update_user, не кладет в кэш старую строку."""
+    from user_service.models import User
+    from user_service.user_cache import UserCache
+
+    cache = UserCache(ttl=60)
+    stale = User(id="u1", email="old@test.com", hashed_password="hash")
+
+    version = cache.version  # снимок до SELECT
+    cache.invalidate("u1")  # в это время update_user закоммитил изменение
+    cache.put(stale, version)
+    assert cache.get("u1") is None
+
+    cache.put(stale, cache.version)
+    assert cache.get("u1")["email"] == "old@test.com"
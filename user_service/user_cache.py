@@ -0,0 +1,108 @@
+import os
+import time
+from typing import Dict, Optional, Tuple
+
+from sqlalchemy import inspect
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import make_transient_to_detached
+from sqlalchemy.orm.util import identity_key
+
+from common.metrics import metrics
+from user_service.database import is_replica_session
+from user_service.models import User
+
+# Межзапросный кэш строк users (0 — выключен). Правки через UserService
+# сбрасывают запись сразу, правки в других процессах видны не позже TTL.
+# Устаревший is_active не опасен: деактивация отзывает токены через
+# поколение пользователя (user_gen), которое проверяется на каждом запросе.
+USER_CACHE_TTL = float(os.getenv("USER_CACHE_TTL", 0))
+USER_CACHE_MAX_ENTRIES = int(os.getenv("USER_CACHE_MAX_ENTRIES", 10000))
+
+_COLUMNS = tuple(attr.key for attr in inspect(User).column_attrs)
+
+
+class UserCache:
+    """
+    user_id -> (значения колонок users, момент истечения); FIFO при переполнении.
+    Заполнение после SELECT передает version, снятую до SELECT: если за это
+    время была инвалидация (update_user закоммитил изменение), прочитанная
+    строка могла устареть и в кэш не попадает.
+    """
+
+    def __init__(self, ttl: float = USER_CACHE_TTL, max_entries: int = USER_CACHE_MAX_ENTRIES):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries: Dict[str, Tuple[dict, float]] = {}
+        # Растет при каждой инвалидации/очистке
+        self.version = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.ttl > 0 and self.max_entries > 0
+
+    def get(self, user_id: str) -> Optional[dict]:
+        entry = self._entries.get(user_id)
+        if entry is None:
+            return None
+        if entry[1] <= time.monotonic():
+            self._entries.pop(user_id, None)
+            return None
+        return entry[0]
+
+    def put(self, user: User, version: Optional[int] = None):
+        """version — значение self.version до чтения строки из БД."""
+        if not self.enabled or (version is not None and version != self.version):
+            return
+        self._entries.pop(user.id, None)
+        self._entries[user.id] = (
+            {column: getattr(user, column) for column in _COLUMNS},
+            time.monotonic() + self.ttl,
+        )
+        if len(self._entries) > self.max_entries:
+            del self._entries[next(iter(self._entries))]
+        metrics.set_gauge("user_cache_entries", len(self._entries))
+
+    def invalidate(self, user_id: str):
+        self.version += 1
+        self._entries.pop(user_id, None)
+
+    def clear(self):
+        self.version += 1
+        self._entries.clear()
+
+
+user_cache = UserCache()
+
+
+async def load_user(db: AsyncSession, user_id: str, fresh: bool = False) -> Optional[User]:
+    """
+    Пользователь по id для зависимостей и сервисов одного запроса.
+    1. Identity map сессии: сессия одна на запрос (get_db), поэтому
+       get_current_user и UserService.get_user_by_id делят загруженный объект.
+    2. Кэш user_cache (если включен): объект кладется в identity map без SQL.
+    3. SELECT по первичному ключу. В user_cache попадают только строки из
+       primary: реплика в пределах DB_REPLICA_MAX_LAG может вернуть строку
+       до последнего update_user, и она жила бы в кэше весь USER_CACHE_TTL.
+    fresh=True — всегда перечитать строку из БД (перед изменением пользователя).
+    """
+    if not user_id:
+        return None
+    if fresh:
+        user_cache.invalidate(user_id)
+        return await db.get(User, user_id, populate_existing=True)
+
+    if identity_key(User, user_id) not in db.identity_map:
+        row = user_cache.get(user_id)
+        if row is not None:
+            metrics.inc("user_cache_hits_total")
+            user = User(**row)
+            make_transient_to_detached(user)
+            return await db.merge(user, load=False)
+        if user_cache.enabled:
+            metrics.inc("user_cache_misses_total")
+        version = user_cache.version
+        user = await db.get(User, user_id)
+        if user is not None and not is_replica_session(db):
+            user_cache.put(user, version)
+        return user
+    return await db.get(User, user_id)